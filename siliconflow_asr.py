@@ -0,0 +1,173 @@
+import asyncio
+import io
+import shutil
+import subprocess
+import wave
+
+try:
+    import numpy as np
+except ImportError: # 长音频分段模式需要 NumPy，普通转录不受影响
+    np = None
+
+DEFAULT_SAMPLE_RATE = 16000 # 用 ffmpeg 解码非 WAV 文件时的目标采样率 (语音识别足够)
+DEFAULT_SEGMENT_SECONDS = 60 # 目标分段长度 (秒)
+DEFAULT_SEARCH_SECONDS = 10 # 在目标切点前后多少秒内寻找最安静的位置
+ENERGY_FRAME_MS = 20 # 计算短时能量的帧长 (毫秒)
+ENERGY_SMOOTH_FRAMES = 15 # 能量平滑窗口 (帧)，避免切在词内短暂的停顿上
+
+
+def require_numpy():
+    if np is None:
+        raise RuntimeError("长音频分段模式需要 NumPy，请先运行: pip install numpy")
+
+
+def load_audio_samples(file_path, sample_rate=DEFAULT_SAMPLE_RATE):
+    """把音频解码为单声道 int16 采样，返回 (采样数组, 采样率)。
+
+    WAV 直接用 wave 模块读取 (保留原采样率)；其他格式需要系统中安装 ffmpeg。
+    """
+    require_numpy()
+    try:
+        with wave.open(file_path, "rb") as wav:
+            channels, width, rate = wav.getnchannels(), wav.getsampwidth(), wav.getframerate()
+            raw = wav.readframes(wav.getnframes())
+    except (wave.Error, EOFError):
+        return _decode_with_ffmpeg(file_path, sample_rate), sample_rate
+    if width == 1:
+        samples = (np.frombuffer(raw, dtype=np.uint8).astype(np.int16) - 128) << 8
+    elif width == 2:
+        samples = np.frombuffer(raw, dtype="<i2")
+    elif width == 3: # 24 位：取每个采样的高 16 位
+        samples = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3)[:, 1:].copy().view("<i2").reshape(-1)
+    elif width == 4:
+        samples = (np.frombuffer(raw, dtype="<i4") >> 16).astype(np.int16)
+    else:
+        raise ValueError(f"不支持的 WAV 采样位宽: {width * 8} bit")
+    if channels > 1:
+        samples = samples[:len(samples) // channels * channels].reshape(-1, channels).mean(axis=1).astype(np.int16)
+    return samples, rate
+
+
+def _decode_with_ffmpeg(file_path, sample_rate):
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg:
+        raise RuntimeError("长音频分段模式处理非 WAV 文件需要 ffmpeg，请安装 ffmpeg 或先转换为 WAV")
+    result = subprocess.run([ffmpeg, "-v", "error", "-i", file_path, "-f", "s16le", "-ac", "1", "-ar", str(sample_rate), "-"],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=False)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg 解码失败: {result.stderr.decode('utf-8', 'replace').strip()}")
+    return np.frombuffer(result.stdout, dtype="<i2")
+
+
+def frame_energy(samples, sample_rate, frame_ms=ENERGY_FRAME_MS, smooth_frames=ENERGY_SMOOTH_FRAMES):
+    """向量化计算每帧的平均能量 (再做滑动平均)，返回 (能量数组, 每帧采样数)"""
+    frame_len = max(1, int(sample_rate * frame_ms / 1000))
+    n_frames = len(samples) // frame_len
+    if n_frames == 0:
+        return np.zeros(0, dtype=np.float32), frame_len
+    frames = samples[:n_frames * frame_len].astype(np.float32).reshape(n_frames, frame_len)
+    energy = np.einsum("ij,ij->i", frames, frames) / frame_len
+    if smooth_frames > 1 and n_frames >= smooth_frames:
+        energy = np.convolve(energy, np.ones(smooth_frames, dtype=np.float32) / smooth_frames, mode="same")
+    return energy, frame_len
+
+
+def find_split_points(samples, sample_rate, segment_seconds=DEFAULT_SEGMENT_SECONDS, search_seconds=DEFAULT_SEARCH_SECONDS):
+    """在每个目标切点 ±search_seconds 的范围内选能量最低 (最安静) 的帧作为切点，返回采样偏移列表"""
+    energy, frame_len = frame_energy(samples, sample_rate)
+    frames_per_second = sample_rate / frame_len
+    segment_frames, search_frames = int(segment_seconds * frames_per_second), int(search_seconds * frames_per_second)
+    points, last = [], 0
+    while len(energy) - last > segment_frames + search_frames:
+        target = last + segment_frames
+        lo, hi = max(last + 1, target - search_frames), min(len(energy) - 1, target + search_frames)
+        cut = lo + int(np.argmin(energy[lo:hi + 1]))
+        points.append(cut * frame_len)
+        last = cut
+    return points
+
+
+def split_on_silence(samples, sample_rate, segment_seconds=DEFAULT_SEGMENT_SECONDS, search_seconds=DEFAULT_SEARCH_SECONDS):
+    """返回 [(起始采样, 结束采样)]，相邻段在静音处衔接"""
+    bounds = [0, *find_split_points(samples, sample_rate, segment_seconds, search_seconds), len(samples)]
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+
+def encode_wav(samples, sample_rate):
+    """把单声道 int16 采样编码为 WAV 字节 (上传用)"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1); wav.setsampwidth(2); wav.setframerate(sample_rate)
+        wav.writeframes(np.ascontiguousarray(samples, dtype="<i2").tobytes())
+    return buffer.getvalue()
+
+
+def format_timestamp(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+class LongAudioTranscriber:
+    """在静音处切分长录音，各段在网络引擎上有界并发转录，再按顺序合并并标注时间偏移。
+    瞬时故障由 HTTP 客户端的重试策略处理，这里不再逐段重试；客户端每次重发某段时回调 on_retry(段序号, 第几次重试)"""
+    def __init__(self, http_client, api_url, api_key, model, language, file_path, segment_seconds=DEFAULT_SEGMENT_SECONDS,
+                 max_workers=4, on_progress=None, on_retry=None):
+        self.http_client = http_client
+        self.api_url = api_url
+        self.api_key = api_key
+        self.model = model
+        self.language = language
+        self.file_path = file_path
+        self.segment_seconds = segment_seconds
+        self.max_workers = max(1, int(max_workers))
+        self.on_progress = on_progress
+        self.on_retry = on_retry
+        self.sample_rate = None
+        self.segments = [] # [(起始秒, 结束秒)]
+        self.texts = []
+        self.errors = {}
+
+    async def run(self, engine):
+        """返回失败段的序号列表"""
+        samples, self.sample_rate = await engine.run_blocking(load_audio_samples, self.file_path)
+        bounds = await engine.run_blocking(split_on_silence, samples, self.sample_rate, self.segment_seconds)
+        self.segments = [(start / self.sample_rate, end / self.sample_rate) for start, end in bounds]
+        self.texts = [None] * len(bounds)
+        if self.on_progress:
+            self.on_progress(0, len(bounds), 0)
+        semaphore = asyncio.Semaphore(self.max_workers)
+        async def bounded(index, start, end):
+            async with semaphore:
+                await self._transcribe(engine, index, samples[start:end])
+        await asyncio.gather(*(bounded(i, start, end) for i, (start, end) in enumerate(bounds)))
+        return [i for i, text in enumerate(self.texts) if text is None]
+
+    async def _transcribe(self, engine, index, samples):
+        audio = await engine.run_blocking(encode_wav, samples, self.sample_rate)
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+        data = {"model": self.model, "language": self.language}
+        try:
+            files = {"file": (f"segment_{index + 1:04d}.wav", audio, "audio/wav")}
+            on_retry = (lambda attempt: self.on_retry(index, attempt)) if self.on_retry else None
+            response = await self.http_client.apost(engine, self.api_url, "asr", headers=headers, files=files, data=data, on_retry=on_retry)
+            response.raise_for_status()
+            self.texts[index] = (response.json().get("text") or "").strip()
+            self.errors.pop(index, None)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.errors[index] = str(e)
+        if self.on_progress:
+            self.on_progress(*self.progress())
+
+    def progress(self):
+        """返回 (已完成段数, 总段数, 失败段数)"""
+        return sum(1 for text in self.texts if text is not None), len(self.texts), len(self.errors)
+
+    def merged_text(self):
+        """按顺序合并各段文本，每段前标注起始时间；失败的段标出错误"""
+        lines = []
+        for index, ((start, end), text) in enumerate(zip(self.segments, self.texts)):
+            stamp = f"[{format_timestamp(start)} - {format_timestamp(end)}]"
+            lines.append(f"{stamp} {text}" if text is not None else f"{stamp} (第 {index + 1} 段转录失败: {self.errors.get(index, '未知错误')})")
+        return "\n".join(lines)
@@ -0,0 +1,184 @@
+import asyncio
+import csv
+import hashlib
+import json
+import mmap
+import os
+import threading
+import time
+
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".m4a", ".ogg", ".flac", ".opus", ".aac", ".webm")
+HASH_CHUNK_SIZE = 1024 * 1024 # 计算文件摘要时每次送入 sha256 的字节数
+CSV_FIELDS = ["file", "sha256", "bytes", "status", "text", "error", "model", "language", "elapsed_s", "transcribed_at"]
+
+
+def hash_file(file_path, chunk_size=HASH_CHUNK_SIZE):
+    """用内存映射分块计算文件的 sha256 (不把整个文件读入内存，也不做额外拷贝)"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0: # 空文件无法 mmap
+            return digest.hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                for offset in range(0, len(view), chunk_size):
+                    digest.update(view[offset:offset + chunk_size])
+            finally:
+                view.release()
+    return digest.hexdigest()
+
+
+def find_audio_files(directory, recursive=True):
+    """返回目录中的音频文件 (按路径排序，保证多次运行顺序一致)"""
+    found = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        found.extend(os.path.join(root, name) for name in sorted(files) if name.lower().endswith(AUDIO_EXTENSIONS))
+        if not recursive:
+            break
+    return found
+
+
+def load_completed_hashes(output_path):
+    """读取已有的输出文件，返回已成功转录的文件摘要集合 (用于断点续跑)"""
+    if not os.path.exists(output_path):
+        return set()
+    done = set()
+    with open(output_path, "r", encoding="utf-8-sig", newline="") as f:
+        if output_path.lower().endswith(".csv"):
+            rows = csv.DictReader(f)
+        else:
+            rows = []
+            for line in f:
+                try:
+                    rows.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue # 上次中断时可能留下半行
+        for row in rows:
+            if isinstance(row, dict) and row.get("status") == "ok" and row.get("sha256"):
+                done.add(row["sha256"])
+    return done
+
+
+class FolderTranscriptionRunner:
+    """转录整个目录：按内容摘要去重并跳过已完成的文件，其余文件以有界并发转录，每完成一个就追加写入 JSONL/CSV"""
+    def __init__(self, http_client, api_url, api_key, model, language, directory, output_path,
+                 max_workers=4, recursive=True, on_progress=None):
+        self.http_client = http_client
+        self.api_url = api_url
+        self.api_key = api_key
+        self.model = model
+        self.language = language
+        self.directory = directory
+        self.output_path = output_path
+        self.max_workers = max(1, int(max_workers))
+        self.recursive = recursive
+        self.on_progress = on_progress
+        self.total = 0
+        self.completed = 0
+        self.skipped = 0
+        self.failed = 0
+        self.started_at = None
+        self._cancel_event = threading.Event()
+        self._lock = threading.Lock()
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def files_per_minute(self):
+        if not self.started_at:
+            return 0.0
+        elapsed = time.monotonic() - self.started_at
+        return self.completed / elapsed * 60 if elapsed > 0 else 0.0
+
+    async def run(self, engine):
+        self.started_at = time.monotonic()
+        files = await engine.run_blocking(find_audio_files, self.directory, self.recursive)
+        done_hashes = await engine.run_blocking(load_completed_hashes, self.output_path)
+        self.total = len(files)
+        self._report()
+        semaphore = asyncio.Semaphore(self.max_workers)
+        # 同一内容只转录一次：第一个文件负责请求，其余重复文件等待它的结果
+        in_flight = {}
+        async def bounded(file_path):
+            async with semaphore:
+                if self.cancelled:
+                    return
+                digest, size = await engine.run_blocking(self._fingerprint, file_path)
+            if digest in done_hashes:
+                with self._lock:
+                    self.skipped += 1
+                self._report()
+                return
+            if digest in in_flight:
+                record = dict(await in_flight[digest])
+            else:
+                in_flight[digest] = asyncio.ensure_future(self._transcribe(engine, semaphore, file_path))
+                record = dict(await in_flight[digest])
+            record.update(file=os.path.relpath(file_path, self.directory), sha256=digest, bytes=size)
+            await engine.run_blocking(self._append_record, record)
+            self._report()
+        await asyncio.gather(*(bounded(file_path) for file_path in files))
+        return self.completed, self.skipped, self.failed
+
+    async def _transcribe(self, engine, semaphore, file_path):
+        record = {"model": self.model, "language": self.language}
+        started = time.monotonic()
+        async with semaphore:
+            if self.cancelled:
+                record.update(status="cancelled", error="已停止")
+                return record
+            try:
+                audio_file = await engine.run_blocking(open, file_path, "rb") # 网络共享目录上打开文件也可能阻塞
+                try:
+                    files = {"file": (os.path.basename(file_path), audio_file)}
+                    headers = {"Authorization": f"Bearer {self.api_key}"}
+                    data = {"model": self.model, "language": self.language}
+                    response = await self.http_client.apost(engine, self.api_url, "asr", headers=headers, files=files, data=data)
+                finally:
+                    audio_file.close()
+                response.raise_for_status()
+                record.update(status="ok", text=(response.json().get("text") or "").strip())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                record.update(status="error", error=str(e))
+        record["elapsed_s"] = round(time.monotonic() - started, 3)
+        return record
+
+    @staticmethod
+    def _fingerprint(file_path):
+        """在 I/O 线程中取得内容摘要和文件大小 (两者都要访问文件系统，不在事件循环上执行)"""
+        return hash_file(file_path), os.path.getsize(file_path)
+
+    def _append_record(self, record):
+        record["transcribed_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+        with self._lock:
+            if record["status"] == "ok":
+                self.completed += 1
+            elif record["status"] == "error":
+                self.failed += 1
+            else:
+                return # 停止时未开始的文件不写入，下次运行会重新转录
+            directory = os.path.dirname(os.path.abspath(self.output_path))
+            os.makedirs(directory, exist_ok=True)
+            if self.output_path.lower().endswith(".csv"):
+                new_file = not os.path.exists(self.output_path) or os.path.getsize(self.output_path) == 0
+                with open(self.output_path, "a", encoding="utf-8-sig" if new_file else "utf-8", newline="") as f:
+                    writer = csv.DictWriter(f, fieldnames=CSV_FIELDS, extrasaction="ignore")
+                    if new_file:
+                        writer.writeheader()
+                    writer.writerow(record)
+            else:
+                with open(self.output_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def _report(self):
+        if self.on_progress:
+            with self._lock:
+                counts = (self.completed, self.skipped, self.failed, self.total)
+            self.on_progress(*counts, self.files_per_minute())
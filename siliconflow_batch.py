@@ -0,0 +1,285 @@
+"""无界面批量运行 SiliconFlow 任务 (文生图 / TTS / ASR / 聊天)。
+
+用法:
+    python siliconflow_batch.py jobs.jsonl -o results/ -c 4
+    python siliconflow_suite_gui.py --batch jobs.jsonl -o results/
+
+jobs.jsonl 每行一个任务，"type" 为 image / tts / asr / chat，其余字段即请求参数，例如:
+    {"id": "cat", "type": "image", "prompt": "一只猫", "size": "1024x1024", "seed": 42}
+    {"type": "tts", "input": "你好", "voice": "alex", "response_format": "mp3"}
+    {"type": "asr", "file": "meeting.wav", "language": "zh"}
+    {"type": "chat", "prompt": "写一首诗", "system": "你是诗人", "max_tokens": 512}
+结果逐条追加到 <输出目录>/results.jsonl (含耗时)，生成的图像和音频保存在输出目录下；
+再次运行时跳过 results.jsonl 中已成功的任务 id。API Key 取自 --api-key 或环境变量 SILICONFLOW_API_KEY。
+每个端点 / 模型的耗时汇总写入 summary.json 的 "latency"，逐请求记录可用 --metrics-csv / --metrics-prom 导出。
+退出码: 0 全部成功，1 有任务失败，2 参数或任务文件错误，130 被中断或仍有任务未完成 (供 cron 等区分)。
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+from siliconflow_client import DEFAULT_API_BASE, SiliconFlowClient
+from siliconflow_engine import NetworkEngine
+from siliconflow_http import SiliconFlowHTTPClient
+from siliconflow_image_batch import download_images
+from siliconflow_metrics import MetricsRegistry
+from siliconflow_ratelimit import RequestGovernor
+
+RESULTS_FILENAME = "results.jsonl"
+SUMMARY_FILENAME = "summary.json"
+DEFAULT_CONCURRENCY = 4
+EXIT_INTERRUPTED = 130 # 被中断 (Ctrl+C) 或仍有任务未完成时的退出码，与 shell 对 SIGINT 的约定一致
+JOB_TYPES = ("image", "tts", "asr", "chat")
+DEFAULT_JOB_MODELS = {
+    "image": "Kwai-Kolors/Kolors",
+    "tts": "FunAudioLLM/CosyVoice2-0.5B",
+    "asr": "FunAudioLLM/SenseVoiceSmall",
+    "chat": "Qwen/Qwen2.5-7B-Instruct",
+}
+DEFAULT_TTS_VOICE = "alex"
+# 任务中不属于请求参数的字段
+_JOB_META_FIELDS = ("id", "type", "size", "file", "prompt", "system")
+
+
+def load_jobs(file_path):
+    """读取 JSONL 任务文件；缺少 id 的任务按行号编号。格式错误时抛出 ValueError 并指明行号"""
+    jobs = []
+    with open(file_path, "r", encoding="utf-8-sig") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip() or line.lstrip().startswith("#"):
+                continue
+            try:
+                job = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"第 {line_no} 行不是有效的 JSON: {e}")
+            if not isinstance(job, dict) or job.get("type") not in JOB_TYPES:
+                raise ValueError(f"第 {line_no} 行缺少有效的 type ({' / '.join(JOB_TYPES)})")
+            job.setdefault("id", f"{line_no:05d}")
+            job["id"] = str(job["id"])
+            jobs.append(job)
+    duplicated = sorted(job_id for job_id, count in Counter(job["id"] for job in jobs).items() if count > 1)
+    if duplicated:
+        raise ValueError(f"任务 id 重复: {', '.join(duplicated[:10])}")
+    return jobs
+
+
+def load_completed_ids(results_path):
+    if not os.path.exists(results_path):
+        return set()
+    done = set()
+    with open(results_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue # 上次中断时可能留下半行
+            if isinstance(record, dict) and record.get("status") == "ok":
+                done.add(record.get("id"))
+    return done
+
+
+def _request_params(job):
+    params = {k: v for k, v in job.items() if k not in _JOB_META_FIELDS}
+    params.setdefault("model", DEFAULT_JOB_MODELS[job["type"]])
+    return params
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+class BatchJobRunner:
+    """以有界并发执行混合任务，每完成一个就把结果和耗时追加写入 results.jsonl"""
+    def __init__(self, client, jobs, output_dir, max_workers=DEFAULT_CONCURRENCY, resume=True, on_result=None):
+        self.client = client
+        self.output_dir = output_dir
+        self.results_path = os.path.join(output_dir, RESULTS_FILENAME)
+        self.max_workers = max(1, int(max_workers))
+        self.on_result = on_result
+        done_ids = load_completed_ids(self.results_path) if resume else set()
+        self.jobs = [job for job in jobs if job["id"] not in done_ids]
+        self.skipped = len(jobs) - len(self.jobs)
+        self.records = []
+        self._lock = threading.Lock()
+
+    async def run(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        semaphore = asyncio.Semaphore(self.max_workers)
+        async def bounded(job):
+            async with semaphore:
+                await self._run_job(job)
+        await asyncio.gather(*(bounded(job) for job in self.jobs))
+        return self.records
+
+    async def _run_job(self, job):
+        record = {"id": job["id"], "type": job["type"], "model": _request_params(job)["model"]}
+        started = time.monotonic()
+        record["started_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+        try:
+            record.update(await getattr(self, f"_run_{job['type']}")(job))
+            record["status"] = "ok"
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            record.update(status="error", error=str(e))
+            response = getattr(e, "response", None)
+            if response is not None:
+                record["http_status"] = response.status_code
+        record["elapsed_s"] = round(time.monotonic() - started, 3)
+        await self.client.engine.run_blocking(self._append_record, record)
+        if self.on_result:
+            self.on_result(record)
+
+    async def _run_image(self, job):
+        payload = _request_params(job)
+        if job.get("size"):
+            payload["width"], payload["height"] = map(int, str(job["size"]).lower().split("x"))
+        payload.update(prompt=job["prompt"], n=1)
+        urls, result = await self.client.generate_image(payload)
+        if not urls:
+            raise ValueError("无法从 API 响应中提取图像 URL")
+        directory = os.path.join(self.output_dir, "images")
+        await self.client.engine.run_blocking(os.makedirs, directory, exist_ok=True)
+        files = []
+        downloads = await download_images(self.client.engine, self.client.http_client, urls, directory)
+        for index, download in enumerate(downloads):
+            file_name = f"{job['id']}{'' if index == 0 else f'_{index + 1}'}.{download['ext']}"
+            await self.client.engine.run_blocking(os.replace, download["path"], os.path.join(directory, file_name))
+            files.append(os.path.join("images", file_name))
+        return {"files": files, "urls": urls, "seed": result.get("seed", payload.get("seed"))}
+
+    async def _run_tts(self, job):
+        payload = _request_params(job)
+        payload.setdefault("voice", DEFAULT_TTS_VOICE)
+        if ":" not in str(payload["voice"]): # 与界面一致：音色写成 "模型:音色"
+            payload["voice"] = f"{payload['model']}:{payload['voice']}"
+        payload.setdefault("response_format", "mp3")
+        audio = await self.client.synthesize_speech(payload)
+        file_name = os.path.join("audio", f"{job['id']}.{payload['response_format']}")
+        await self.client.engine.run_blocking(self._write_file, file_name, audio)
+        return {"file": file_name, "bytes": len(audio)}
+
+    async def _run_asr(self, job):
+        params = _request_params(job)
+        result = await self.client.transcribe(job["file"], params["model"], params.get("language", "zh"))
+        return {"file": job["file"], "text": (result.get("text") or "").strip()}
+
+    async def _run_chat(self, job):
+        payload = _request_params(job)
+        if "messages" not in payload:
+            payload["messages"] = ([{"role": "system", "content": job["system"]}] if job.get("system") else []) + [{"role": "user", "content": job["prompt"]}]
+        result = await self.client.chat(payload)
+        elapsed = result["elapsed_s"] - (result["ttft_s"] or 0)
+        result["deltas_per_sec"] = round(result["deltas"] / elapsed, 2) if elapsed > 0 else None
+        return result
+
+    def _write_file(self, relative_path, data):
+        path = os.path.join(self.output_dir, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+
+    def _append_record(self, record):
+        with self._lock:
+            self.records.append(record)
+            with open(self.results_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def summary(self, wall_time):
+        """按任务类型汇总成功 / 失败数和耗时分位数"""
+        by_type = {}
+        for record in self.records:
+            by_type.setdefault(record["type"], []).append(record)
+        types = {}
+        for job_type, records in sorted(by_type.items()):
+            elapsed = [r["elapsed_s"] for r in records if r["status"] == "ok"]
+            types[job_type] = {"ok": len(elapsed), "failed": len(records) - len(elapsed), "p50_s": percentile(elapsed, 0.5),
+                               "p95_s": percentile(elapsed, 0.95), "max_s": max(elapsed) if elapsed else None}
+        ok = sum(t["ok"] for t in types.values())
+        return {"jobs": len(self.records), "ok": ok, "failed": len(self.records) - ok, "skipped": self.skipped, "unfinished": len(self.jobs) - len(self.records),
+                "wall_time_s": round(wall_time, 3), "jobs_per_minute": round(len(self.records) / wall_time * 60, 2) if wall_time > 0 else None, "by_type": types}
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="无界面批量运行 SiliconFlow 文生图 / TTS / ASR / 聊天任务")
+    parser.add_argument("jobs", help="JSONL 任务文件")
+    parser.add_argument("-o", "--output", default=None, help="输出目录 (默认: 任务文件名_results)")
+    parser.add_argument("-c", "--concurrency", type=int, default=DEFAULT_CONCURRENCY, help=f"并发任务数 (默认 {DEFAULT_CONCURRENCY})")
+    parser.add_argument("--api-key", default=os.environ.get("SILICONFLOW_API_KEY", ""), help="API Key (默认读取环境变量 SILICONFLOW_API_KEY)")
+    parser.add_argument("--api-base", default=os.environ.get("SILICONFLOW_API_BASE", DEFAULT_API_BASE), help="API 地址 (默认读取 SILICONFLOW_API_BASE)")
+    parser.add_argument("--hedge-images", action="store_true", help="文生图请求超过该模型的 p95 延迟仍未返回时再发一份 (会多计费)")
+    parser.add_argument("--metrics-csv", default=None, help="结束时把逐请求耗时记录导出为 CSV")
+    parser.add_argument("--metrics-prom", default=None, help="结束时把请求指标写成 Prometheus 文本文件")
+    parser.add_argument("--no-resume", action="store_true", help="不跳过 results.jsonl 中已成功的任务")
+    parser.add_argument("-q", "--quiet", action="store_true", help="不逐条打印任务结果")
+    return parser
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    if not args.api_key:
+        print("错误: 请通过 --api-key 或环境变量 SILICONFLOW_API_KEY 提供 API Key", file=sys.stderr)
+        return 2
+    try:
+        jobs = load_jobs(args.jobs)
+    except (OSError, ValueError) as e:
+        print(f"错误: 无法读取任务文件: {e}", file=sys.stderr)
+        return 2
+    output_dir = args.output or os.path.splitext(args.jobs)[0] + "_results"
+    os.makedirs(output_dir, exist_ok=True)
+    governor = RequestGovernor() # 与界面相同的按端点 / 模型节流，并发数设得过高时自动退让而不是大量 429
+    metrics = MetricsRegistry()
+    http_client = SiliconFlowHTTPClient(pool_maxsize=max(args.concurrency, 1), governor=governor, metrics=metrics)
+    engine = NetworkEngine(max_blocking_io=max(args.concurrency, 1) * 2)
+    client = SiliconFlowClient(engine, http_client, args.api_key, args.api_base, hedge_images=args.hedge_images)
+    counter = {"done": 0}
+    def report(record):
+        counter["done"] += 1
+        if not args.quiet:
+            detail = record.get("error") or record.get("file") or ", ".join(record.get("files", [])) or (record.get("text") or record.get("content") or "")[:60].replace("\n", " ")
+            print(f"[{counter['done']}/{len(runner.jobs)}] {record['status']:5s} {record['type']:5s} {record['id']} {record['elapsed_s']:.2f}s {detail}", file=sys.stderr)
+    runner = BatchJobRunner(client, jobs, output_dir, max_workers=args.concurrency, resume=not args.no_resume, on_result=report)
+    if runner.skipped:
+        print(f"跳过 {runner.skipped} 个已完成的任务", file=sys.stderr)
+    started = time.monotonic()
+    future = engine.submit(runner.run())
+    interrupted = False
+    try:
+        future.result()
+    except KeyboardInterrupt:
+        interrupted = True
+        future.cancel()
+        print("已中断，已完成的结果保留在 results.jsonl 中 (再次运行会跳过)", file=sys.stderr)
+    finally:
+        summary = runner.summary(time.monotonic() - started)
+        summary["interrupted"] = interrupted
+        summary["rate_limit"] = governor.snapshot()
+        summary["request_policy"] = http_client.policy.snapshot()
+        summary["latency"] = metrics.summary()
+        with open(os.path.join(output_dir, SUMMARY_FILENAME), "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        try:
+            if args.metrics_csv:
+                metrics.export_csv(args.metrics_csv)
+            if args.metrics_prom:
+                metrics.export_prometheus(args.metrics_prom)
+        except OSError as e:
+            print(f"错误: 无法写入指标文件: {e}", file=sys.stderr)
+        engine.stop()
+        http_client.close()
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    if interrupted or summary["unfinished"]:
+        return EXIT_INTERRUPTED # 没跑完的任务既不算成功也不算失败，不能让调度器当作正常结束
+    return 0 if summary["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
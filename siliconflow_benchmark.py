@@ -0,0 +1,197 @@
+"""SiliconFlow 请求层的端到端吞吐与延迟基准。
+
+默认在进程内启动本地模拟服务器 (siliconflow_mock_server.py)，经由与界面、批处理相同的请求层
+(SiliconFlowClient + 共享连接池、节流器、重试策略) 逐个驱动各端点，报告吞吐量和延迟分位数，
+离线和 CI 中都能运行。
+
+用法:
+    python siliconflow_benchmark.py                                    # 全部场景，各 50 个请求，并发 8
+    python siliconflow_benchmark.py -n 200 -c 16 --scenarios chat tts --latency 0.1 --error-rate 0.02
+    python siliconflow_benchmark.py --json bench.json --max-error-rate 0   # CI: 有场景失败率超标时退出码为 1
+    python siliconflow_benchmark.py --api-base http://127.0.0.1:8765/v1    # 测量已在运行的服务 (需要 --api-key)
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+from siliconflow_batch import DEFAULT_JOB_MODELS, DEFAULT_TTS_VOICE, percentile
+from siliconflow_client import SiliconFlowClient
+from siliconflow_engine import NetworkEngine
+from siliconflow_http import SiliconFlowHTTPClient
+from siliconflow_image_batch import download_images
+from siliconflow_metrics import MetricsRegistry, format_bytes, format_seconds
+from siliconflow_mock_server import MockSiliconFlowServer, add_settings_arguments, settings_from_args, wav_bytes
+from siliconflow_models import SERVER_SIDE_FILTERS
+from siliconflow_ratelimit import DEFAULT_RATE_LIMITS, RequestGovernor
+
+SCENARIOS = ("models", "image", "tts", "asr", "chat")
+DEFAULT_REQUESTS = 50 # 每个场景的请求数
+DEFAULT_CONCURRENCY = 8
+UNLIMITED_RPM = 10 ** 6 # 未使用 --account-limits 时节流器的每分钟请求数：仍走节流代码路径，但不限速
+BENCH_IMAGE_SIZE = (1024, 1024)
+BENCH_TEXT = "今天天气很好，我们一起去公园散步吧。这是一段用于性能基准的示例文本。"
+BENCH_CHAT_MAX_TOKENS = 64
+ASR_SAMPLE_SECONDS = 5 # 转录场景上传的示例音频时长
+
+
+class BenchmarkRunner:
+    """按场景依次运行：每个场景以有界并发发出固定数量的请求，记录每次操作的端到端耗时"""
+    def __init__(self, client, work_dir, requests_per_scenario=DEFAULT_REQUESTS, concurrency=DEFAULT_CONCURRENCY):
+        self.client = client
+        self.work_dir = work_dir
+        self.requests = max(1, int(requests_per_scenario))
+        self.concurrency = max(1, int(concurrency))
+        self.audio_path = os.path.join(work_dir, "sample.wav")
+
+    async def run(self, scenarios=SCENARIOS, on_result=None):
+        if "asr" in scenarios:
+            await self.client.engine.run_blocking(self._write_file, self.audio_path, wav_bytes(ASR_SAMPLE_SECONDS))
+        results = []
+        for scenario in scenarios:
+            result = await self._run_scenario(scenario)
+            results.append(result)
+            if on_result:
+                on_result(result)
+        return results
+
+    async def _run_scenario(self, scenario):
+        metrics, policy = self.client.http_client.metrics, self.client.http_client.policy
+        metrics.reset()
+        retried_before = policy.snapshot()["retried"]
+        operation = getattr(self, f"_{scenario}")
+        semaphore = asyncio.Semaphore(self.concurrency)
+        latencies, errors = [], []
+        async def timed(index):
+            async with semaphore:
+                started = time.monotonic()
+                try:
+                    await operation(index)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    errors.append(f"{type(e).__name__}: {e}")
+                    return
+                latencies.append(time.monotonic() - started)
+        started = time.monotonic()
+        await asyncio.gather(*(timed(index) for index in range(self.requests)))
+        wall = time.monotonic() - started
+        rows = metrics.summary()
+        primary = next((row for row in rows if row["endpoint"] == scenario), {})
+        return {
+            "scenario": scenario, "requests": self.requests, "concurrency": self.concurrency, "ok": len(latencies), "failed": len(errors),
+            "wall_s": round(wall, 3), "throughput_rps": round(len(latencies) / wall, 2) if wall > 0 else None,
+            "p50_s": _round(percentile(latencies, 0.5)), "p95_s": _round(percentile(latencies, 0.95)),
+            "p99_s": _round(percentile(latencies, 0.99)), "max_s": _round(max(latencies) if latencies else None),
+            "ttfb_p50_s": _round(primary.get("ttfb_p50")), "ttft_p50_s": _round(primary.get("ttft_p50")),
+            "tokens_per_s_p50": _round(primary.get("tokens_per_s_p50")), "bytes_in": sum(row["bytes_in"] for row in rows),
+            "http_requests": sum(row["requests"] for row in rows), "retried": policy.snapshot()["retried"] - retried_before,
+            "errors": sorted(set(errors))[:5],
+        }
+
+    # --- 各场景的一次操作 (与界面 / 批处理走相同的客户端方法) ---
+    async def _models(self, index):
+        filters = list(SERVER_SIDE_FILTERS.values())
+        await self.client.list_models(filters[index % len(filters)])
+
+    async def _image(self, index):
+        width, height = BENCH_IMAGE_SIZE
+        payload = {"model": DEFAULT_JOB_MODELS["image"], "prompt": BENCH_TEXT, "width": width, "height": height, "seed": index, "n": 1}
+        urls, _ = await self.client.generate_image(payload)
+        if not urls:
+            raise ValueError("无法从 API 响应中提取图像 URL")
+        downloads = await download_images(self.client.engine, self.client.http_client, urls, self.work_dir)
+        for download in downloads:
+            await self.client.engine.run_blocking(os.remove, download["path"])
+
+    async def _tts(self, index):
+        model = DEFAULT_JOB_MODELS["tts"]
+        await self.client.synthesize_speech({"model": model, "input": BENCH_TEXT, "voice": f"{model}:{DEFAULT_TTS_VOICE}", "response_format": "mp3"})
+
+    async def _asr(self, index):
+        await self.client.transcribe(self.audio_path, DEFAULT_JOB_MODELS["asr"], "zh")
+
+    async def _chat(self, index):
+        payload = {"model": DEFAULT_JOB_MODELS["chat"], "messages": [{"role": "user", "content": BENCH_TEXT}], "max_tokens": BENCH_CHAT_MAX_TOKENS}
+        result = await self.client.chat(payload)
+        if not result["deltas"]:
+            raise ValueError("流式响应没有返回任何内容")
+
+    @staticmethod
+    def _write_file(path, data):
+        with open(path, "wb") as f:
+            f.write(data)
+
+
+def _round(value, digits=4):
+    return round(value, digits) if value is not None else None
+
+
+def format_result(result):
+    text = (f"{result['scenario']:<7} {result['ok']:>4}/{result['requests']:<4} {result['throughput_rps'] or 0:>8.1f} req/s  "
+            f"p50 {format_seconds(result['p50_s']):>8}  p95 {format_seconds(result['p95_s']):>8}  p99 {format_seconds(result['p99_s']):>8}  "
+            f"首字节 {format_seconds(result['ttfb_p50_s']):>8}  接收 {format_bytes(result['bytes_in']):>9}")
+    if result["ttft_p50_s"] is not None:
+        text += f"  首 token {format_seconds(result['ttft_p50_s'])}，{result['tokens_per_s_p50'] or 0:.1f} token/s"
+    if result["retried"]:
+        text += f"  重试 {result['retried']} 次"
+    return text
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="SiliconFlow 请求层吞吐与延迟基准 (默认使用进程内模拟服务器)")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS), help="要运行的场景 (默认全部)")
+    parser.add_argument("-n", "--requests", type=int, default=DEFAULT_REQUESTS, help=f"每个场景的请求数 (默认 {DEFAULT_REQUESTS})")
+    parser.add_argument("-c", "--concurrency", type=int, default=DEFAULT_CONCURRENCY, help=f"并发数 (默认 {DEFAULT_CONCURRENCY})")
+    parser.add_argument("--api-base", default=None, help="测量已在运行的服务而不是启动进程内模拟服务器")
+    parser.add_argument("--api-key", default=os.environ.get("SILICONFLOW_API_KEY", "mock-key"), help="API Key (模拟服务器接受任意值)")
+    parser.add_argument("--account-limits", action="store_true", help="使用默认账户限额节流 (默认不限速，只测量请求层本身)")
+    parser.add_argument("--hedge-images", action="store_true", help="文生图启用慢请求对冲")
+    parser.add_argument("--json", default=None, help="把结果写入 JSON 文件")
+    parser.add_argument("--max-error-rate", type=float, default=None, help="任一场景失败率超过该值 (0~1) 时退出码为 1")
+    add_settings_arguments(parser)
+    args = parser.parse_args(argv)
+
+    server = None
+    if args.api_base is None:
+        server = MockSiliconFlowServer(port=0, settings=settings_from_args(args)).start()
+    api_base = args.api_base or server.api_base
+    rate_limits = None if args.account_limits else {endpoint: (UNLIMITED_RPM, max(args.concurrency, 1)) for endpoint in DEFAULT_RATE_LIMITS}
+    http_client = SiliconFlowHTTPClient(pool_maxsize=max(args.concurrency, 1), governor=RequestGovernor(rate_limits), metrics=MetricsRegistry())
+    engine = NetworkEngine(max_blocking_io=max(args.concurrency, 1) * 2)
+    client = SiliconFlowClient(engine, http_client, args.api_key, api_base, hedge_images=args.hedge_images)
+    print(f"基准目标: {api_base}{' (进程内模拟服务器)' if server else ''}，每个场景 {args.requests} 个请求，并发 {args.concurrency}", file=sys.stderr)
+    try:
+        with tempfile.TemporaryDirectory(prefix="siliconflow-bench-") as work_dir:
+            runner = BenchmarkRunner(client, work_dir, args.requests, args.concurrency)
+            results = engine.submit(runner.run(args.scenarios, on_result=lambda result: print(format_result(result), file=sys.stderr))).result()
+    except KeyboardInterrupt:
+        print("已中断", file=sys.stderr)
+        return 130
+    finally:
+        engine.stop()
+        http_client.close()
+        if server:
+            server.stop()
+    for result in results:
+        for error in result["errors"]:
+            print(f"  {result['scenario']} 失败示例: {error}", file=sys.stderr)
+    report = {"api_base": api_base, "mock_server": server is not None, "requests": args.requests, "concurrency": args.concurrency,
+              "mock_settings": {k: getattr(args, k) for k in ("latency", "jitter", "error_rate", "throttle_rate", "token_rate", "chat_tokens", "seed")} if server else None,
+              "connection_stats": http_client.connection_stats(), "results": results}
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.max_error_rate is not None:
+        over = [r["scenario"] for r in results if r["failed"] / r["requests"] > args.max_error_rate]
+        if over:
+            print(f"失败率超过 {args.max_error_rate:.1%}: {', '.join(over)}", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
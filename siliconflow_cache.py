@@ -0,0 +1,239 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+
+def payload_digest(payload, fields=None):
+    """把请求参数规范化 (只取 fields 中的键、排序、浮点数取整) 后计算 sha256，作为缓存地址"""
+    normalized = {}
+    for key in sorted(fields if fields is not None else payload):
+        value = payload.get(key)
+        if value is None or value == "":
+            continue
+        if isinstance(value, str):
+            value = value.strip()
+        elif isinstance(value, float):
+            value = round(value, 4)
+            if value == int(value):
+                value = int(value) # 7.0 与 7 视为同一参数
+        normalized[key] = value
+    canonical = json.dumps(normalized, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def copy_file(src, dst):
+    """先复制到同目录的临时文件再原子替换 dst：读者看不到写到一半的文件"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(dst) or ".", prefix=".cache-", suffix=".tmp"); os.close(fd)
+    try:
+        shutil.copyfile(src, tmp_path)
+        os.replace(tmp_path, dst)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class CacheStats:
+    """线程安全的命中 / 未命中 / 节省字节计数"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+
+    def record(self, hit, size=0):
+        with self._lock:
+            if hit:
+                self.hits += 1
+                self.bytes_saved += size
+            else:
+                self.misses += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "bytes_saved": self.bytes_saved}
+
+
+def format_cache_stats(stats):
+    return f"缓存命中 {stats['hits']} / 未命中 {stats['misses']}，已节省 {stats['bytes_saved'] / 1024 / 1024:.1f} MB"
+
+
+class DiskBlobCache:
+    """按内容地址 (请求参数摘要) 存放二进制结果和元数据的磁盘缓存，总大小超过上限时按最近最少使用淘汰。
+
+    每个条目是 <key>.bin + <key>.json 两个文件，均先写临时文件再原子替换；
+    元数据文件最后写入，它存在即表示条目完整。访问时间用文件 mtime 记录，重启后仍能恢复 LRU 顺序。
+    条目按内容寻址、不可变：与用户目录之间一律复制 (put_file 复制进来，get_path 的调用方复制出去)，
+    不与输出文件共享 inode，用户编辑保存的图像不会改动缓存，更新访问时间也不会改动用户文件。
+    """
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        self._index = None # key -> 占用字节数，按最近使用顺序排列 (首次使用时扫描目录建立)
+
+    def _paths(self, key):
+        directory = os.path.join(self.cache_dir, key[:2])
+        return os.path.join(directory, f"{key}.bin"), os.path.join(directory, f"{key}.json")
+
+    def _load_index(self):
+        if self._index is not None:
+            return
+        entries = []
+        if os.path.isdir(self.cache_dir):
+            for root, _, files in os.walk(self.cache_dir):
+                for name in files:
+                    if not name.endswith(".json"):
+                        continue
+                    key = name[:-5]
+                    blob_path, meta_path = self._paths(key)
+                    try:
+                        size = os.path.getsize(blob_path) + os.path.getsize(meta_path)
+                        entries.append((os.path.getmtime(blob_path), key, size))
+                    except OSError:
+                        continue # 写到一半的条目
+        self._index = OrderedDict((key, size) for _, key, size in sorted(entries))
+
+    @property
+    def total_bytes(self):
+        with self._lock:
+            self._load_index()
+            return sum(self._index.values())
+
+    def get(self, key):
+        """返回 (数据, 元数据)；未命中时返回 None"""
+        hit = self._lookup(key, read_data=True)
+        return (hit[1], hit[2]) if hit else None
+
+    def get_path(self, key):
+        """返回 (缓存文件路径, 元数据)，不读取数据本身；调用方应尽快用 copy_file() 复制走 (不要硬链接)，条目之后可能被淘汰"""
+        hit = self._lookup(key, read_data=False)
+        return (hit[0], hit[2]) if hit else None
+
+    def _lookup(self, key, read_data):
+        blob_path, meta_path = self._paths(key)
+        with self._lock:
+            self._load_index()
+            if key not in self._index:
+                self.stats.record(False)
+                return None
+            try:
+                with open(meta_path, "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+                data = None
+                if read_data:
+                    with open(blob_path, "rb") as f:
+                        data = f.read()
+                size = len(data) if read_data else os.path.getsize(blob_path)
+                os.utime(blob_path) # 记录访问时间
+            except (OSError, ValueError):
+                self._index.pop(key, None)
+                self.stats.record(False)
+                return None
+            self._index.move_to_end(key)
+        self.stats.record(True, size)
+        return blob_path, data, meta
+
+    def put(self, key, data, meta):
+        blob_path, _ = self._paths(key)
+        with self._lock:
+            self._load_index()
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            self._atomic_write(blob_path, data)
+            self._commit(key, len(data), meta)
+
+    def put_file(self, key, src_path, meta):
+        """把已经在磁盘上的文件复制进缓存 (不硬链接：源文件之后被修改也不影响缓存条目)"""
+        blob_path, _ = self._paths(key)
+        with self._lock:
+            self._load_index()
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            copy_file(src_path, blob_path)
+            self._commit(key, os.path.getsize(blob_path), meta)
+
+    def _commit(self, key, size, meta):
+        """写入元数据 (条目从此可见) 并按需淘汰；调用方需持有锁"""
+        _, meta_path = self._paths(key)
+        meta_bytes = json.dumps(dict(meta, size=size, stored_at=time.time()), ensure_ascii=False).encode("utf-8")
+        self._atomic_write(meta_path, meta_bytes)
+        self._index[key] = size + len(meta_bytes)
+        self._index.move_to_end(key)
+        self._evict()
+
+    def _evict(self):
+        total = sum(self._index.values())
+        while total > self.max_bytes and len(self._index) > 1:
+            key, size = self._index.popitem(last=False)
+            for path in self._paths(key)[::-1]: # 先删元数据，条目立即失效
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total -= size
+
+    def _atomic_write(self, path, data):
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".cache-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+class MemoryLRUCache:
+    """按总字节数限制的内存 LRU 缓存"""
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries = OrderedDict() # key -> (数据, 元数据)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, data, meta):
+        if len(data) > self.max_bytes:
+            return # 单个条目超过上限时只进磁盘层
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.total_bytes -= len(old[0])
+            self._entries[key] = (data, meta)
+            self.total_bytes += len(data)
+            while self.total_bytes > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self.total_bytes -= len(evicted)
+
+
+class TieredBlobCache:
+    """内存层 (字节上限 LRU) + 磁盘层 (DiskBlobCache)：先查内存，再查磁盘并提升到内存"""
+    def __init__(self, cache_dir, memory_max_bytes, disk_max_bytes):
+        self.memory = MemoryLRUCache(memory_max_bytes)
+        self.disk = DiskBlobCache(cache_dir, disk_max_bytes)
+        self.stats = CacheStats()
+
+    def get(self, key):
+        entry = self.memory.get(key)
+        if entry is None:
+            entry = self.disk.get(key)
+            if entry is not None:
+                self.memory.put(key, *entry)
+        self.stats.record(entry is not None, len(entry[0]) if entry else 0)
+        return entry
+
+    def put(self, key, data, meta):
+        self.memory.put(key, data, meta)
+        self.disk.put(key, data, meta)
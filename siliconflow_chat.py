@@ -0,0 +1,107 @@
+import functools
+import re
+
+DEFAULT_CONTEXT_WINDOW = 32768 # 上下文窗口表中没有命中的模型按该值估算
+DEFAULT_COMPLETION_TOKENS = 2048 # 未设置 Max Tokens 时为回复预留的 token 数
+MESSAGE_OVERHEAD_TOKENS = 4 # 每条消息的角色标记等固定开销
+CONTEXT_SAFETY_MARGIN = 0.05 # 本地估算与服务端分词器有误差，预算只用到窗口的 95%
+MIN_COMPLETION_TOKENS = 256 # 压缩 max_tokens 时至少保留的回复长度
+IMAGE_TOKENS = {"low": 256, "high": 1024} # 单张图片的估算 token 数 (按缩小后的分辨率，每 28x28 像素约 1 个 token)
+
+# --- 上下文窗口表 (按优先级排列，先命中者生效) ---
+# 每条规则: (模型名中包含的任一关键词 (小写), 上下文窗口 token 数)
+CONTEXT_WINDOW_RULES = [
+    (["128k"], 131072),
+    (["deepseek-vl2"], 4096),
+    (["deepseek-v3", "deepseek-r1", "deepseek-v2.5"], 65536),
+    (["qwen3", "qwq-32b", "glm-4-32b", "glm-z1"], 131072),
+    (["qwen2.5-vl", "qwen2-vl", "qvq"], 32768),
+    (["qwen2.5", "qwen2-", "internlm2_5", "glm-4-9b", "chatglm3"], 32768),
+]
+
+_CJK_PATTERN = re.compile("[\u3000-\u303f\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]") # 中日韩文字与全角标点
+_WORD_PATTERN = re.compile(r"[A-Za-z]+|\d|[^\sA-Za-z\d]")
+
+
+def context_window_for(model):
+    name = model.lower()
+    for keywords, window in CONTEXT_WINDOW_RULES:
+        if any(keyword in name for keyword in keywords):
+            return window
+    return DEFAULT_CONTEXT_WINDOW
+
+
+@functools.lru_cache(maxsize=4096)
+def estimate_tokens(text):
+    """本地粗略估算文本的 token 数：中日韩字符约 1 个字符 1 个 token，英文单词约 4 个字母 1 个 token，数字和标点各 1 个。
+
+    结果按字符串缓存 (字符串会缓存自身的哈希值)，历史消息在每次发送时不会被重新扫描。
+    """
+    cjk = len(_CJK_PATTERN.findall(text))
+    tokens = cjk
+    if cjk < len(text):
+        for word in _WORD_PATTERN.findall(_CJK_PATTERN.sub(" ", text)):
+            tokens += (len(word) + 3) // 4 if word[0].isalpha() else 1
+    return tokens
+
+
+def estimate_message_tokens(message):
+    content = message.get("content")
+    tokens = MESSAGE_OVERHEAD_TOKENS
+    if isinstance(content, str):
+        return tokens + estimate_tokens(content)
+    for part in content or []:
+        if part.get("type") == "text":
+            tokens += estimate_tokens(part.get("text", ""))
+        elif part.get("type") == "image_url":
+            tokens += IMAGE_TOKENS["low" if part["image_url"].get("detail") == "low" else "high"]
+    return tokens
+
+
+def fit_messages(model, system_messages, history, last_message, max_tokens=None):
+    """组装请求的 messages：不复制历史，只引用 history 中的消息对象。
+
+    system_messages 总是保留；last_message (不为 None 时) 替换 history 的最后一条 (用户消息，可能附带图片)；
+    估算超出上下文预算时从最早的轮次开始整轮省略，保证保留下来的对话以用户消息开头。
+    返回 (messages, 统计信息)，统计信息中的 max_tokens 已按剩余窗口压缩 (None 表示沿用服务端默认)。
+    """
+    window = context_window_for(model)
+    usable = int(window * (1 - CONTEXT_SAFETY_MARGIN))
+    reserved = min(max_tokens or DEFAULT_COMPLETION_TOKENS, usable // 2) # 为回复预留，但最多占一半窗口
+    budget = usable - reserved
+    fixed = sum(estimate_message_tokens(m) for m in system_messages)
+    if last_message is not None:
+        fixed += estimate_message_tokens(last_message)
+        history = history[:-1] # 只复制列表本身 (引用)，不复制消息
+    earlier = history
+    # 从最新往前累加，超出预算即停止
+    kept_tokens, start = 0, len(earlier)
+    for index in range(len(earlier) - 1, -1, -1):
+        cost = estimate_message_tokens(earlier[index])
+        if fixed + kept_tokens + cost > budget:
+            break
+        kept_tokens += cost
+        start = index
+    while start < len(earlier) and earlier[start].get("role") != "user": # 不从助手回复中间开始
+        kept_tokens -= estimate_message_tokens(earlier[start])
+        start += 1
+    messages = [*system_messages, *earlier[start:], *([last_message] if last_message is not None else [])]
+    prompt_tokens = fixed + kept_tokens
+    completion = max_tokens
+    if max_tokens and prompt_tokens + max_tokens > usable:
+        completion = max(MIN_COMPLETION_TOKENS, usable - prompt_tokens)
+    stats = {
+        "prompt_tokens": prompt_tokens,
+        "context_window": window,
+        "dropped_messages": start,
+        "max_tokens": completion,
+        "overflow": prompt_tokens > budget, # 只剩最新一条消息仍然超出预算
+    }
+    return messages, stats
+
+
+def format_prompt_stats(stats):
+    text = f"提示约 {stats['prompt_tokens']} tokens / 窗口 {stats['context_window']}"
+    if stats["dropped_messages"]:
+        text += f"，省略了最早的 {stats['dropped_messages']} 条消息"
+    return text
@@ -0,0 +1,130 @@
+import json
+import os
+import time
+
+from siliconflow_image_batch import extract_image_urls, request_image_generation
+from siliconflow_models import model_ids_from_response
+
+DEFAULT_API_BASE = "https://api.siliconflow.cn/v1"
+API_PATHS = {
+    "models": "/models",
+    "image": "/images/generations",
+    "tts": "/audio/speech",
+    "asr": "/audio/transcriptions",
+    "chat": "/chat/completions",
+}
+SSE_DONE = object() # parse_chat_line() 遇到 [DONE] 时的返回值
+
+
+def parse_chat_line(line):
+    """解析一行 SSE 数据：返回 (content 增量, reasoning_content 增量)，[DONE] 返回 SSE_DONE，非数据行返回 None。
+
+    数据不是有效 JSON 时抛出 json.JSONDecodeError，由调用方决定跳过还是报错。
+    """
+    if isinstance(line, bytes):
+        line = line.decode("utf-8")
+    if not line.startswith("data: "):
+        return None
+    data = line[len("data: "):]
+    if data.strip() == "[DONE]":
+        return SSE_DONE
+    chunk = json.loads(data)
+    delta = (chunk.get("choices") or [{}])[0].get("delta", {})
+    return delta.get("content"), delta.get("reasoning_content")
+
+
+class SiliconFlowClient:
+    """与界面无关的 SiliconFlow 请求层：构造请求、解析响应，发送和其他阻塞调用都经由网络引擎的 I/O 线程池执行。
+
+    HTTP 错误以 requests 的异常原样抛出，调用方 (界面或命令行) 自行决定如何展示。
+    """
+    def __init__(self, engine, http_client, api_key, api_base=DEFAULT_API_BASE, hedge_images=False):
+        self.engine = engine
+        self.http_client = http_client
+        self.api_key = api_key
+        self.api_base = api_base.rstrip("/")
+        self.hedge_images = hedge_images
+
+    def url(self, endpoint):
+        return self.api_base + API_PATHS[endpoint]
+
+    def headers(self, json_body=True):
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+        if json_body:
+            headers["Content-Type"] = "application/json"
+        return headers
+
+    async def _post(self, endpoint, **kwargs):
+        response = await self.http_client.apost(self.engine, self.url(endpoint), endpoint, **kwargs)
+        response.raise_for_status()
+        return response
+
+    async def list_models(self, params=None):
+        """返回模型 ID 列表；params 为 type / sub_type 等服务端过滤参数"""
+        response = await self.http_client.aget(self.engine, self.url("models"), "models", headers=self.headers(json_body=False), params=params)
+        response.raise_for_status()
+        return model_ids_from_response(response.json())
+
+    async def generate_image(self, payload, hedge=None):
+        """返回 (图像 URL 列表, 完整响应)；hedge 为 None 时按 hedge_images 决定是否对冲慢请求"""
+        hedge = self.hedge_images if hedge is None else hedge
+        result = await request_image_generation(self.engine, self.http_client, self.url("image"), payload, self.headers(), hedge)
+        return extract_image_urls(result), result
+
+    async def synthesize_speech(self, payload):
+        """非流式合成，返回音频字节"""
+        response = await self._post("tts", json=dict(payload, stream=False), headers=self.headers())
+        return response.content
+
+    async def transcribe(self, file_path, model, language):
+        """上传音频文件转录，返回完整响应 (文本在 "text" 字段)"""
+        with open(file_path, "rb") as audio_file:
+            files = {"file": (os.path.basename(file_path), audio_file)}
+            response = await self._post("asr", headers=self.headers(json_body=False), files=files, data={"model": model, "language": language})
+        return response.json()
+
+    async def chat(self, payload, on_delta=None, on_invalid=None):
+        """流式对话，返回 {"content", "reasoning", "deltas", "ttft_s", "elapsed_s"}。
+
+        on_delta(content, reasoning) 在事件循环上逐块回调 (界面据此渲染，并在被取消时保留已收到的部分)；
+        无法解析的数据块被跳过，传入 on_invalid(line) 时交给它展示。收到过内容的流 (包括中途停止的) 记入首 token 时间和 token 速率。
+        """
+        started = time.monotonic()
+        response = await self._post("chat", json=dict(payload, stream=True), headers=self.headers(), stream=True)
+        content, reasoning, deltas, ttft, last_delta = [], [], 0, None, None
+        try:
+            lines = response.iter_lines()
+            while True:
+                line = await self.engine.run_blocking(next, lines, None) # 每次读取都回到 I/O 线程，取消落在两行之间
+                if line is None:
+                    break
+                if not line:
+                    continue
+                try:
+                    parsed = parse_chat_line(line)
+                except json.JSONDecodeError:
+                    if on_invalid:
+                        on_invalid(line)
+                    continue
+                if parsed is SSE_DONE:
+                    break
+                if parsed is None:
+                    continue
+                delta_content, delta_reasoning = parsed
+                if delta_content or delta_reasoning:
+                    deltas += 1
+                    last_delta = time.monotonic()
+                    if ttft is None:
+                        ttft = last_delta - started
+                if delta_content:
+                    content.append(delta_content)
+                if delta_reasoning:
+                    reasoning.append(delta_reasoning)
+                if on_delta and (delta_content or delta_reasoning):
+                    on_delta(delta_content, delta_reasoning)
+        finally:
+            response.close() # 把连接还给连接池 (中途停止时丢弃该连接)
+            if ttft is not None:
+                self.http_client.metrics.record_stream("chat", payload.get("model"), ttft, deltas, last_delta - started - ttft)
+        return {"content": "".join(content), "reasoning": "".join(reasoning), "deltas": deltas,
+                "ttft_s": round(ttft, 3) if ttft is not None else None, "elapsed_s": round(time.monotonic() - started, 3)}
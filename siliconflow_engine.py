@@ -0,0 +1,101 @@
+import asyncio
+import functools
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_MAX_BLOCKING_IO = 16 # 同时进行的阻塞 I/O 上限 (与 HTTP 连接池大小保持一致)
+
+
+class NetworkEngine:
+    """应用唯一的后台 asyncio 事件循环。
+
+    所有网络调用都以协程形式提交到这里运行，超时和取消统一在 submit() 中处理；
+    需要回到界面线程的回调放入 ui_queue，由 Tk 主循环定期取出执行。
+    requests 本身是同步库，所以协程通过 run_blocking() 把单次 HTTP 调用交给一个
+    有界的复用线程池执行，而不是每次点击都新建线程。
+    """
+    def __init__(self, max_blocking_io=DEFAULT_MAX_BLOCKING_IO):
+        self.loop = asyncio.new_event_loop()
+        self.executor = ThreadPoolExecutor(max_workers=max_blocking_io, thread_name_prefix="siliconflow-io")
+        self.loop.set_default_executor(self.executor)
+        self.ui_queue = queue.Queue()
+        self._groups = {} # 分组名 -> 正在运行的 asyncio.Task 集合，用于按功能取消
+        self._thread = threading.Thread(target=self._run_loop, name="siliconflow-network", daemon=True)
+        self._thread.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    # --- 供协程使用 ---
+    async def run_blocking(self, func, *args, **kwargs):
+        """在 I/O 线程池中执行一个阻塞调用并等待结果"""
+        return await self.loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+    def post_to_ui(self, callback, *args, **kwargs):
+        """把回调放入界面队列 (任意线程均可调用)"""
+        self.ui_queue.put((callback, args, kwargs))
+
+    # --- 供界面线程 / 脚本使用 ---
+    def submit(self, coro, group=None, timeout=None, on_success=None, on_error=None):
+        """提交一个协程。on_success / on_error 会经由界面队列回调，返回 concurrent.futures.Future"""
+        async def runner():
+            task = asyncio.current_task()
+            if group:
+                self._groups.setdefault(group, set()).add(task)
+            try:
+                result = await (asyncio.wait_for(coro, timeout) if timeout else coro)
+            except asyncio.CancelledError:
+                raise
+            except BaseException as e:
+                if on_error:
+                    self.post_to_ui(on_error, e)
+                raise
+            finally:
+                if group:
+                    self._groups.get(group, set()).discard(task)
+            if on_success:
+                self.post_to_ui(on_success, result)
+            return result
+        return asyncio.run_coroutine_threadsafe(runner(), self.loop)
+
+    def run(self, coro, timeout=None):
+        """同步运行一个协程并返回结果 (不能在事件循环线程中调用)"""
+        return self.submit(coro, timeout=timeout).result()
+
+    def cancel_group(self, group):
+        """取消某个分组内所有正在运行的协程"""
+        def cancel():
+            for task in list(self._groups.get(group, ())):
+                task.cancel()
+        self.loop.call_soon_threadsafe(cancel)
+
+    def is_busy(self, group):
+        return bool(self._groups.get(group))
+
+    def drain_ui_queue(self, max_items=200):
+        """在界面线程中执行排队的回调，返回执行的数量"""
+        count = 0
+        while count < max_items:
+            try:
+                callback, args, kwargs = self.ui_queue.get_nowait()
+            except queue.Empty:
+                break
+            count += 1
+            try:
+                callback(*args, **kwargs)
+            except Exception as e:
+                print(f"--- DEBUG: UI callback {getattr(callback, '__name__', callback)} failed: {e} ---")
+        return count
+
+    def stop(self):
+        """取消所有协程并停止事件循环"""
+        def shutdown():
+            for task in asyncio.all_tasks(self.loop):
+                task.cancel()
+            self.loop.stop()
+        if self.loop.is_running():
+            self.loop.call_soon_threadsafe(shutdown)
+            self._thread.join(timeout=2)
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,331 @@
+import asyncio
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from siliconflow_metrics import MetricsRegistry
+from siliconflow_policy import RequestPolicy, backoff_delay
+from siliconflow_ratelimit import CONGESTION_STATUS
+
+# --- 连接池配置 ---
+DEFAULT_POOL_CONNECTIONS = 4   # 缓存的主机连接池数量 (api.siliconflow.cn + 图片 CDN 等)
+DEFAULT_POOL_MAXSIZE = 16      # 每个主机连接池保留的最大 keep-alive 连接数
+DEFAULT_CONNECT_TIMEOUT = 10   # 建立 TCP/TLS 连接的超时 (秒)
+DEFAULT_TIMEOUTS = {           # 各端点的读取超时上限 (秒)，积累足够的延迟样本后按 p99 收紧
+    "models": 30,
+    "image": 120,
+    "image_download": 60,
+    "tts": 60,
+    "asr": 180,
+    "chat": 120,
+}
+RATE_LIMIT_RETRIES = 3 # 429/503 表示请求未被处理，按 Retry-After 等待后自动重发的次数
+
+
+class ConnectionStats:
+    """线程安全的连接复用计数器"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+        self.reused_connections = 0
+
+    def record(self, reused):
+        with self._lock:
+            self.requests += 1
+            if reused:
+                self.reused_connections += 1
+            else:
+                self.new_connections += 1
+
+    def snapshot(self):
+        with self._lock:
+            total = self.requests
+            return {
+                "requests": total,
+                "new_connections": self.new_connections,
+                "reused_connections": self.reused_connections,
+                "reuse_ratio": (self.reused_connections / total) if total else 0.0,
+            }
+
+
+_connect_timing = threading.local() # 当前线程本次请求建立连接的耗时 (连接在发出请求的线程中建立)
+
+
+def _timed_connection_class(base_class):
+    """生成一个记录 TCP/TLS 建连耗时的连接子类"""
+    class TimedConnection(base_class):
+        def connect(self):
+            started = time.monotonic()
+            try:
+                super().connect()
+            finally:
+                _connect_timing.seconds = getattr(_connect_timing, "seconds", 0.0) + time.monotonic() - started
+    TimedConnection.__name__ = f"Timed{base_class.__name__}"
+    return TimedConnection
+
+
+def _counting_pool_class(base_class, stats):
+    """生成一个在取出连接时统计 新建/复用、并记录建连耗时的连接池子类"""
+    class CountingPool(base_class):
+        ConnectionCls = _timed_connection_class(base_class.ConnectionCls)
+
+        def _get_conn(self, timeout=None):
+            conn = super()._get_conn(timeout=timeout)
+            # urllib3 会关闭已断开的空闲连接，sock 为 None 表示接下来需要重新握手
+            stats.record(reused=getattr(conn, "sock", None) is not None)
+            return conn
+    CountingPool.__name__ = f"Counting{base_class.__name__}"
+    return CountingPool
+
+
+class CountingHTTPAdapter(HTTPAdapter):
+    """为每个主机维护 keep-alive 连接池，并统计连接复用情况"""
+    def __init__(self, stats, **kwargs):
+        self.stats = stats
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _counting_pool_class(HTTPConnectionPool, self.stats),
+            "https": _counting_pool_class(HTTPSConnectionPool, self.stats),
+        }
+
+
+def request_model(kwargs):
+    """从请求参数中取出模型名 (JSON 请求体或表单字段)，用于按模型节流"""
+    for body in (kwargs.get("json"), kwargs.get("data")):
+        if isinstance(body, dict) and body.get("model"):
+            return body["model"]
+    return None
+
+
+def _body_size(body):
+    if isinstance(body, str):
+        return len(body.encode("utf-8"))
+    return len(body) if isinstance(body, (bytes, bytearray)) else 0
+
+
+def _bytes_received(response, streamed=0):
+    """读到的响应体字节数：优先取连接上的原始字节数 (压缩传输时为压缩后的大小)；
+    分块传输 (chunked) 时 urllib3 不计数，退回到已读出的内容长度"""
+    try:
+        received = response.raw.tell()
+    except (AttributeError, ValueError, OSError):
+        received = 0
+    if received:
+        return received
+    if streamed:
+        return streamed
+    return len(response.content) if response._content_consumed and response.content else 0
+
+
+def _rewind_files(kwargs):
+    """重发前把上传的文件对象倒回开头 (bytes 内容无需处理)"""
+    for value in (kwargs.get("files") or {}).values():
+        fileobj = value[1] if isinstance(value, tuple) else value
+        if hasattr(fileobj, "seek"):
+            fileobj.seek(0)
+
+
+class _Dispatch:
+    """协程交给 I/O 线程的一次发送：名额已在事件循环上取得。协程被取消时，线程中的发送可能尚未开始，也可能正在进行"""
+    def __init__(self, permit):
+        self.permit = permit
+        self.lock = threading.Lock()
+        self.started = False
+        self.abandoned = False
+
+
+class SiliconFlowHTTPClient:
+    """整个应用共享的 HTTP 客户端 (连接池 + 分端点超时)。
+
+    传入 governor (siliconflow_ratelimit.RequestGovernor) 时，受它管理的端点在发出前排队取得名额，
+    收到 429/503 后按 Retry-After 等待并自动重发；图像下载等不计入账户限额的请求不排队。
+    协程应使用 arequest() / aget() / apost()：排队和重试退避都在事件循环上等待，只有真正发送时才占用 I/O 线程。
+    policy (siliconflow_policy.RequestPolicy) 决定瞬时故障的重试 (抖动指数退避) 和按观测延迟收紧的读取超时。
+    每次发出的请求 (包括重试) 的建连、首字节、总耗时和流量都记入 metrics (siliconflow_metrics.MetricsRegistry)。
+    请求参数 on_retry(retry) 在每次重发前回调 (retry 从 1 开始，包括限流后的重发)，供调用方在界面上报告重试进度。
+    """
+    def __init__(self, pool_connections=DEFAULT_POOL_CONNECTIONS, pool_maxsize=DEFAULT_POOL_MAXSIZE,
+                 timeouts=None, connect_timeout=DEFAULT_CONNECT_TIMEOUT, governor=None, policy=None, metrics=None):
+        self.stats = ConnectionStats()
+        self.metrics = metrics if metrics is not None else MetricsRegistry()
+        self.governor = governor
+        self.policy = policy if policy is not None else RequestPolicy()
+        self.timeouts = dict(DEFAULT_TIMEOUTS)
+        if timeouts:
+            self.timeouts.update(timeouts)
+        self.connect_timeout = connect_timeout
+        self.session = requests.Session()
+        adapter = CountingHTTPAdapter(self.stats, pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def timeout_for(self, endpoint, model=None, attempt=0, stream=False):
+        """返回 requests 使用的 (连接超时, 读取超时) 元组；读取超时按该模型观测到的延迟自适应。
+
+        流式响应的读取超时约束的是数据块之间的间隔 (推理模型可能长时间不输出)，与响应头延迟无关，沿用配置值。
+        """
+        ceiling = self.timeouts.get(endpoint, max(self.timeouts.values()))
+        if stream:
+            return (self.connect_timeout, ceiling)
+        return (self.connect_timeout, self.policy.read_timeout(endpoint, model, ceiling, attempt))
+
+    def _governs(self, endpoint):
+        return self.governor is not None and self.governor.governs(endpoint)
+
+    def _send(self, method, url, endpoint, model, kwargs, dispatch=None):
+        """发出一次请求：受节流器管理的端点先取得名额 (dispatch 表示名额已由协程取得)；成功的响应计入该模型的延迟样本。
+        对应的协程已被取消时返回 None"""
+        governed = self._governs(endpoint)
+        if dispatch is None:
+            permit = self.governor.acquire(endpoint, model) if governed else None
+        else:
+            with dispatch.lock:
+                if dispatch.abandoned:
+                    return None # 协程在发送开始前被取消，名额已由它归还
+                dispatch.started = True
+            permit = dispatch.permit
+        _connect_timing.seconds = 0.0
+        started = time.monotonic()
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except BaseException as e:
+            if governed:
+                self.governor.release(permit)
+            if isinstance(e, requests.exceptions.RequestException):
+                self.metrics.record_request(endpoint, model, None, _connect_timing.seconds, None, time.monotonic() - started, _body_size(getattr(e.request, "body", None)), 0)
+            raise
+        latency = time.monotonic() - started
+        self._record_metrics(response, endpoint, model, started, _connect_timing.seconds, kwargs.get("stream", False))
+        # 流式响应在收到响应头时就归还名额，之后的读取不占用并发窗口
+        if governed:
+            self.governor.release(permit, response.status_code, latency, response.headers.get("Retry-After"))
+        if response.status_code < 400:
+            self.policy.latency.record(endpoint, model, latency)
+        if dispatch is not None:
+            with dispatch.lock:
+                abandoned = dispatch.abandoned
+            if abandoned:
+                response.close() # 没有人会读取这个响应了，及时把连接还给连接池
+        return response
+
+    def _record_metrics(self, response, endpoint, model, started, connect_s, stream):
+        """非流式响应返回时已经读完，立即记录；流式响应在关闭时 (读完或中途停止) 才记录总耗时和接收字节数"""
+        def record(streamed=0):
+            self.metrics.record_request(endpoint, model, response.status_code, connect_s, response.elapsed.total_seconds(),
+                                        time.monotonic() - started, _body_size(response.request.body), _bytes_received(response, streamed))
+        if not stream:
+            record()
+            return
+        close, iter_content, recorded, streamed = response.close, response.iter_content, [], [0]
+        def counting_iter_content(*args, **kwargs): # iter_lines() 也经由 iter_content()
+            for chunk in iter_content(*args, **kwargs):
+                streamed[0] += len(chunk) if isinstance(chunk, bytes) else len(chunk.encode("utf-8"))
+                yield chunk
+        def close_and_record():
+            if not recorded:
+                recorded.append(True)
+                record(streamed[0])
+            close()
+        response.iter_content = counting_iter_content
+        response.close = close_and_record # with 语句退出时同样经由 close()
+
+    def _retry_delay(self, method, endpoint, model, state, timeout, fixed_timeout, response=None, error=None):
+        """一次发送之后的决定：返回 None 表示把 response 交给调用方，返回秒数表示等待后重发；不再重试的异常直接抛出。
+        state 为 {"attempt", "throttled"}，在同一个请求的各次发送之间累计"""
+        if error is not None:
+            if isinstance(error, requests.exceptions.ReadTimeout) and not fixed_timeout:
+                self.policy.latency.record(endpoint, model, timeout[1]) # 超时也算样本：服务整体变慢时超时随之放宽
+            if not self.policy.should_retry(method, endpoint, state["attempt"], error=error):
+                raise error
+        else:
+            if response.status_code in CONGESTION_STATUS and self._governs(endpoint) and state["throttled"] < RATE_LIMIT_RETRIES:
+                # 节流器已按 Retry-After 暂停该通道，重发时会在取得名额时等待，不再额外退避
+                state["throttled"] += 1
+                response.close()
+                return 0.0
+            if not self.policy.should_retry(method, endpoint, state["attempt"], status_code=response.status_code):
+                return None
+            response.close()
+        delay = backoff_delay(state["attempt"])
+        state["attempt"] += 1
+        return delay
+
+    def request(self, method, url, endpoint, **kwargs):
+        """阻塞版本 (在普通线程中调用)：排队和退避都会占用当前线程"""
+        model = request_model(kwargs)
+        fixed_timeout = kwargs.pop("timeout", None)
+        on_retry = kwargs.pop("on_retry", None)
+        state = {"attempt": 0, "throttled": 0}
+        while True:
+            timeout = fixed_timeout or self.timeout_for(endpoint, model, state["attempt"], kwargs.get("stream", False))
+            try:
+                response = self._send(method, url, endpoint, model, dict(kwargs, timeout=timeout))
+            except requests.exceptions.RequestException as e:
+                delay = self._retry_delay(method, endpoint, model, state, timeout, fixed_timeout, error=e)
+            else:
+                delay = self._retry_delay(method, endpoint, model, state, timeout, fixed_timeout, response=response)
+                if delay is None:
+                    return response
+            if on_retry:
+                on_retry(state["attempt"] + state["throttled"])
+            time.sleep(delay)
+            _rewind_files(kwargs)
+
+    async def arequest(self, engine, method, url, endpoint, **kwargs):
+        """协程版本：在事件循环上排队取得名额、等待退避，只把真正的发送交给网络引擎的 I/O 线程"""
+        model = request_model(kwargs)
+        fixed_timeout = kwargs.pop("timeout", None)
+        on_retry = kwargs.pop("on_retry", None)
+        governed = self._governs(endpoint)
+        state = {"attempt": 0, "throttled": 0}
+        while True:
+            timeout = fixed_timeout or self.timeout_for(endpoint, model, state["attempt"], kwargs.get("stream", False))
+            dispatch = _Dispatch(None)
+            try:
+                if governed:
+                    dispatch.permit = await self.governor.acquire_async(endpoint, model)
+                response = await engine.run_blocking(self._send, method, url, endpoint, model, dict(kwargs, timeout=timeout), dispatch)
+            except requests.exceptions.RequestException as e:
+                delay = self._retry_delay(method, endpoint, model, state, timeout, fixed_timeout, error=e)
+            except asyncio.CancelledError:
+                with dispatch.lock:
+                    dispatch.abandoned = True
+                    release = governed and dispatch.permit is not None and not dispatch.started
+                if release:
+                    self.governor.release(dispatch.permit) # 名额已取得但发送还没开始
+                raise
+            else:
+                delay = self._retry_delay(method, endpoint, model, state, timeout, fixed_timeout, response=response)
+                if delay is None:
+                    return response
+            if on_retry:
+                on_retry(state["attempt"] + state["throttled"])
+            await asyncio.sleep(delay)
+            _rewind_files(kwargs)
+
+    def get(self, url, endpoint, **kwargs):
+        return self.request("GET", url, endpoint, **kwargs)
+
+    def post(self, url, endpoint, **kwargs):
+        return self.request("POST", url, endpoint, **kwargs)
+
+    async def aget(self, engine, url, endpoint, **kwargs):
+        return await self.arequest(engine, "GET", url, endpoint, **kwargs)
+
+    async def apost(self, engine, url, endpoint, **kwargs):
+        return await self.arequest(engine, "POST", url, endpoint, **kwargs)
+
+    def connection_stats(self):
+        return self.stats.snapshot()
+
+    def close(self):
+        if self.governor is not None:
+            self.governor.close()
+        self.session.close()
@@ -0,0 +1,264 @@
+import asyncio
+import csv
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+
+from siliconflow_cache import copy_file, payload_digest
+from siliconflow_policy import hedged_call
+
+IMAGE_EXTENSIONS_BY_TYPE = {"image/png": "png", "image/jpeg": "jpg", "image/webp": "webp", "image/gif": "gif"}
+MANIFEST_FILENAME = "manifest.jsonl"
+DOWNLOAD_CHUNK_SIZE = 64 * 1024 # 流式下载图像时每次写盘的字节数
+_IMAGE_URL_PATTERN = re.compile(r"^https?://\S+\.(?:png|jpe?g|webp|gif)(?:\?\S*)?$", re.IGNORECASE)
+# 决定生成结果的参数；只有固定了 seed 的请求结果才可复现，才能缓存
+IMAGE_CACHE_FIELDS = ("model", "prompt", "negative_prompt", "width", "height", "num_inference_steps", "guidance_scale", "seed")
+
+
+def parse_prompt_lines(text):
+    """把粘贴的文本按行拆分为提示词列表 (空行忽略)"""
+    return [{"prompt": line.strip()} for line in text.splitlines() if line.strip()]
+
+
+def load_prompts_file(file_path):
+    """从 CSV / JSONL / TXT 文件读取提示词。
+
+    CSV 需包含 prompt 列，JSONL 每行需包含 prompt 字段；两者都可选带 negative_prompt 和 seed。
+    """
+    ext = os.path.splitext(file_path)[1].lower()
+    items = []
+    with open(file_path, "r", encoding="utf-8-sig", newline="") as f:
+        if ext == ".csv":
+            for row in csv.DictReader(f):
+                items.append(row)
+        elif ext in (".jsonl", ".ndjson"):
+            for line_no, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError as e:
+                    raise ValueError(f"第 {line_no} 行不是有效的 JSON: {e}")
+                items.append(row if isinstance(row, dict) else {"prompt": str(row)})
+        else:
+            return parse_prompt_lines(f.read())
+    prompts = []
+    for row in items:
+        prompt = str(row.get("prompt") or "").strip()
+        if not prompt:
+            continue
+        item = {"prompt": prompt}
+        if str(row.get("negative_prompt") or "").strip():
+            item["negative_prompt"] = str(row["negative_prompt"]).strip()
+        if str(row.get("seed") or "").strip().isdigit():
+            item["seed"] = int(str(row["seed"]).strip())
+        prompts.append(item)
+    return prompts
+
+
+def _walk_image_urls(node):
+    """遍历未知结构的响应，找出看起来像图像地址的字符串 (不再把整个响应序列化后做正则扫描)"""
+    if isinstance(node, dict):
+        for value in node.values():
+            yield from _walk_image_urls(value)
+    elif isinstance(node, list):
+        for value in node:
+            yield from _walk_image_urls(value)
+    elif isinstance(node, str) and _IMAGE_URL_PATTERN.match(node):
+        yield node
+
+
+def extract_image_urls(result):
+    """从生成接口的 JSON 响应中提取所有图像 URL (images[] / data[]，结构不符时再遍历整个响应)"""
+    urls = []
+    for key in ("images", "data"):
+        entries = result.get(key) if isinstance(result, dict) else None
+        if isinstance(entries, list):
+            urls.extend(entry["url"] for entry in entries if isinstance(entry, dict) and entry.get("url"))
+    if not urls:
+        urls = list(_walk_image_urls(result))
+    return list(dict.fromkeys(urls)) # 去重并保持顺序
+
+
+def image_cache_key(payload):
+    """返回生成请求的缓存地址；未固定 seed 时结果随机，返回 None 表示不缓存"""
+    if payload.get("seed") is None:
+        return None
+    return payload_digest(payload, IMAGE_CACHE_FIELDS)
+
+
+def guess_image_extension(url, content_type=None):
+    if content_type:
+        ext = IMAGE_EXTENSIONS_BY_TYPE.get(content_type.split(";")[0].strip().lower())
+        if ext:
+            return ext
+    match = re.search(r"\.(png|jpe?g|webp|gif)(?:\?|$)", url.lower())
+    return match.group(1).replace("jpeg", "jpg") if match else "png"
+
+
+async def request_image_generation(engine, http_client, api_url, payload, headers, hedge=False):
+    """提交文生图请求并返回解析后的 JSON 响应。
+
+    hedge 为 True 且该模型已积累足够的延迟样本时，超过 p95 延迟仍未返回就再发一份相同的请求，
+    取先返回的结果 (多一份请求会多计费，默认关闭)。
+    """
+    async def post():
+        response = await http_client.apost(engine, api_url, "image", json=payload, headers=headers)
+        response.raise_for_status()
+        return response.json()
+    policy = http_client.policy
+    hedge_after = policy.hedge_delay("image", payload.get("model")) if hedge else None
+    return await hedged_call(post, hedge_after, on_hedge=policy.record_hedge)
+
+
+def download_image(http_client, url, directory, on_chunk=None, chunk_size=DOWNLOAD_CHUNK_SIZE):
+    """把图像流式下载到 directory 中的临时文件 (阻塞，在 I/O 线程池中调用)。
+
+    边下载边计算摘要，返回 {"path", "content_type", "ext", "size", "token"}；
+    on_chunk(chunk) 可用于在下载过程中增量预览。
+    """
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".download-", suffix=".part")
+    digest = hashlib.blake2b(digest_size=16); size = 0
+    try:
+        with os.fdopen(fd, "wb") as f, http_client.get(url, "image_download", stream=True) as response:
+            response.raise_for_status()
+            content_type = response.headers.get("Content-Type")
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                if not chunk:
+                    continue
+                f.write(chunk); digest.update(chunk); size += len(chunk)
+                if on_chunk:
+                    on_chunk(chunk)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return {"path": tmp_path, "content_type": content_type, "ext": guess_image_extension(url, content_type), "size": size, "token": digest.hexdigest()}
+
+
+async def download_images(engine, http_client, urls, directory, on_first_chunk=None):
+    """并发下载多张图像，返回与 urls 顺序一致的结果列表；on_first_chunk 只接收第一张图像的数据 (用于预览)"""
+    return await asyncio.gather(*(engine.run_blocking(download_image, http_client, url, directory, on_first_chunk if index == 0 else None) for index, url in enumerate(urls)))
+
+
+def link_or_copy(src, dst):
+    """优先用硬链接 (不复制数据)，跨文件系统等情况下退回到文件复制；目标已存在时替换"""
+    tmp_dst = f"{dst}.{os.getpid()}.tmp"
+    try:
+        os.link(src, tmp_dst)
+    except OSError:
+        shutil.copyfile(src, tmp_dst)
+    os.replace(tmp_dst, dst)
+
+
+class ImageBatchRunner:
+    """在网络引擎上以有界并发执行批量文生图任务，并把每张结果写入输出目录和清单文件"""
+    def __init__(self, http_client, api_url, api_key, base_payload, prompts, n_per_prompt, output_dir,
+                 max_workers=4, on_progress=None, on_result=None, cache=None, hedge=False):
+        self.http_client = http_client
+        self.api_url = api_url
+        self.api_key = api_key
+        self.base_payload = base_payload
+        self.output_dir = output_dir
+        self.max_workers = max(1, int(max_workers))
+        self.on_progress = on_progress
+        self.on_result = on_result
+        self.cache = cache # 可选的 DiskBlobCache，固定 seed 的任务命中时不再请求
+        self.hedge = hedge # 慢于 p95 的请求再发一份 (见 request_image_generation)
+        self.jobs = [(p_index, item, k) for p_index, item in enumerate(prompts) for k in range(max(1, int(n_per_prompt)))]
+        self.total = len(self.jobs)
+        self.completed = 0
+        self.failed = 0
+        self.started_at = None
+        self._cancel_event = threading.Event()
+        self._lock = threading.Lock()
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def images_per_minute(self):
+        if not self.started_at:
+            return 0.0
+        elapsed = time.monotonic() - self.started_at
+        return self.completed / elapsed * 60 if elapsed > 0 else 0.0
+
+    async def run(self, engine):
+        await engine.run_blocking(os.makedirs, self.output_dir, exist_ok=True)
+        self.started_at = time.monotonic()
+        semaphore = asyncio.Semaphore(self.max_workers)
+        async def bounded(job):
+            async with semaphore:
+                await self._run_job(engine, *job)
+        await asyncio.gather(*(bounded(job) for job in self.jobs))
+        return self.completed, self.failed
+
+    def _append_record(self, record):
+        """计数并追加一行清单 (阻塞，在 I/O 线程池中调用)；返回 (完成数, 失败数)"""
+        with self._lock:
+            if record["status"] == "ok":
+                self.completed += 1
+            else:
+                self.failed += 1
+            with open(os.path.join(self.output_dir, MANIFEST_FILENAME), "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            return self.completed, self.failed
+
+    def _build_payload(self, item, k):
+        payload = dict(self.base_payload, prompt=item["prompt"], n=1)
+        if item.get("negative_prompt"):
+            payload["negative_prompt"] = item["negative_prompt"]
+        seed = item.get("seed", self.base_payload.get("seed"))
+        if seed is not None:
+            payload["seed"] = seed + k # 同一提示词的多张图使用相邻种子，避免完全相同
+        return payload
+
+    async def _run_job(self, engine, p_index, item, k):
+        if self.cancelled:
+            return
+        payload = self._build_payload(item, k)
+        record = {"prompt_index": p_index, "image_index": k, "prompt": item["prompt"], "model": payload.get("model"),
+                  "width": payload.get("width"), "height": payload.get("height"), "seed": payload.get("seed")}
+        if payload.get("negative_prompt"):
+            record["negative_prompt"] = payload["negative_prompt"]
+        started = time.monotonic()
+        cache_key = image_cache_key(payload) if self.cache else None
+        try:
+            cached = await engine.run_blocking(self.cache.get_path, cache_key) if cache_key else None
+            if cached:
+                cached_path, meta = cached
+                ext = guess_image_extension(meta.get("url", ""), meta.get("content_type"))
+                file_name = f"{p_index + 1:04d}_{k + 1:02d}.{ext}"
+                await engine.run_blocking(copy_file, cached_path, os.path.join(self.output_dir, file_name)) # 复制出缓存：输出文件被修改不影响缓存条目
+                record.update(status="ok", file=file_name, url=meta.get("url"), cached=True)
+            else:
+                headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+                result = await request_image_generation(engine, self.http_client, self.api_url, payload, headers, self.hedge)
+                urls = extract_image_urls(result)
+                if not urls:
+                    raise ValueError("无法从 API 响应中提取图像 URL")
+                # 直接流式写入输出目录中的临时文件，完成后改名，不在内存中保留整张图
+                download = await engine.run_blocking(download_image, self.http_client, urls[0], self.output_dir)
+                file_name = f"{p_index + 1:04d}_{k + 1:02d}.{download['ext']}"
+                await engine.run_blocking(os.replace, download["path"], os.path.join(self.output_dir, file_name))
+                if cache_key:
+                    await engine.run_blocking(self.cache.put_file, cache_key, os.path.join(self.output_dir, file_name), {"payload": payload, "url": urls[0], "content_type": download["content_type"]})
+                record.update(status="ok", file=file_name, url=urls[0], seed=result.get("seed", record["seed"]))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            record.update(status="error", error=str(e))
+        record["elapsed_s"] = round(time.monotonic() - started, 3)
+        done, failed = await engine.run_blocking(self._append_record, record)
+        if self.on_result:
+            self.on_result(record)
+        if self.on_progress:
+            self.on_progress(done, failed, self.total, self.images_per_minute())
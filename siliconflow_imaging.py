@@ -0,0 +1,201 @@
+import base64
+import hashlib
+import io
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from siliconflow_cache import MemoryLRUCache
+from siliconflow_startup import LazyModule
+
+# PIL 在第一次解码或编码图像时才导入，不拖慢界面启动
+Image = LazyModule("PIL.Image")
+ImageFile = LazyModule("PIL.ImageFile")
+ImageOps = LazyModule("PIL.ImageOps")
+
+THUMBNAIL_SIZE_STEP = 32 # 目标尺寸按该步长取整，窗口微调大小时可以复用同一张缩略图
+DEFAULT_THUMBNAIL_CACHE_ENTRIES = 16
+PREVIEW_INTERVAL = 0.2 # 增量预览两次刷新之间的最小间隔 (秒)
+PREVIEW_MIN_BYTES = 16 * 1024 # 新到达的数据少于该字节数时不刷新预览
+VISION_LOW_DETAIL_SIZE = 448 # detail=low 时服务端把图像缩到该尺寸以内，更高的分辨率只是白白上传
+VISION_HIGH_DETAIL_MAX_SIDE = 2048 # detail=high / auto 时长边上限
+VISION_HIGH_DETAIL_SHORT_SIDE = 768 # detail=high / auto 时短边上限 (服务端按该分辨率切块)
+VISION_WEBP_QUALITY = 85
+VISION_CACHE_MAX_BYTES = 32 * 1024 * 1024 # 已编码图像 (data URI) 的内存缓存上限
+
+
+def image_token(data):
+    """图像字节的短摘要，用作缩略图缓存键"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def bucket_size(width, height, step=THUMBNAIL_SIZE_STEP):
+    return max(step, width // step * step), max(step, height // step * step)
+
+
+def decode_thumbnail(source, max_size):
+    """解码 (图像字节或文件路径) 并缩小到 max_size 以内 (在工作线程中调用)。
+
+    JPEG 先用 draft() 让解码器直接按 1/2、1/4、1/8 比例解码；其他格式解码后先用 reduce()
+    做整数倍的快速盒式缩小，最后只对已经接近目标尺寸的图像做一次 LANCZOS 重采样。
+    """
+    img = Image.open(io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source)
+    if img.format == "JPEG":
+        img.draft("RGB", max_size)
+    img.load()
+    factor = min(img.width // max_size[0], img.height // max_size[1])
+    if factor >= 2:
+        img = img.reduce(factor)
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA" if "A" in img.getbands() or "transparency" in img.info else "RGB")
+    img.thumbnail(max_size, Image.Resampling.LANCZOS)
+    return img
+
+
+class ThumbnailCache:
+    """按 (图像摘要, 目标尺寸) 缓存解码缩小后的 PIL 图像，条目数有上限"""
+    def __init__(self, max_entries=DEFAULT_THUMBNAIL_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token, size):
+        with self._lock:
+            img = self._entries.get((token, size))
+            if img is not None:
+                self._entries.move_to_end((token, size))
+            return img
+
+    def put(self, token, size, img):
+        with self._lock:
+            self._entries[(token, size)] = img
+            self._entries.move_to_end((token, size))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+_TRUNCATED_LOAD_LOCK = threading.Lock()
+
+
+def decode_partial(data, max_size):
+    """解码尚未下载完整的图像：PNG 按已到达的行、基线 JPEG 按已到达的扫描行、渐进式 JPEG 按已到达的扫描遍数"""
+    img = Image.open(io.BytesIO(data))
+    if img.format == "JPEG":
+        img.draft("RGB", max_size)
+    # LOAD_TRUNCATED_IMAGES 是 PIL 的全局开关，只在这次 load() 期间打开
+    with _TRUNCATED_LOAD_LOCK:
+        previous = ImageFile.LOAD_TRUNCATED_IMAGES
+        ImageFile.LOAD_TRUNCATED_IMAGES = True
+        try:
+            img.load()
+        finally:
+            ImageFile.LOAD_TRUNCATED_IMAGES = previous
+    return img
+
+
+class IncrementalPreview:
+    """把下载中的图像字节送入 PIL 的 ImageFile.Parser，按时间间隔生成低分辨率预览 (在下载线程中调用)。
+
+    Parser 能逐块解码的格式 (BMP、PPM 等) 直接使用它正在填充的图像；PNG / JPEG 这类 Parser 只缓存
+    不解码的格式，则对已到达的前缀做一次允许截断的解码。数据不足以解码时跳过本次刷新。
+    """
+    def __init__(self, max_size, interval=PREVIEW_INTERVAL, min_bytes=PREVIEW_MIN_BYTES):
+        self.max_size = max_size
+        self.interval = interval
+        self.min_bytes = min_bytes
+        self.frames = 0
+        self._parser = ImageFile.Parser()
+        self._buffer = bytearray()
+        self._pending_bytes = 0
+        self._last_render = 0.0
+        self._disabled = False
+
+    def feed(self, chunk):
+        """送入一块数据；到了刷新时间且已经能解码出图像时返回缩小后的预览，否则返回 None"""
+        if self._disabled:
+            return None
+        try:
+            self._parser.feed(chunk)
+        except Exception: # 格式无法识别：放弃预览，最终图像照常显示
+            self._disabled = True
+            return None
+        incremental = self._parser.image is not None and self._parser.decoder is not None
+        if incremental:
+            self._buffer = bytearray() # Parser 自己在解码，不需要再保留前缀
+        else:
+            self._buffer += chunk
+        self._pending_bytes += len(chunk)
+        now = time.monotonic()
+        if self._parser.image is None or self._pending_bytes < self.min_bytes or now - self._last_render < self.interval:
+            return None
+        self._pending_bytes = 0
+        self._last_render = now
+        try:
+            partial = self._parser.image if incremental else decode_partial(bytes(self._buffer), self.max_size)
+            preview = self._render(partial)
+        except Exception:
+            return None # 已到达的数据还不够解码，等下一块
+        self.frames += 1
+        return preview
+
+    def _render(self, partial):
+        img = partial
+        factor = min(img.width // self.max_size[0], img.height // self.max_size[1])
+        img = img.reduce(factor) if factor >= 2 else img.copy()
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGB")
+        img.thumbnail(self.max_size, Image.Resampling.BILINEAR) # 预览只求快，最终图像再用 LANCZOS
+        return img
+
+
+def vision_target_size(width, height, detail):
+    """返回视觉模型在该 detail 下实际使用的分辨率 (不放大)"""
+    if detail == "low":
+        scale = VISION_LOW_DETAIL_SIZE / max(width, height)
+    else:
+        scale = min(VISION_HIGH_DETAIL_MAX_SIDE / max(width, height), VISION_HIGH_DETAIL_SHORT_SIDE / min(width, height))
+    if scale >= 1:
+        return width, height
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def encode_vision_image(image_path, detail, quality=VISION_WEBP_QUALITY):
+    """把本地图片缩小到该 detail 实际使用的分辨率，编码为 WEBP data URI (在工作线程中调用)"""
+    with Image.open(image_path) as img:
+        target = vision_target_size(*img.size, detail)
+        if img.format == "JPEG":
+            img.draft("RGB", target) # 大照片直接按 1/2、1/4、1/8 解码
+        img = ImageOps.exif_transpose(img) # 按拍摄方向旋转，否则模型看到的是横躺的照片
+        target = vision_target_size(*img.size, detail)
+        factor = min(img.width // target[0], img.height // target[1])
+        if factor >= 2:
+            img = img.reduce(factor)
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA" if "A" in img.getbands() or "transparency" in img.info else "RGB")
+        if img.size != target:
+            img = img.resize(target, Image.Resampling.LANCZOS)
+        buffer = io.BytesIO()
+        img.save(buffer, format="WEBP", quality=quality)
+    return f"data:image/webp;base64,{base64.b64encode(buffer.getvalue()).decode('ascii')}"
+
+
+class VisionImageEncoder:
+    """按 (路径, 修改时间, 文件大小, detail) 缓存已编码的图片，重复发送同一张图时不再解码和编码"""
+    def __init__(self, max_bytes=VISION_CACHE_MAX_BYTES):
+        self.cache = MemoryLRUCache(max_bytes)
+
+    @staticmethod
+    def cache_key(image_path, detail):
+        stat = os.stat(image_path)
+        return os.path.abspath(image_path), stat.st_mtime_ns, stat.st_size, "low" if detail == "low" else "high" # auto 与 high 的分辨率相同
+
+    def encode(self, image_path, detail):
+        key = self.cache_key(image_path, detail)
+        entry = self.cache.get(key)
+        if entry is not None:
+            return entry[0]
+        data_uri = encode_vision_image(image_path, detail)
+        self.cache.put(key, data_uri, None)
+        return data_uri
+
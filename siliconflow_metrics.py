@@ -0,0 +1,237 @@
+import csv
+import math
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+
+# 直方图桶上界 (Prometheus 的 le 标签)，最后一个桶为 +Inf
+LATENCY_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+TOKEN_RATE_BUCKETS = (1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 200, 400)
+RECENT_RECORDS = 5000 # 为 CSV 导出保留的最近单次请求记录数
+METRIC_PREFIX = "siliconflow"
+CSV_FIELDS = ("timestamp", "kind", "endpoint", "model", "status", "connect_s", "ttfb_s", "total_s", "bytes_out", "bytes_in", "ttft_s", "tokens", "tokens_per_s")
+
+# 直方图名 -> (单位说明, 桶)
+HISTOGRAMS = {
+    "connect_seconds": ("建立 TCP/TLS 连接的耗时 (复用连接记为 0)", LATENCY_BUCKETS),
+    "ttfb_seconds": ("发出请求到收到响应头的耗时", LATENCY_BUCKETS),
+    "total_seconds": ("发出请求到响应体读完的耗时", LATENCY_BUCKETS),
+    "ttft_seconds": ("流式对话发出请求到第一个 token 的耗时", LATENCY_BUCKETS),
+    "tokens_per_second": ("流式对话首个 token 之后的输出速率", TOKEN_RATE_BUCKETS),
+}
+
+
+class Histogram:
+    """累积直方图 (与 Prometheus histogram 语义一致)，分位数按桶内线性插值估算，并限制在观测到的最小 / 最大值之间"""
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # 最后一格是 +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def observe(self, value):
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+        return min(self.max, max(self.min, self._interpolate(q)))
+
+    def _interpolate(self, q):
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                if index == len(self.buckets):
+                    return lower # 落在 +Inf 桶：只知道大于最后一个上界
+                return lower + (self.buckets[index] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def cumulative(self):
+        """[(le, 累计数)]，le 为 "+Inf" 的最后一项等于 count"""
+        total, result = 0, []
+        for bound, count in zip([*self.buckets, math.inf], self.counts):
+            total += count
+            result.append(("+Inf" if bound == math.inf else repr(float(bound)), total))
+        return result
+
+
+class _Series:
+    """一个 (端点, 模型) 的聚合指标"""
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.by_status = {}
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.histograms = {}
+
+    def observe(self, name, value):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram(HISTOGRAMS[name][1])
+        histogram.observe(value)
+
+
+class MetricsRegistry:
+    """按端点和模型聚合每次 API 调用的耗时与流量，线程安全。
+
+    record_request() 由 SiliconFlowHTTPClient 在每个响应读完 (或关闭) 时调用；
+    record_stream() 由流式对话在结束时调用，记录首个 token 时间和输出速率。
+    """
+    def __init__(self, recent=RECENT_RECORDS):
+        self._lock = threading.Lock()
+        self._series = {}
+        self.recent = deque(maxlen=recent)
+        self.started_at = time.time()
+
+    def _get_series(self, endpoint, model):
+        key = (endpoint, model or "")
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = _Series()
+        return series
+
+    def record_request(self, endpoint, model, status, connect_s, ttfb_s, total_s, bytes_out, bytes_in):
+        """status 为 None 表示没有收到响应 (连接失败、超时)"""
+        record = {"timestamp": round(time.time(), 3), "kind": "request", "endpoint": endpoint, "model": model or "", "status": status if status is not None else "error",
+                  "connect_s": _round(connect_s), "ttfb_s": _round(ttfb_s), "total_s": _round(total_s), "bytes_out": bytes_out, "bytes_in": bytes_in}
+        with self._lock:
+            series = self._get_series(endpoint, model)
+            series.requests += 1
+            status_key = str(status) if status is not None else "error"
+            series.by_status[status_key] = series.by_status.get(status_key, 0) + 1
+            if status is None or status >= 400:
+                series.errors += 1
+            series.bytes_out += bytes_out or 0
+            series.bytes_in += bytes_in or 0
+            for name, value in (("connect_seconds", connect_s), ("ttfb_seconds", ttfb_s), ("total_seconds", total_s)):
+                if value is not None:
+                    series.observe(name, value)
+            self.recent.append(record)
+
+    def record_stream(self, endpoint, model, ttft_s, tokens, generation_s):
+        """tokens 按 SSE 增量块计数 (一个增量约为一个 token)；generation_s 为首个到最后一个 token 的时间"""
+        tokens_per_s = tokens / generation_s if generation_s and generation_s > 0 else None
+        record = {"timestamp": round(time.time(), 3), "kind": "stream", "endpoint": endpoint, "model": model or "",
+                  "ttft_s": _round(ttft_s), "tokens": tokens, "tokens_per_s": _round(tokens_per_s)}
+        with self._lock:
+            series = self._get_series(endpoint, model)
+            if ttft_s is not None:
+                series.observe("ttft_seconds", ttft_s)
+            if tokens_per_s is not None:
+                series.observe("tokens_per_second", tokens_per_s)
+            self.recent.append(record)
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+            self.recent.clear()
+            self.started_at = time.time()
+
+    def summary(self):
+        """每个 (端点, 模型) 一行，供指标面板显示 (按请求数从多到少)"""
+        rows = []
+        with self._lock:
+            for (endpoint, model), series in self._series.items():
+                h = series.histograms
+                quantile = lambda name, q: h[name].quantile(q) if name in h else None
+                rows.append({
+                    "endpoint": endpoint, "model": model, "requests": series.requests, "errors": series.errors,
+                    "connect_p50": quantile("connect_seconds", 0.5), "ttfb_p50": quantile("ttfb_seconds", 0.5),
+                    "total_p50": quantile("total_seconds", 0.5), "total_p95": quantile("total_seconds", 0.95),
+                    "bytes_out": series.bytes_out, "bytes_in": series.bytes_in,
+                    "ttft_p50": quantile("ttft_seconds", 0.5), "tokens_per_s_p50": quantile("tokens_per_second", 0.5),
+                })
+        return sorted(rows, key=lambda row: -row["requests"])
+
+    # --- 导出 ---
+    def export_csv(self, path):
+        """导出最近的单次请求 / 流式记录，返回行数"""
+        with self._lock:
+            records = list(self.recent)
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+            writer.writeheader()
+            writer.writerows(records)
+        return len(records)
+
+    def prometheus_text(self):
+        """Prometheus 文本格式 (node_exporter textfile collector 可直接读取)"""
+        with self._lock:
+            series = sorted(self._series.items())
+            lines = []
+            for name, help_text, kind, values in (
+                ("requests_total", "API 请求数", "counter", lambda s: s.by_status),
+                ("request_bytes_total", "请求体字节数", "counter", lambda s: s.bytes_out),
+                ("response_bytes_total", "响应体字节数", "counter", lambda s: s.bytes_in),
+            ):
+                lines += [f"# HELP {METRIC_PREFIX}_{name} {help_text}", f"# TYPE {METRIC_PREFIX}_{name} {kind}"]
+                for (endpoint, model), s in series:
+                    value = values(s)
+                    if isinstance(value, dict):
+                        lines += [f"{METRIC_PREFIX}_{name}{_labels(endpoint, model, status=status)} {count}" for status, count in sorted(value.items())]
+                    else:
+                        lines.append(f"{METRIC_PREFIX}_{name}{_labels(endpoint, model)} {value}")
+            for name, (help_text, _) in HISTOGRAMS.items():
+                present = [(key, s.histograms[name]) for key, s in series if name in s.histograms]
+                if not present:
+                    continue
+                lines += [f"# HELP {METRIC_PREFIX}_{name} {help_text}", f"# TYPE {METRIC_PREFIX}_{name} histogram"]
+                for (endpoint, model), histogram in present:
+                    lines += [f"{METRIC_PREFIX}_{name}_bucket{_labels(endpoint, model, le=le)} {count}" for le, count in histogram.cumulative()]
+                    lines.append(f"{METRIC_PREFIX}_{name}_sum{_labels(endpoint, model)} {histogram.sum:.6f}")
+                    lines.append(f"{METRIC_PREFIX}_{name}_count{_labels(endpoint, model)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def export_prometheus(self, path):
+        """写入 Prometheus 文本文件：先写临时文件再原子替换，采集器不会读到半个文件"""
+        text = self.prometheus_text()
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".metrics-", suffix=".prom.tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+def _round(value, digits=4):
+    return round(value, digits) if value is not None else None
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(endpoint, model, **extra):
+    labels = {"endpoint": endpoint, "model": model, **extra}
+    return "{" + ",".join(f'{key}="{_escape_label(value)}"' for key, value in labels.items()) + "}"
+
+
+def format_seconds(value):
+    if value is None:
+        return "-"
+    return f"{value * 1000:.0f} ms" if value < 1 else f"{value:.2f} s"
+
+
+def format_bytes(value):
+    if value < 1024:
+        return f"{value} B"
+    if value < 1024 * 1024:
+        return f"{value / 1024:.1f} KB"
+    return f"{value / 1024 / 1024:.1f} MB"
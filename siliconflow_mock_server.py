@@ -0,0 +1,410 @@
+"""本地 SiliconFlow 模拟服务器：离线调试界面、批处理和性能基准，不需要真实 API Key。
+
+用法:
+    python siliconflow_mock_server.py --port 8765 --latency 0.2 --error-rate 0.05 --token-rate 40
+    SILICONFLOW_API_BASE=http://127.0.0.1:8765/v1 python siliconflow_suite_gui.py
+
+实现 /v1/models (支持 type / sub_type 过滤和 ETag 条件请求)、/v1/images/generations (返回指向本服务器的
+PNG 地址)、/v1/audio/speech (wav 为正弦波，pcm 为裸采样，其他格式返回静音 MP3 帧)、/v1/audio/transcriptions
+和 /v1/chat/completions (SSE 流式或一次性返回)。任何 Bearer Token 都被接受，缺少 Authorization 时返回 401。
+"""
+import argparse
+import functools
+import hashlib
+import json
+import math
+import random
+import re
+import socket
+import struct
+import sys
+import threading
+import time
+import wave
+import zlib
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from urllib.parse import parse_qs, urlsplit
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_LATENCY = 0.05 # 收到请求到返回响应头的基础延迟 (秒)
+DEFAULT_TOKEN_RATE = 50.0 # 流式聊天每秒输出的 token 数
+DEFAULT_CHAT_TOKENS = 64 # 请求未指定 max_tokens 时每次回复的 token 数
+AUDIO_SAMPLE_RATE = 16000
+AUDIO_SECONDS_PER_CHAR = 0.15 # 合成音频时长与输入字数的比例
+MAX_AUDIO_SECONDS = 120
+AUDIO_STREAM_CHUNK = 8192 # 流式合成每个分块的字节数
+IMAGE_VARIANTS = 16 # 每个尺寸生成的不同图案数 (按 seed 取模)，生成结果会被缓存
+RETRY_AFTER_SECONDS = 1 # 模拟限流 (429) 时的 Retry-After
+
+# 模型目录: (模型 ID, type, sub_type)
+MOCK_MODELS = [
+    ("Kwai-Kolors/Kolors", "image", "text-to-image"),
+    ("black-forest-labs/FLUX.1-schnell", "image", "text-to-image"),
+    ("FunAudioLLM/CosyVoice2-0.5B", "audio", "text-to-speech"),
+    ("fishaudio/fish-speech-1.5", "audio", "text-to-speech"),
+    ("FunAudioLLM/SenseVoiceSmall", "audio", "speech-to-text"),
+    ("Qwen/Qwen2.5-7B-Instruct", "text", "chat"),
+    ("THUDM/glm-4-9b-chat", "text", "chat"),
+    ("deepseek-ai/DeepSeek-R1", "text", "chat"),
+    ("BAAI/bge-m3", "text", "embedding"),
+]
+REASONING_MODEL_PATTERN = re.compile(r"r1|qwq|thinking|reasoning", re.IGNORECASE) # 这些模型先输出 reasoning_content
+REPLY_WORDS = ["这是", "一段", "来自", "模拟", "服务器", "的", "回复", "，", "用于", "离线", "测试", "流式", "输出", "。"]
+MP3_SILENT_FRAME = b"\xff\xfb\x90\x64" + b"\x00" * 413 # MPEG-1 Layer III, 128 kbps, 44.1 kHz, 417 字节 (约 26 ms) 的静音帧
+
+
+class MockSettings:
+    """服务器行为参数，运行中可以直接修改 (各请求线程每次读取最新值)"""
+    def __init__(self, latency=DEFAULT_LATENCY, jitter=0.0, error_rate=0.0, throttle_rate=0.0,
+                 token_rate=DEFAULT_TOKEN_RATE, chat_tokens=DEFAULT_CHAT_TOKENS, seed=None):
+        self.latency = latency
+        self.jitter = jitter # 延迟在 [latency, latency + jitter] 内均匀分布
+        self.error_rate = error_rate # 返回 500 的概率
+        self.throttle_rate = throttle_rate # 返回 429 + Retry-After 的概率
+        self.token_rate = token_rate
+        self.chat_tokens = chat_tokens
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._scripted = deque() # inject() 指定的状态码，优先于随机故障注入
+
+    def random(self):
+        with self._lock:
+            return self._rng.random()
+
+    def inject(self, *statuses):
+        """接下来的请求依次返回这些状态码 (200 表示正常处理)，用于测试可复现的故障序列"""
+        with self._lock:
+            self._scripted.extend(statuses)
+
+    def next_scripted(self):
+        with self._lock:
+            return self._scripted.popleft() if self._scripted else None
+
+    def response_delay(self):
+        return self.latency + (self.random() * self.jitter if self.jitter else 0.0)
+
+
+@functools.lru_cache(maxsize=64)
+def png_bytes(width, height, variant=0):
+    """生成一张渐变图案的 PNG (只用标准库)"""
+    red_offset, green = (variant * 53) % 256, (variant * 97) % 256
+    row = bytearray(width * 3)
+    row[0::3] = bytes((x * 255 // max(1, width - 1) + red_offset) % 256 for x in range(width)) # 红色水平渐变，每行相同
+    row[1::3] = bytes([green]) * width
+    rows = []
+    for y in range(height):
+        row[2::3] = bytes([y * 255 // max(1, height - 1)]) * width # 蓝色垂直渐变
+        rows.append(b"\x00" + bytes(row)) # 每行前的 0 表示不使用 PNG 行过滤
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0) # 8 位 RGB
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(b"".join(rows), 6)) + chunk(b"IEND", b"")
+
+
+def pcm_samples(seconds, sample_rate=AUDIO_SAMPLE_RATE, frequency=400):
+    """16 位单声道正弦波采样：只计算一个周期再重复 (frequency 应整除 sample_rate)"""
+    period = sample_rate // frequency
+    cycle = b"".join(struct.pack("<h", int(8000 * math.sin(2 * math.pi * i / period))) for i in range(period))
+    count = int(seconds * sample_rate)
+    return (cycle * (count // period + 1))[:count * 2]
+
+
+def wav_bytes(seconds, sample_rate=AUDIO_SAMPLE_RATE, frequency=400):
+    buffer = BytesIO()
+    with wave.open(buffer, "wb") as wav_file:
+        wav_file.setnchannels(1); wav_file.setsampwidth(2); wav_file.setframerate(sample_rate)
+        wav_file.writeframes(pcm_samples(seconds, sample_rate, frequency))
+    return buffer.getvalue()
+
+
+def speech_bytes(text, audio_format):
+    """按字数决定时长；返回 (音频字节, Content-Type)"""
+    seconds = min(MAX_AUDIO_SECONDS, max(0.5, len(text) * AUDIO_SECONDS_PER_CHAR))
+    if audio_format == "wav":
+        return wav_bytes(seconds), "audio/wav"
+    if audio_format == "pcm":
+        return pcm_samples(seconds), "audio/pcm"
+    return MP3_SILENT_FRAME * int(seconds / 0.026), "audio/mpeg"
+
+
+def reply_tokens(count, offset=0):
+    return [REPLY_WORDS[(offset + i) % len(REPLY_WORDS)] for i in range(count)]
+
+
+class MockAPIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # keep-alive，客户端的连接复用与真实服务一致
+    server_version = "SiliconFlowMock/1.0"
+
+    def setup(self):
+        super().setup()
+        # 响应头和响应体分两次写出，不关 Nagle 时小响应会卡在客户端的延迟确认上 (约 40 ms)，测出的延迟失真
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    # --- 响应辅助 ---
+    def _send(self, status, body=b"", content_type="application/json", headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _send_json(self, status, data, headers=None):
+        self._send(status, json.dumps(data, ensure_ascii=False).encode("utf-8"), headers=headers)
+
+    def _error(self, status, message, headers=None):
+        self._send_json(status, {"code": status, "message": message, "data": None}, headers)
+
+    def _start_chunked(self, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+
+    def _write_chunk(self, data):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def _end_chunked(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _read_json(self):
+        try:
+            return json.loads(self._read_body() or b"{}")
+        except json.JSONDecodeError:
+            return None
+
+    def _admit(self):
+        """鉴权、模拟延迟和故障注入；返回 False 表示已经发送了错误响应"""
+        if not self.headers.get("Authorization", "").startswith("Bearer "):
+            self._error(401, "Invalid token")
+            return False
+        settings = self.server.settings
+        time.sleep(settings.response_delay())
+        scripted = settings.next_scripted()
+        if scripted == 429:
+            self._error(429, "Request was rejected due to rate limiting.", {"Retry-After": str(RETRY_AFTER_SECONDS)})
+            return False
+        if scripted is not None and scripted >= 400:
+            self._error(scripted, f"HTTP {scripted} (injected by mock server)")
+            return False
+        if scripted is not None:
+            return True
+        roll = settings.random()
+        if roll < settings.throttle_rate:
+            self._error(429, "Request was rejected due to rate limiting.", {"Retry-After": str(RETRY_AFTER_SECONDS)})
+            return False
+        if roll < settings.throttle_rate + settings.error_rate:
+            self._error(500, "Internal server error (injected by mock server)")
+            return False
+        return True
+
+    # --- 路由 ---
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path.startswith("/files/"):
+            self._serve_image(url.path) # 图像下载不经过故障注入 (真实服务由 CDN 提供)
+        elif url.path == "/v1/models":
+            if self._admit():
+                self._models(parse_qs(url.query))
+        else:
+            self._error(404, f"Not found: {url.path}")
+
+    def do_POST(self):
+        path = urlsplit(self.path).path
+        handlers = {
+            "/v1/images/generations": self._images,
+            "/v1/audio/speech": self._speech,
+            "/v1/audio/transcriptions": self._transcriptions,
+            "/v1/chat/completions": self._chat,
+        }
+        handler = handlers.get(path)
+        if handler is None:
+            self._read_body()
+            self._error(404, f"Not found: {path}")
+            return
+        if path == "/v1/audio/transcriptions":
+            body = self._read_body() # multipart 上传，不解析成 JSON
+        else:
+            body = self._read_json()
+            if body is None:
+                self._error(400, "Request body is not valid JSON")
+                return
+        if self._admit():
+            handler(body)
+
+    def _models(self, query):
+        wanted_type, wanted_sub_type = (query.get("type") or [None])[0], (query.get("sub_type") or [None])[0]
+        data = [{"id": model_id, "object": "model", "created": 0, "owned_by": model_id.split("/")[0]}
+                for model_id, model_type, sub_type in MOCK_MODELS
+                if (wanted_type is None or model_type == wanted_type) and (wanted_sub_type is None or sub_type == wanted_sub_type)]
+        body = json.dumps({"object": "list", "data": data}).encode("utf-8")
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()[:16]
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304); self.send_header("ETag", etag); self.send_header("Content-Length", "0"); self.end_headers()
+            return
+        self._send(200, body, headers={"ETag": etag})
+
+    def _images(self, payload):
+        if "image_size" in payload:
+            width, height = map(int, str(payload["image_size"]).lower().split("x"))
+        else:
+            width, height = int(payload.get("width", 1024)), int(payload.get("height", 1024))
+        seed = payload.get("seed")
+        seed = int(seed) if seed not in (None, "") else int(self.server.settings.random() * 2 ** 31)
+        count = max(1, int(payload.get("batch_size") or payload.get("n") or 1))
+        host = self.headers.get("Host") or "%s:%d" % self.server.server_address[:2]
+        images = [{"url": f"http://{host}/files/{width}x{height}/{(seed + i) % IMAGE_VARIANTS}.png"} for i in range(count)]
+        self._send_json(200, {"images": images, "data": images, "timings": {"inference": round(self.server.settings.latency, 3)}, "seed": seed})
+
+    def _serve_image(self, path):
+        match = re.fullmatch(r"/files/(\d+)x(\d+)/(\d+)\.png", path)
+        if not match:
+            self._error(404, "Unknown image")
+            return
+        width, height, variant = (int(g) for g in match.groups())
+        if not (0 < width <= 4096 and 0 < height <= 4096):
+            self._error(400, "Unsupported image size")
+            return
+        self._send(200, png_bytes(width, height, variant % IMAGE_VARIANTS), "image/png", {"Cache-Control": "max-age=3600"})
+
+    def _speech(self, payload):
+        if not payload.get("input"):
+            self._error(400, "input is required")
+            return
+        audio, content_type = speech_bytes(payload["input"], payload.get("response_format", "mp3"))
+        if not payload.get("stream"):
+            self._send(200, audio, content_type)
+            return
+        self._start_chunked(content_type)
+        for offset in range(0, len(audio), AUDIO_STREAM_CHUNK):
+            self._write_chunk(audio[offset:offset + AUDIO_STREAM_CHUNK])
+        self._end_chunked()
+
+    def _transcriptions(self, body):
+        if b'name="file"' not in body:
+            self._error(400, "file is required")
+            return
+        self._send_json(200, {"text": f"这是模拟服务器的转录结果，上传了 {len(body)} 字节。"})
+
+    def _chat(self, payload):
+        if not payload.get("messages"):
+            self._error(400, "messages is required")
+            return
+        settings, model = self.server.settings, payload.get("model", "")
+        tokens = reply_tokens(min(int(payload.get("max_tokens") or settings.chat_tokens), settings.chat_tokens))
+        reasoning = reply_tokens(len(tokens) // 2, offset=3) if REASONING_MODEL_PATTERN.search(model) else []
+        completion_id = f"chatcmpl-mock-{int(time.time() * 1000)}"
+        usage = {"prompt_tokens": sum(len(str(m.get("content", ""))) for m in payload["messages"]), "completion_tokens": len(tokens) + len(reasoning)}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        if not payload.get("stream"):
+            time.sleep((len(tokens) + len(reasoning)) / settings.token_rate if settings.token_rate > 0 else 0)
+            message = {"role": "assistant", "content": "".join(tokens)}
+            if reasoning:
+                message["reasoning_content"] = "".join(reasoning)
+            self._send_json(200, {"id": completion_id, "object": "chat.completion", "model": model, "usage": usage,
+                                  "choices": [{"index": 0, "message": message, "finish_reason": "stop"}]})
+            return
+        self._start_chunked("text/event-stream")
+        def event(delta, finish_reason=None, **extra):
+            data = {"id": completion_id, "object": "chat.completion.chunk", "model": model, "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}], **extra}
+            self._write_chunk(b"data: " + json.dumps(data, ensure_ascii=False).encode("utf-8") + b"\n\n")
+        try:
+            interval = 1 / settings.token_rate if settings.token_rate > 0 else 0
+            next_at = time.monotonic()
+            for key, pieces in (("reasoning_content", reasoning), ("content", tokens)):
+                for piece in pieces:
+                    next_at += interval
+                    time.sleep(max(0.0, next_at - time.monotonic())) # 按绝对时间排程，整体速率不受 sleep 误差累积影响
+                    event({key: piece})
+            event({}, "stop", usage=usage)
+            self._write_chunk(b"data: [DONE]\n\n")
+            self._end_chunked()
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True # 客户端中途停止接收
+
+
+class MockSiliconFlowServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, settings=None, verbose=False):
+        super().__init__((host, port), MockAPIHandler)
+        self.settings = settings or MockSettings()
+        self.verbose = verbose
+        self._thread = None
+
+    def handle_error(self, request, client_address):
+        if isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            return # 客户端断开 (停止接收、退出时关闭连接池)，不是服务器错误
+        super().handle_error(request, client_address)
+
+    @property
+    def api_base(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        """在后台线程中运行 (基准测试等同进程使用)，返回自身"""
+        self._thread = threading.Thread(target=self.serve_forever, name="siliconflow-mock", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread:
+            self._thread.join()
+
+
+def add_settings_arguments(parser):
+    """模拟服务器行为参数 (与基准测试共用)"""
+    parser.add_argument("--latency", type=float, default=DEFAULT_LATENCY, help=f"每个请求的基础延迟 (秒，默认 {DEFAULT_LATENCY})")
+    parser.add_argument("--jitter", type=float, default=0.0, help="在基础延迟上叠加的随机延迟上限 (秒)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 500 的概率 (0~1)")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="返回 429 的概率 (0~1)")
+    parser.add_argument("--token-rate", type=float, default=DEFAULT_TOKEN_RATE, help=f"流式聊天每秒 token 数 (默认 {DEFAULT_TOKEN_RATE:g})")
+    parser.add_argument("--chat-tokens", type=int, default=DEFAULT_CHAT_TOKENS, help=f"每次聊天回复的 token 数 (默认 {DEFAULT_CHAT_TOKENS})")
+    parser.add_argument("--seed", type=int, default=None, help="随机数种子 (故障注入可复现)")
+
+
+def settings_from_args(args):
+    return MockSettings(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, throttle_rate=args.throttle_rate,
+                        token_rate=args.token_rate, chat_tokens=args.chat_tokens, seed=args.seed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="本地 SiliconFlow 模拟服务器")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"监听端口 (默认 {DEFAULT_PORT}，0 表示随机)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="打印每个请求")
+    add_settings_arguments(parser)
+    args = parser.parse_args(argv)
+    server = MockSiliconFlowServer(args.host, args.port, settings_from_args(args), verbose=args.verbose)
+    print(f"模拟服务器已启动: {server.api_base}  (Ctrl+C 退出)", flush=True)
+    print(f"界面或批处理可设置 SILICONFLOW_API_BASE={server.api_base}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -3,6 +3,7 @@ from tkinter import ttk, scrolledtext, messagebox
 import requests
 import threading
 import json
+from siliconflow_models import classify_models
 
 # --- API 配置 ---
 MODELS_API_URL = "https://api.siliconflow.cn/v1/models"
@@ -97,20 +98,10 @@ class SiliconFlowModelCheckerApp(tk.Tk):
             print(models_data)
             print("--- END DEBUG ---")
 
-            image_models = []
-            tts_models = []
-            # 假设返回的数据结构是 {'data': [{'id': 'model_name', ...}, ...]}
-            if 'data' in models_data and isinstance(models_data['data'], list):
-                for model_info in models_data['data']:
-                    model_id = model_info.get('id', '').lower()
-                    model_id_original = model_info.get('id', '未知ID') # 保留原始大小写
-
-                    # 筛选文生图模型 (更宽松的条件)
-                    if 'stable-diffusion' in model_id or 'sdxl' in model_id or 'flux' in model_id or 'kolors' in model_id or 'image' in model_id or 'sd3' in model_id:
-                         image_models.append(model_id_original)
-                    # 筛选文本转语音模型
-                    elif 'audio' in model_id or 'speech' in model_id or 'tts' in model_id or 'voice' in model_id:
-                         tts_models.append(model_id_original)
+            # 与工具套件共用同一张分类规则表 (siliconflow_models.py)
+            catalog = classify_models(models_data)
+            image_models = catalog["image"]
+            tts_models = catalog["tts"]
 
             status_msg = []
             if image_models:
@@ -0,0 +1,220 @@
+import hashlib
+import json
+import os
+import random
+import re
+import tempfile
+import time
+
+DEFAULT_CATALOG_TTL = 24 * 3600 # 模型目录缓存有效期 (秒)
+MODEL_CATEGORIES = ("image", "tts", "asr", "chat")
+
+# --- 模型分类规则表 (按优先级排列，先命中者生效) ---
+# 每条规则: (类别, 包含任一关键词即命中, 同时包含任一关键词则不命中)；类别为 None 表示直接排除
+MODEL_CLASSIFICATION_RULES = [
+    (None, ["embed", "bge-", "bce-", "reranker"], []), # 明确排除 embedding/reranker 模型
+    ("image", ["stable-diffusion", "sdxl", "flux", "kolors", "image", "sd3"], []),
+    ("asr", ["sensevoice", "asr", "transcription", "whisper"], []), # 放在 TTS 之前：FunAudioLLM/SenseVoice 含有 "audio"
+    ("tts", ["audio", "speech", "tts", "cosyvoice", "fish", "sovits"], ["vl", "chat", "instruct"]),
+    ("chat", ["chat", "instruct", "llama", "qwen", "deepseek", "mistral", "mixtral", "gemma", "glm", "yi", "chatglm", "internlm",
+              "coder", "vl", "preview", "distill", "rumination", "glm-z1", "qwen3", "v2.5", "v3", "qwq", "qvq", "-r1", "-z1",
+              "-a3b", "-a22b", "vision", "reasoning", "internvl"], []),
+]
+
+# /v1/models 支持按 type / sub_type 在服务端过滤时使用的查询参数
+SERVER_SIDE_FILTERS = {
+    "image": {"type": "image", "sub_type": "text-to-image"},
+    "tts": {"type": "audio", "sub_type": "text-to-speech"},
+    "asr": {"type": "audio", "sub_type": "speech-to-text"},
+    "chat": {"type": "text", "sub_type": "chat"},
+}
+
+
+def _compile_alternation(keywords):
+    """把关键词列表编译为一个正则交替式 (长词优先)，由正则引擎在 C 层一次扫描完成"""
+    if not keywords:
+        return None
+    return re.compile("|".join(re.escape(k.lower()) for k in sorted(set(keywords), key=len, reverse=True)))
+
+
+class ModelClassifier:
+    """把规则表编译一次；每个模型 ID 对每条规则只做一次正则搜索，命中即停止，结果按 ID 记忆化"""
+    def __init__(self, rules=MODEL_CLASSIFICATION_RULES):
+        self.rules = [(category, _compile_alternation(include), _compile_alternation(exclude)) for category, include, exclude in rules]
+        self._memo = {} # 同一目录反复刷新时 ID 大多不变，直接查表
+
+    def classify_id(self, model_id):
+        """返回模型 ID 所属类别；被排除或未识别时返回 None"""
+        try:
+            return self._memo[model_id]
+        except KeyError:
+            pass
+        lowered = model_id.lower()
+        result = None
+        for category, include, exclude in self.rules:
+            if include.search(lowered) and not (exclude and exclude.search(lowered)):
+                result = category
+                break
+        self._memo[model_id] = result
+        return result
+
+    def classify(self, model_ids):
+        """返回 {类别: 排序去重后的模型 ID 列表}"""
+        detected = {category: set() for category in MODEL_CATEGORIES}
+        for model_id in model_ids:
+            category = self.classify_id(model_id)
+            if category is not None:
+                detected[category].add(model_id)
+        return {category: sorted(models) for category, models in detected.items()}
+
+
+DEFAULT_CLASSIFIER = ModelClassifier()
+
+
+def model_ids_from_response(models_data):
+    """从 /v1/models 响应中取出模型 ID 列表 (格式不符时返回空列表)"""
+    if isinstance(models_data, dict) and isinstance(models_data.get("data"), list):
+        return [info["id"] for info in models_data["data"] if isinstance(info, dict) and info.get("id")]
+    return []
+
+
+def classify_models(models_data, classifier=DEFAULT_CLASSIFIER):
+    """把 /v1/models 的响应分为文生图 / TTS / ASR / 聊天四类"""
+    return classifier.classify(model_ids_from_response(models_data))
+
+
+def server_filters_applied(filtered_ids):
+    """判断服务端是否真的按 type/sub_type 过滤了：若各类别返回完全相同的非空列表，说明参数被忽略"""
+    id_sets = [frozenset(ids) for ids in filtered_ids.values() if ids]
+    return not (len(id_sets) > 1 and len(set(id_sets)) == 1)
+
+
+def diff_model_lists(old_models, new_models):
+    """返回 (新增的模型, 移除的模型)，均保持新/旧列表中的顺序"""
+    old_set, new_set = set(old_models), set(new_models)
+    return [m for m in new_models if m not in old_set], [m for m in old_models if m not in new_set]
+
+
+class ModelCatalogCache:
+    """把分类后的模型目录按 API Key 持久化到本地，并保存 ETag / Last-Modified 以便条件刷新"""
+    def __init__(self, cache_dir, ttl=DEFAULT_CATALOG_TTL):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+
+    def path_for(self, api_key):
+        # 不在磁盘上保存 Key 本身，只用它的摘要区分不同账户
+        key_digest = hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.cache_dir, f"model_catalog_{key_digest}.json")
+
+    def load(self, api_key):
+        """读取缓存条目；不存在或已损坏时返回 None"""
+        try:
+            with open(self.path_for(api_key), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(entry, dict) or not isinstance(entry.get("catalog"), dict):
+            return None
+        return entry
+
+    def is_stale(self, entry):
+        return time.time() - entry.get("fetched_at", 0) > self.ttl
+
+    def validator_for(self, entry, query_key, source):
+        """返回某个查询上次响应的 ETag / Last-Modified；目录来源不同时不可复用"""
+        if not entry or entry.get("source") != source:
+            return None
+        return entry.get("validators", {}).get(query_key)
+
+    @staticmethod
+    def conditional_headers(validator):
+        """根据保存的校验值生成 If-None-Match / If-Modified-Since 请求头"""
+        headers = {}
+        if validator and validator.get("etag"):
+            headers["If-None-Match"] = validator["etag"]
+        if validator and validator.get("last_modified"):
+            headers["If-Modified-Since"] = validator["last_modified"]
+        return headers
+
+    def save(self, api_key, catalog, source, validators=None):
+        """source: "server" (服务端 type/sub_type 过滤) 或 "local" (完整列表 + 本地规则分类)"""
+        entry = {"fetched_at": time.time(), "source": source, "validators": validators or {},
+                 "catalog": {category: list(catalog.get(category, [])) for category in MODEL_CATEGORIES}}
+        self._write(api_key, entry)
+        return entry
+
+    def touch(self, api_key, entry):
+        """服务器返回 304 时只刷新时间戳"""
+        entry["fetched_at"] = time.time()
+        self._write(api_key, entry)
+        return entry
+
+    def _write(self, api_key, entry):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.path_for(api_key)
+        # 先写临时文件再替换，避免程序中途退出留下半个 JSON
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix=".catalog-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False, indent=1)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+# --- 分类性能基准 ---
+def _synthetic_model_ids(count, seed=0):
+    """生成形如 "Org/Family-Variant-7B-Instruct" 的合成模型 ID"""
+    rng = random.Random(seed)
+    orgs = ["Qwen", "deepseek-ai", "THUDM", "BAAI", "FunAudioLLM", "fishaudio", "black-forest-labs", "Kwai-Kolors", "stabilityai", "acme", "meta-llama", "Pro/Qwen", "LoRA/acme"]
+    families = ["Qwen2.5", "DeepSeek-V3", "glm-4", "bge-m3", "SenseVoiceSmall", "CosyVoice2", "fish-speech", "FLUX.1", "Kolors", "stable-diffusion-3-5", "Widget", "Llama-3.1", "InternVL2", "whisper"]
+    suffixes = ["", "-Instruct", "-Chat", "-VL", "-R1-Distill", "-large", "-schnell", "-0.5B", "-Coder", "-embed", "-tts", "-preview"]
+    return [f"{rng.choice(orgs)}/{rng.choice(families)}-{rng.randint(1, 999)}B{rng.choice(suffixes)}" for _ in range(count)]
+
+
+def _classify_naive(model_ids, rules=MODEL_CLASSIFICATION_RULES):
+    """逐关键词 any(... in ...) 的参考实现，仅用于基准对比"""
+    detected = {category: set() for category in MODEL_CATEGORIES}
+    for model_id in model_ids:
+        lowered = model_id.lower()
+        for category, include, exclude in rules:
+            if any(k in lowered for k in include) and not any(k in lowered for k in exclude):
+                if category is not None:
+                    detected[category].add(model_id)
+                break
+    return {category: sorted(models) for category, models in detected.items()}
+
+
+def benchmark_classifier(sizes=(10000, 20000, 40000), repeat=3):
+    """对不同规模的合成目录计时，返回 [(规模, 编译规则 µs/ID, 记忆化后再次分类 µs/ID, 朴素实现 µs/ID)]"""
+    results = []
+    for size in sizes:
+        model_ids = _synthetic_model_ids(size, seed=size)
+        assert ModelClassifier().classify(model_ids) == _classify_naive(model_ids), "编译规则与参考实现结果不一致"
+        # 每次计时都使用新实例，避免记忆化结果让后几轮变成纯查表
+        compiled = min(_timed(ModelClassifier().classify, model_ids) for _ in range(repeat))
+        warm_classifier = ModelClassifier()
+        warm_classifier.classify(model_ids)
+        warm = min(_timed(warm_classifier.classify, model_ids) for _ in range(repeat))
+        naive = min(_timed(_classify_naive, model_ids) for _ in range(repeat))
+        results.append((size, compiled / size * 1e6, warm / size * 1e6, naive / size * 1e6))
+    return results
+
+
+def _timed(func, *args):
+    started = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - started
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="模型 ID 分类微基准")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 20000, 40000], help="合成目录规模")
+    parser.add_argument("--repeat", type=int, default=3, help="每个规模重复次数 (取最快一次)")
+    args = parser.parse_args()
+    print(f"{'模型数':>8} {'编译规则 µs/ID':>16} {'记忆化 µs/ID':>14} {'朴素实现 µs/ID':>16}")
+    for size, compiled_us, warm_us, naive_us in benchmark_classifier(args.sizes, args.repeat):
+        print(f"{size:>8} {compiled_us:>16.2f} {warm_us:>14.2f} {naive_us:>16.2f}")
@@ -0,0 +1,145 @@
+import asyncio
+import random
+import threading
+from collections import deque
+
+DEFAULT_RETRIES = 3 # 瞬时故障的自动重试次数 (不含首次请求)
+BACKOFF_BASE = 0.5 # 第一次重试前的最长等待 (秒)，之后逐次翻倍
+BACKOFF_CAP = 8.0 # 单次重试等待的上限 (秒)
+RETRYABLE_STATUS = (500, 502, 504) # 503 与 429 一样表示过载、请求未被处理，由节流器暂停通道后重发 (见 siliconflow_ratelimit.CONGESTION_STATUS)
+# 重复发送不会产生副作用的端点：GET 请求，以及结果只取决于输入的语音合成 / 识别。
+# 文生图和聊天重复发送会重复计费 (聊天还可能已经输出了一部分)，只在请求确定没有发出 (连接超时) 时重试
+IDEMPOTENT_ENDPOINTS = ("models", "image_download", "tts", "asr")
+LATENCY_WINDOW = 200 # 每个 (端点, 模型) 保留的最近延迟样本数
+MIN_LATENCY_SAMPLES = 20 # 样本少于该数量时沿用配置的超时，不做对冲
+TIMEOUT_PERCENTILE = 0.99
+TIMEOUT_MULTIPLIER = 3.0 # 读取超时 = p99 延迟 x 该倍数 (不超过配置值)
+MIN_READ_TIMEOUT = 10.0 # 自适应读取超时的下限 (秒)
+HEDGE_PERCENTILE = 0.95 # 超过该分位延迟仍未返回的文生图请求会再发一份
+
+
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_CAP):
+    """第 attempt 次重试 (从 0 开始) 前的等待时间：全抖动指数退避，避免多个请求同时重试"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def percentile(samples, q):
+    """最近邻插值的分位数 (samples 已排序)"""
+    return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+class LatencyTracker:
+    """按 (端点, 模型) 保存最近的延迟样本 (收到响应头为止)，线程安全"""
+    def __init__(self, window=LATENCY_WINDOW, min_samples=MIN_LATENCY_SAMPLES):
+        self.window = window
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._samples = {}
+
+    def record(self, endpoint, model, seconds):
+        key = (endpoint, model or "")
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = self._samples[key] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def percentile(self, endpoint, model, q):
+        """样本不足时返回 None"""
+        with self._lock:
+            samples = self._samples.get((endpoint, model or ""))
+            if samples is None or len(samples) < self.min_samples:
+                return None
+            ordered = sorted(samples)
+        return percentile(ordered, q)
+
+
+class RequestPolicy:
+    """重试、自适应超时与对冲的决策 (由 SiliconFlowHTTPClient 调用，本身不发请求)"""
+    def __init__(self, retries=DEFAULT_RETRIES, idempotent_endpoints=IDEMPOTENT_ENDPOINTS, tracker=None):
+        self.retries = retries
+        self.idempotent_endpoints = set(idempotent_endpoints)
+        self.latency = tracker or LatencyTracker()
+        self._lock = threading.Lock()
+        self.retried = 0
+        self.hedges = 0
+        self.hedges_won = 0
+
+    def is_idempotent(self, method, endpoint):
+        return method in ("GET", "HEAD") or endpoint in self.idempotent_endpoints
+
+    def should_retry(self, method, endpoint, attempt, error=None, status_code=None):
+        """第 attempt 次请求 (从 0 开始) 失败后是否再试一次"""
+        if attempt >= self.retries:
+            return False
+        import requests # 只有失败时才会走到这里，此时 requests 早已加载
+        if isinstance(error, requests.exceptions.ConnectTimeout):
+            retry = True # 连接都没建立，请求肯定没有发出
+        elif not self.is_idempotent(method, endpoint):
+            retry = False
+        elif error is not None:
+            retry = isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout, requests.exceptions.ChunkedEncodingError))
+        else:
+            retry = status_code in RETRYABLE_STATUS
+        if retry:
+            with self._lock:
+                self.retried += 1
+        return retry
+
+    def read_timeout(self, endpoint, model, ceiling, attempt=0):
+        """按观测到的 p99 延迟收紧读取超时；重试时放宽到配置值，避免慢但正常的请求被反复截断"""
+        if attempt > 0:
+            return ceiling
+        observed = self.latency.percentile(endpoint, model, TIMEOUT_PERCENTILE)
+        if observed is None:
+            return ceiling
+        return min(ceiling, max(MIN_READ_TIMEOUT, observed * TIMEOUT_MULTIPLIER))
+
+    def hedge_delay(self, endpoint, model):
+        """对冲请求的触发时间 (p95 延迟)；样本不足时返回 None (不对冲)"""
+        return self.latency.percentile(endpoint, model, HEDGE_PERCENTILE)
+
+    def record_hedge(self, won):
+        with self._lock:
+            self.hedges += 1
+            self.hedges_won += int(won)
+
+    def snapshot(self):
+        with self._lock:
+            return {"retried": self.retried, "hedges": self.hedges, "hedges_won": self.hedges_won}
+
+
+async def hedged_call(make_call, hedge_after, on_hedge=None):
+    """运行协程 make_call()；超过 hedge_after 秒仍未返回时再运行一份，返回先成功的结果。
+
+    落后的一份会被取消；已经在 I/O 线程中发出的请求无法中途停止，其响应由 HTTP 客户端读完后丢弃。
+    on_hedge(won) 在发起了对冲时回调，won 表示是否由对冲的那一份先返回。两份都失败时抛出最后一个异常。
+    """
+    tasks = [asyncio.ensure_future(make_call())]
+    try:
+        if hedge_after is not None:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+            if not done:
+                tasks.append(asyncio.ensure_future(make_call()))
+        pending, error = set(tasks), None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if len(tasks) > 1 and on_hedge:
+                        on_hedge(task is tasks[1])
+                    return task.result()
+                error = task.exception()
+        if len(tasks) > 1 and on_hedge:
+            on_hedge(False)
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel() # 落后的一份：还在排队时直接放弃名额，已发出的请求在线程中跑完后被丢弃
+
+
+def format_policy_stats(stats):
+    text = f"自动重试 {stats['retried']} 次"
+    if stats["hedges"]:
+        text += f"，对冲 {stats['hedges']} 次 (对冲先返回 {stats['hedges_won']} 次)"
+    return text
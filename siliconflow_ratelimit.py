@@ -0,0 +1,231 @@
+import asyncio
+import threading
+import time
+
+# --- 默认限额 (按账户等级调整) ---
+# 端点 -> (每分钟请求数, 并发上限)；同一端点下每个模型各有一条独立的通道
+DEFAULT_RATE_LIMITS = {
+    "models": (60, 4),
+    "image": (60, 8),
+    "tts": (120, 8),
+    "asr": (120, 8),
+    "chat": (300, 16),
+}
+CONGESTION_STATUS = (429, 503) # 视为超出账户限额 / 服务端过载的状态码
+DEFAULT_BACKOFF = 1.0 # 响应没有 Retry-After 时的暂停时间 (秒)，连续受限时逐次翻倍
+MAX_PAUSE = 120.0 # 单次暂停的上限 (秒)，防止异常的 Retry-After 把通道卡死
+DECREASE_FACTOR = 0.5 # 收到 429 时并发上限乘以该系数 (AIMD 的乘性减)
+LATENCY_DECREASE_FACTOR = 0.9 # 延迟明显升高时的温和乘性减
+LATENCY_BACKOFF_RATIO = 2.5 # 平滑延迟超过基线的该倍数时视为排队，开始降低并发
+LATENCY_SMOOTHING = 0.2 # 延迟指数平滑系数
+BASELINE_DRIFT = 1.002 # 基线延迟每个样本缓慢上浮，负载或参数变化后能重新适应
+
+
+def parse_retry_after(value, now=None):
+    """解析 Retry-After (秒数或 HTTP 日期)，返回需要等待的秒数；无法解析时返回 None"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    import email.utils # HTTP 日期格式很少见，用到时再导入 (不拖慢界面启动)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when is None:
+        return None
+    return max(0.0, when.timestamp() - (now if now is not None else time.time()))
+
+
+class RateLimiterClosed(RuntimeError):
+    """应用退出时仍在排队等待的请求收到该异常"""
+
+
+class _Lane:
+    """一个 (端点, 模型) 通道：令牌桶 + AIMD 并发窗口 + Retry-After 暂停"""
+    def __init__(self, requests_per_minute, max_concurrency, now):
+        self.rate = requests_per_minute / 60.0
+        self.capacity = float(max(1, max_concurrency)) # 允许的突发量
+        self.tokens = self.capacity
+        self.refilled_at = now
+        self.max_concurrency = max(1, max_concurrency)
+        self.limit = float(self.max_concurrency) # 从上限开始，受限后再退让
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.consecutive_throttles = 0
+        self.decreased_at = 0.0
+        self.smoothed_latency = None
+        self.baseline_latency = None
+        self.requests = 0
+        self.throttled = 0
+        self.async_waiters = [] # [(事件循环, future)]：在事件循环上等待名额的协程
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.refilled_at) * self.rate)
+        self.refilled_at = now
+
+    def wait_time(self, now):
+        """还需要等待多久才能发出请求；0 表示立即可以发出，None 表示等待其他请求完成"""
+        if self.paused_until > now:
+            return self.paused_until - now
+        if self.in_flight >= int(self.limit):
+            return None
+        self.refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def decrease(self, factor, now):
+        # 同一批并发请求一起受限时只退让一次：距上次退让不足一个平滑延迟的不再降低
+        window = self.smoothed_latency or 1.0
+        if now - self.decreased_at < window:
+            return
+        self.limit = max(1.0, self.limit * factor)
+        self.decreased_at = now
+
+    def take(self):
+        self.tokens -= 1
+        self.in_flight += 1
+        self.requests += 1
+
+    def wake_async_waiters(self):
+        for loop, waiter in self.async_waiters:
+            try:
+                loop.call_soon_threadsafe(_resolve, waiter)
+            except RuntimeError:
+                pass # 事件循环已关闭
+        self.async_waiters.clear()
+
+
+def _resolve(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class RequestGovernor:
+    """整个应用共享的请求节流器。
+
+    每个 (端点, 模型) 一条通道：令牌桶限制发起速率，并发窗口按 AIMD 调整——
+    正常完成时每轮加 1，收到 429/503 时减半，延迟明显超过基线时温和降低；
+    带 Retry-After 的响应会暂停整条通道直到指定时间。
+    协程使用 acquire_async() 在事件循环上等待，排队期间不占用 I/O 线程；acquire() 供普通线程阻塞等待。
+    """
+    def __init__(self, rate_limits=None, clock=time.monotonic):
+        self.rate_limits = dict(DEFAULT_RATE_LIMITS)
+        if rate_limits:
+            self.rate_limits.update(rate_limits)
+        self.clock = clock
+        self._cond = threading.Condition()
+        self._lanes = {}
+        self._closed = False
+
+    def governs(self, endpoint):
+        return endpoint in self.rate_limits
+
+    def _lane(self, key):
+        lane = self._lanes.get(key)
+        if lane is None:
+            requests_per_minute, max_concurrency = self.rate_limits[key[0]]
+            lane = self._lanes[key] = _Lane(requests_per_minute, max_concurrency, self.clock())
+        return lane
+
+    def acquire(self, endpoint, model=None):
+        """等待直到该通道允许再发出一个请求，返回交给 release() 的凭据"""
+        key = (endpoint, model or "")
+        with self._cond:
+            lane = self._lane(key)
+            while True:
+                if self._closed:
+                    raise RateLimiterClosed("请求节流器已关闭")
+                wait = lane.wait_time(self.clock())
+                if wait == 0:
+                    lane.take()
+                    return key
+                self._cond.wait(wait) # None: 等其他请求完成时被唤醒
+
+    async def acquire_async(self, endpoint, model=None):
+        """acquire() 的协程版本：按令牌桶 / 暂停时间 sleep，或等其他请求 release() 时被唤醒"""
+        key = (endpoint, model or "")
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._cond:
+                if self._closed:
+                    raise RateLimiterClosed("请求节流器已关闭")
+                lane = self._lane(key)
+                wait = lane.wait_time(self.clock())
+                if wait == 0:
+                    lane.take()
+                    return key
+                waiter = loop.create_future()
+                lane.async_waiters.append((loop, waiter))
+            try:
+                await asyncio.wait_for(waiter, wait) # wait 为 None 时只等唤醒
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                with self._cond:
+                    lane.async_waiters = [(l, w) for l, w in lane.async_waiters if w is not waiter]
+
+    def release(self, key, status_code=None, latency=None, retry_after=None):
+        """请求结束 (收到响应头或失败) 时调用；status_code 为 None 表示连接失败，不参与调整"""
+        with self._cond:
+            lane = self._lanes[key]
+            lane.in_flight -= 1
+            now = self.clock()
+            if status_code in CONGESTION_STATUS:
+                lane.throttled += 1
+                lane.consecutive_throttles += 1
+                pause = parse_retry_after(retry_after)
+                if pause is None:
+                    pause = DEFAULT_BACKOFF * 2 ** (lane.consecutive_throttles - 1)
+                lane.paused_until = max(lane.paused_until, now + min(pause, MAX_PAUSE))
+                lane.decrease(DECREASE_FACTOR, now)
+            elif status_code is not None and latency is not None:
+                lane.consecutive_throttles = 0
+                lane.smoothed_latency = latency if lane.smoothed_latency is None else (1 - LATENCY_SMOOTHING) * lane.smoothed_latency + LATENCY_SMOOTHING * latency
+                lane.baseline_latency = lane.smoothed_latency if lane.baseline_latency is None else min(lane.baseline_latency * BASELINE_DRIFT, lane.smoothed_latency)
+                if lane.smoothed_latency > LATENCY_BACKOFF_RATIO * lane.baseline_latency:
+                    lane.decrease(LATENCY_DECREASE_FACTOR, now)
+                else:
+                    lane.limit = min(float(lane.max_concurrency), lane.limit + 1 / lane.limit) # 加性增：约每轮并发 +1
+            lane.wake_async_waiters()
+            self._cond.notify_all()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            for lane in self._lanes.values():
+                lane.wake_async_waiters()
+            self._cond.notify_all()
+
+    def snapshot(self):
+        """各通道的当前状态 (按请求数从多到少)"""
+        now = self.clock()
+        with self._cond:
+            lanes = [{
+                "endpoint": endpoint,
+                "model": model,
+                "concurrency_limit": int(lane.limit),
+                "max_concurrency": lane.max_concurrency,
+                "in_flight": lane.in_flight,
+                "requests": lane.requests,
+                "throttled": lane.throttled,
+                "paused_s": round(max(0.0, lane.paused_until - now), 1),
+            } for (endpoint, model), lane in self._lanes.items()]
+        return sorted(lanes, key=lambda lane: -lane["requests"])
+
+
+def format_governor_stats(lanes, limit=3):
+    parts = []
+    for lane in lanes[:limit]:
+        name = lane["endpoint"] + (f"/{lane['model'].rsplit('/', 1)[-1]}" if lane["model"] else "")
+        text = f"{name} 并发 {lane['in_flight']}/{lane['concurrency_limit']}"
+        if lane["throttled"]:
+            text += f"，受限 {lane['throttled']} 次"
+        if lane["paused_s"]:
+            text += f"，暂停中 {lane['paused_s']:.0f}s"
+        parts.append(text)
+    return "；".join(parts) if parts else "尚无请求"
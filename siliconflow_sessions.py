@@ -0,0 +1,223 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+SESSION_TITLE_CHARS = 40 # 会话标题取第一条用户消息的前若干个字符
+SEARCH_SNIPPET_TOKENS = 12 # 搜索结果摘要的上下文长度
+STORED_ROLES = ("user", "assistant", "reasoning")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    title TEXT NOT NULL DEFAULT '',
+    model TEXT NOT NULL DEFAULT '',
+    system_prompt TEXT NOT NULL DEFAULT '',
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    message_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    session_id INTEGER NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_by_session ON messages(session_id, id);
+CREATE INDEX IF NOT EXISTS sessions_by_update ON sessions(updated_at DESC);
+"""
+
+# 外部内容 FTS5 表：索引 messages.content，不重复存储文本。trigram 分词对中文按子串匹配 (SQLite 3.34+)
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(content, content='messages', content_rowid='id', tokenize='{tokenizer}');
+CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+END;
+"""
+
+
+class ChatSessionStore:
+    """追加写入的聊天会话库 (SQLite, WAL 模式)。
+
+    消息在完成时逐条写入，不做更新；会话列表只读元数据，消息按页从新到旧读取。
+    SQLite 不带 FTS5 时退化为 LIKE 搜索。连接在线程间共享，所有访问由一把锁串行化。
+    """
+    def __init__(self, db_path):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None) # 自动提交，批量写入时显式开启事务
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL") # WAL 下只在检查点时 fsync，断电最多丢最后几条
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(_SCHEMA)
+        self.trigram = False
+        self.has_fts = self._create_fts()
+
+    def _create_fts(self):
+        for tokenizer in ("trigram", "unicode61"):
+            try:
+                self._conn.executescript(_FTS_SCHEMA.format(tokenizer=tokenizer))
+            except sqlite3.OperationalError:
+                continue
+            row = self._conn.execute("SELECT sql FROM sqlite_master WHERE name = 'messages_fts'").fetchone()
+            self.trigram = "trigram" in row["sql"] # 已有的索引沿用建表时的分词器
+            return True
+        return False
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # --- 写入 ---
+    def create_session(self, model="", system_prompt="", title=""):
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute("INSERT INTO sessions (title, model, system_prompt, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                                        (title, model, system_prompt or "", now, now))
+            return cursor.lastrowid
+
+    def append_messages(self, session_id, messages, model=None):
+        """在一个事务中追加 [(角色, 内容)]；会话还没有标题时取第一条用户消息作为标题"""
+        rows = [(role, content) for role, content in messages if role in STORED_ROLES and content]
+        if not rows:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany("INSERT INTO messages (session_id, role, content, created_at) VALUES (?, ?, ?, ?)",
+                                       [(session_id, role, content, now) for role, content in rows])
+                first_user = next((content for role, content in rows if role == "user"), "")
+                self._conn.execute("UPDATE sessions SET updated_at = ?, message_count = message_count + ?, model = COALESCE(?, model),"
+                                   " title = CASE WHEN title = '' THEN ? ELSE title END WHERE id = ?",
+                                   (now, len(rows), model, _make_title(first_user), session_id))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def delete_session(self, session_id):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,)) # 逐条触发 FTS 删除
+                self._conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    # --- 读取 ---
+    def list_sessions(self, limit=200, offset=0):
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(
+                "SELECT id, title, model, system_prompt, created_at, updated_at, message_count FROM sessions ORDER BY updated_at DESC LIMIT ? OFFSET ?",
+                (limit, offset))]
+
+    def get_session(self, session_id):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return dict(row) if row else None
+
+    def load_messages(self, session_id, before_id=None, limit=None, roles=STORED_ROLES):
+        """返回 id 小于 before_id 的最新 limit 条消息 (按时间正序)，用于向上翻页时懒加载"""
+        sql = f"SELECT id, role, content FROM messages WHERE session_id = ? AND role IN ({','.join('?' * len(roles))})"
+        params = [session_id, *roles]
+        if before_id is not None:
+            sql += " AND id < ?"; params.append(before_id)
+        sql += " ORDER BY id DESC"
+        if limit is not None:
+            sql += " LIMIT ?"; params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [dict(row) for row in reversed(rows)]
+
+    def search(self, query, limit=100):
+        """全文搜索所有会话的消息，返回 [{session_id, title, message_id, role, snippet}]，最相关的在前"""
+        query = query.strip()
+        if not query:
+            return []
+        # trigram 至少需要 3 个字符；更短的查询 (如两个汉字) 用 LIKE 扫描
+        if self.has_fts and (not self.trigram or len(query) >= 3):
+            phrase = '"' + query.replace('"', '""') + '"' # 按短语匹配，用户输入的 FTS 语法字符不生效
+            sql = ("SELECT m.session_id, s.title, m.id AS message_id, m.role,"
+                   f" snippet(messages_fts, 0, '【', '】', '…', {SEARCH_SNIPPET_TOKENS}) AS snippet"
+                   " FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid JOIN sessions s ON s.id = m.session_id"
+                   " WHERE messages_fts MATCH ? ORDER BY rank LIMIT ?")
+            params = (phrase, limit)
+        else:
+            pattern = "%" + query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            sql = ("SELECT m.session_id, s.title, m.id AS message_id, m.role, substr(m.content, 1, 80) AS snippet"
+                   " FROM messages m JOIN sessions s ON s.id = m.session_id WHERE m.content LIKE ? ESCAPE '\\' ORDER BY m.id DESC LIMIT ?")
+            params = (pattern, limit)
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(sql, params)]
+
+    # --- OpenAI 格式 JSONL 导入 / 导出 ---
+    def export_jsonl(self, output_path, session_ids=None):
+        """每个会话写一行 {"messages": [...]}；推理过程作为下一条助手消息的 reasoning_content。返回导出的会话数"""
+        ids = session_ids if session_ids is not None else [s["id"] for s in self.list_sessions(limit=-1)]
+        with open(output_path, "w", encoding="utf-8") as f:
+            for session_id in ids:
+                session = self.get_session(session_id)
+                if session is None:
+                    continue
+                messages = [{"role": "system", "content": session["system_prompt"]}] if session["system_prompt"] else []
+                reasoning = None
+                for row in self.load_messages(session_id):
+                    if row["role"] == "reasoning":
+                        reasoning = row["content"]
+                        continue
+                    message = {"role": row["role"], "content": row["content"]}
+                    if reasoning and row["role"] == "assistant":
+                        message["reasoning_content"] = reasoning
+                    reasoning = None
+                    messages.append(message)
+                f.write(json.dumps({"messages": messages, "model": session["model"], "title": session["title"]}, ensure_ascii=False) + "\n")
+        return len(ids)
+
+    def import_jsonl(self, input_path):
+        """导入 OpenAI 格式的 JSONL (每行一个 {"messages": [...]})，返回导入的会话数；无法解析的行被跳过"""
+        imported = 0
+        with open(input_path, "r", encoding="utf-8-sig") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                messages = record.get("messages") if isinstance(record, dict) else None
+                if not isinstance(messages, list):
+                    continue
+                system_prompt = "\n".join(m.get("content", "") for m in messages if isinstance(m, dict) and m.get("role") == "system" and isinstance(m.get("content"), str))
+                rows = []
+                for message in messages:
+                    if not isinstance(message, dict) or message.get("role") not in ("user", "assistant"):
+                        continue
+                    if message.get("reasoning_content"):
+                        rows.append(("reasoning", message["reasoning_content"]))
+                    rows.append((message["role"], _content_text(message.get("content"))))
+                session_id = self.create_session(record.get("model", ""), system_prompt, _make_title(record.get("title", "")))
+                self.append_messages(session_id, rows)
+                imported += 1
+        return imported
+
+
+def _make_title(text):
+    text = " ".join((text or "").split())
+    return text if len(text) <= SESSION_TITLE_CHARS else text[:SESSION_TITLE_CHARS] + "…"
+
+
+def _content_text(content):
+    """多模态消息只保留文本部分 (图片不入库)"""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "\n".join(part.get("text", "") for part in content if isinstance(part, dict) and part.get("type") == "text")
+    return ""
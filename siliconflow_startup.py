@@ -0,0 +1,57 @@
+import importlib
+import sys
+import time
+
+SCRIPT_STARTED = time.perf_counter() # 本模块由界面脚本最先导入，近似为脚本开始执行的时刻
+HEAVY_MODULES = ("requests", "urllib3", "PIL.Image", "PIL.ImageTk", "numpy") # 启动时不应加载的重量级模块
+
+
+class LazyModule:
+    """模块代理：第一次访问属性时才真正导入。
+
+    只在函数体内使用的重量级依赖 (PIL、requests、NumPy) 因此不会拖慢窗口出现；
+    importlib 自带导入锁，首次访问可以发生在任意线程。
+    """
+    def __init__(self, name):
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_module", None)
+
+    def _load(self):
+        module = self._module
+        if module is None:
+            module = importlib.import_module(self._name)
+            object.__setattr__(self, "_module", module)
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value): # 例如 ImageFile.LOAD_TRUNCATED_IMAGES = True 要设置到真正的模块上
+        setattr(self._load(), attr, value)
+
+    def __repr__(self):
+        return f"<lazy module {self._name!r} ({'loaded' if self._module is not None else 'not loaded'})>"
+
+
+def loaded_heavy_modules():
+    return [name for name in HEAVY_MODULES if name in sys.modules]
+
+
+class StartupTimer:
+    """记录启动各阶段距脚本开始执行的耗时 (不含解释器自身的启动时间)"""
+    def __init__(self, started=SCRIPT_STARTED):
+        self.started = started
+        self.marks = []
+
+    def mark(self, label):
+        elapsed_ms = (time.perf_counter() - self.started) * 1000
+        self.marks.append((label, elapsed_ms))
+        return elapsed_ms
+
+    def report(self):
+        width = max((len(label) for label, _ in self.marks), default=0)
+        lines = ["启动耗时 (从脚本开始执行计时，不含解释器启动):"]
+        lines += [f"  {label.ljust(width)}  {elapsed_ms:8.1f} ms" for label, elapsed_ms in self.marks]
+        heavy = loaded_heavy_modules()
+        lines.append(f"  首个窗口显示时已加载的重量级模块: {', '.join(heavy) if heavy else '无'}")
+        return "\n".join(lines)
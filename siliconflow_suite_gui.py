@@ -1,22 +1,66 @@
+from siliconflow_startup import LazyModule, StartupTimer # 最先导入：启动计时从这里开始
 import tkinter as tk
 from tkinter import ttk, scrolledtext, filedialog, messagebox
-import requests
+import asyncio
 import threading
+import time
 import os
 import tempfile
 import subprocess
+import sys
 import json
 import re
-from PIL import Image, ImageTk, UnidentifiedImageError
+import sqlite3
 import io
 import base64 # 确保导入 base64
+from siliconflow_engine import NetworkEngine
+from siliconflow_client import API_PATHS, DEFAULT_API_BASE, SiliconFlowClient
+from siliconflow_models import DEFAULT_CLASSIFIER, SERVER_SIDE_FILTERS, ModelCatalogCache, diff_model_lists, model_ids_from_response, server_filters_applied
+from siliconflow_image_batch import ImageBatchRunner, download_images, guess_image_extension, image_cache_key, link_or_copy, load_prompts_file, parse_prompt_lines
+from siliconflow_imaging import IncrementalPreview, ThumbnailCache, VisionImageEncoder, bucket_size, decode_thumbnail
+from siliconflow_chat import context_window_for, estimate_tokens, fit_messages, format_prompt_stats
+from siliconflow_sessions import ChatSessionStore
+from siliconflow_ratelimit import DEFAULT_RATE_LIMITS, RequestGovernor, format_governor_stats
+from siliconflow_policy import DEFAULT_RETRIES, RequestPolicy, format_policy_stats
+from siliconflow_metrics import MetricsRegistry, format_bytes, format_seconds
+from siliconflow_cache import DiskBlobCache, TieredBlobCache, copy_file, format_cache_stats
+from siliconflow_asr_batch import FolderTranscriptionRunner
+from siliconflow_tts import DEFAULT_STREAM_CHUNK_SIZE, LONG_TEXT_FALLBACK_FORMAT, STITCHABLE_FORMATS, LongTextSynthesizer, PipePlaybackSink, SpeechStreamRecorder, find_stream_player, format_stream_stats, tts_cache_key
+
+# 重量级依赖在第一次使用时才导入 (首次联网、首次显示图像、首次长音频转录)，窗口不必等它们加载完
+requests = LazyModule("requests")
+Image = LazyModule("PIL.Image")
+ImageTk = LazyModule("PIL.ImageTk")
+http = LazyModule("siliconflow_http")
+asr = LazyModule("siliconflow_asr") # 依赖 NumPy
 
 # --- 全局配置 ---
-DEFAULT_API_KEY = "sk-leirgmdw"
-MODELS_LIST_API_URL = "https://api.siliconflow.cn/v1/models" # 模型列表 API
+DEFAULT_API_KEY = os.environ.get("SILICONFLOW_API_KEY", "sk-leirgmdw")
+API_BASE = os.environ.get("SILICONFLOW_API_BASE", DEFAULT_API_BASE).rstrip("/") # API 地址，可指向本地模拟服务器 (siliconflow_mock_server.py) 离线使用
+MODELS_LIST_API_URL = API_BASE + API_PATHS["models"] # 模型列表 API
+APP_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".siliconflow_suite") # 本地缓存目录
+# 模型目录和生成结果缓存按 API 地址分开存放，模拟服务器返回的内容不会混进正式缓存
+API_CACHE_DIR = APP_CACHE_DIR if API_BASE == DEFAULT_API_BASE else os.path.join(APP_CACHE_DIR, "custom_api")
+MODEL_CATALOG_TTL = 24 * 3600 # 模型目录缓存有效期 (秒)，过期后启动时在后台条件刷新
+
+# --- HTTP 配置 (所有选项卡共享) ---
+# 连接池大小、建连超时和各端点读取超时沿用 siliconflow_http 的 DEFAULT_*，这里只写需要不同于默认值的部分
+HTTP_TIMEOUT_OVERRIDES = {} # 端点 -> 读取超时上限 (秒)，如 {"asr": 300}；未列出的端点使用 siliconflow_http.DEFAULT_TIMEOUTS
+REQUEST_RETRIES = DEFAULT_RETRIES # 瞬时故障 (连接失败、超时、500/502/504) 的自动重试次数，只对可以安全重复的请求生效
+RATE_LIMITS = dict(DEFAULT_RATE_LIMITS) # 各端点每个模型的 (每分钟请求数, 并发上限)；账户等级不同时只覆盖需要调整的端点，如 RATE_LIMITS["image"] = (120, 16)
+METRICS_TEXTFILE = os.environ.get("SILICONFLOW_METRICS_TEXTFILE") # 设置后定期把请求指标写成 Prometheus 文本文件 (供 node_exporter textfile collector 采集)
+METRICS_TEXTFILE_INTERVAL_MS = 15000 # 写入上述文件的间隔 (毫秒)
+METRICS_REFRESH_MS = 1000 # 请求指标面板的刷新间隔 (毫秒)
+UI_QUEUE_POLL_MS = 15 # 界面线程从网络引擎结果队列取回调的间隔 (毫秒)
+STREAM_FLUSH_INTERVAL_MS = 33 # 聊天流式输出刷新到文本框的最小间隔 (毫秒, 约 30 帧/秒)
+STREAM_STATS_INTERVAL_MS = 500 # 流式输出过程中更新状态栏速率的间隔 (毫秒)
+CHAT_TRANSCRIPT_MAX_BLOCKS = 60 # 聊天记录框中最多保留的消息块数，更早的消息滚动到顶部时再按页载入
+CHAT_TRANSCRIPT_PAGE_BLOCKS = 20 # 滚动到顶部时每次载入的更早消息块数
+CHAT_TRANSCRIPT_RETAINED_BLOCKS = 400 # 内存中最多保留的消息块数 (含已移出记录框的)，更早的被释放，可从会话列表重新打开查看
+CHAT_SESSION_DB = os.path.join(APP_CACHE_DIR, "chat_sessions.db") # 聊天会话库 (SQLite)，每条消息完成时追加写入
 
 # --- 文生图配置 ---
-IMAGE_API_URL = "https://api.siliconflow.cn/v1/images/generations"
+IMAGE_API_URL = API_BASE + API_PATHS["image"]
 INITIAL_IMAGE_MODELS = [
     "Kwai-Kolors/Kolors",
     "black-forest-labs/FLUX.1-schnell",
@@ -32,9 +76,13 @@ IMAGE_SIZES = [
     "1024x1024", "512x512", "1024x768", "768x1024", "1024x576", "576x1024",
 ]
 DEFAULT_IMAGE_SIZE = "1024x1024"
+DEFAULT_IMAGE_BATCH_WORKERS = 4 # 批量生成的默认并发数
+IMAGE_CACHE_DIR = os.path.join(API_CACHE_DIR, "image_cache") # 固定 seed 的生成结果缓存目录
+IMAGE_CACHE_MAX_BYTES = 512 * 1024 * 1024 # 图像缓存总大小上限，超出后淘汰最久未使用的条目
+IMAGE_DOWNLOAD_DIR = os.path.join(APP_CACHE_DIR, "downloads") # 生成结果先流式下载到这里，保存时硬链接 / 复制到目标位置
 
 # --- 文本转语音 (TTS) 配置 ---
-TTS_API_URL = "https://api.siliconflow.cn/v1/audio/speech"
+TTS_API_URL = API_BASE + API_PATHS["tts"]
 FISH_SPEECH_VOICES = ["alex", "anna", "bella", "benjamin", "charles", "claire", "david", "diana"]
 INITIAL_TTS_MODELS = {
     "FunAudioLLM/CosyVoice2-0.5B": FISH_SPEECH_VOICES,
@@ -45,16 +93,26 @@ DEFAULT_TTS_MODEL = "FunAudioLLM/CosyVoice2-0.5B"
 DEFAULT_TTS_VOICE = "alex"
 TTS_OUTPUT_FORMATS = ["mp3", "wav", "opus", "pcm"]
 DEFAULT_TTS_FORMAT = "mp3"
+TTS_STREAM_CHUNK_SIZE = DEFAULT_STREAM_CHUNK_SIZE # 流式合成时每次读取的字节数
+TTS_LONG_TEXT_THRESHOLD = 300 # 超过该字符数的文本按句子分段并发合成后再拼接
+TTS_CHUNK_MAX_CHARS = 200 # 分段合成时每段的最大字符数
+TTS_PARALLEL_CHUNKS = 4 # 分段合成的并发数
+TTS_CACHE_DIR = os.path.join(API_CACHE_DIR, "tts_cache") # 合成结果的磁盘缓存目录
+TTS_CACHE_MEMORY_BYTES = 64 * 1024 * 1024 # 内存缓存层的总字节上限
+TTS_CACHE_DISK_BYTES = 256 * 1024 * 1024 # 磁盘缓存层的总字节上限
 
 # --- 语音转文本 (ASR) 配置 ---
-ASR_API_URL = "https://api.siliconflow.cn/v1/audio/transcriptions"
+ASR_API_URL = API_BASE + API_PATHS["asr"]
 INITIAL_ASR_MODELS = ["FunAudioLLM/SenseVoiceSmall"]
 DEFAULT_ASR_MODEL = "FunAudioLLM/SenseVoiceSmall"
 ASR_LANGUAGES = ["zh", "en", "ja", "ko"]
 DEFAULT_ASR_LANGUAGE = "zh"
+ASR_SEGMENT_SECONDS = 60 # 长音频模式下每段的目标长度 (秒)，实际切点落在附近最安静的位置
+ASR_PARALLEL_SEGMENTS = 4 # 长音频模式的并发转录段数
+DEFAULT_ASR_BATCH_WORKERS = 4 # 文件夹批量转录的默认并发数
+ASR_BATCH_OUTPUT_NAME = "transcripts.jsonl" # 批量转录结果的默认文件名 (也可选择 .csv)
 
 # --- 文本聊天配置 ---
-CHAT_API_URL = "https://api.siliconflow.cn/v1/chat/completions"
 INITIAL_CHAT_MODELS = sorted(list(set([ # Use set to remove duplicates and sort (保持之前的更新)
    "THUDM/chatglm3-6b",
    "THUDM/glm-4-9b-chat",
@@ -124,45 +182,215 @@ INITIAL_CHAT_MODELS = sorted(list(set([ # Use set to remove duplicates and sort
 DEFAULT_CHAT_MODEL = "THUDM/glm-4-9b-chat"
 
 
+
 # --- 主应用类 ---
 class SiliconFlowSuiteApp(tk.Tk):
-    def __init__(self):
+    def __init__(self, startup_timer=None):
         super().__init__()
-        self.title("SiliconFlow 工具套件")
+        self.title("SiliconFlow 工具套件" if API_BASE == DEFAULT_API_BASE else f"SiliconFlow 工具套件 [{API_BASE}]") # 非默认 API 地址 (如本地模拟服务器) 显示在标题栏
         self.geometry("900x800")
+        self.startup_timer = startup_timer
+
+        # 所有选项卡共享同一个带连接池的 HTTP 客户端 (第一次联网时才创建，requests 的导入不拖慢启动)
+        self._http_client = None; self._http_client_lock = threading.Lock()
+        # 所有选项卡、批量任务共用一个节流器：按端点 / 模型的令牌桶 + AIMD 并发窗口，遵守 Retry-After
+        self.governor = RequestGovernor(RATE_LIMITS)
+        self.metrics = MetricsRegistry() # 每次请求的建连 / 首字节 / 总耗时与流量，聊天流的首 token 时间与速率
+        # 唯一的后台 asyncio 事件循环：所有网络调用以协程运行，结果经由一个线程安全队列回到 Tk
+        self.engine = NetworkEngine() # I/O 线程数默认与 HTTP 连接池大小一致
+        self.model_catalog = ModelCatalogCache(API_CACHE_DIR, ttl=MODEL_CATALOG_TTL)
+        self.image_cache = DiskBlobCache(IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_BYTES)
+        self.tts_cache = TieredBlobCache(TTS_CACHE_DIR, TTS_CACHE_MEMORY_BYTES, TTS_CACHE_DISK_BYTES)
+        try: self.session_store = ChatSessionStore(CHAT_SESSION_DB)
+        except (sqlite3.Error, OSError) as e: self.session_store = None; print(f"--- DEBUG: Chat session store unavailable, sessions will not be saved: {e} ---")
+        self.protocol("WM_DELETE_WINDOW", self._on_close)
 
         self.notebook = ttk.Notebook(self)
         self.notebook.pack(pady=10, padx=10, fill=tk.BOTH, expand=True)
 
-        self.image_gen_frame = ImageGenFrame(self.notebook, self, INITIAL_IMAGE_MODELS)
-        self.tts_frame = TTSFrame(self.notebook, self, INITIAL_TTS_MODELS)
-        self.stt_frame = SpeechToTextFrame(self.notebook, self, INITIAL_ASR_MODELS)
-        self.model_checker_frame = ModelCheckerFrame(self.notebook, self)
-        self.chat_frame = ChatFrame(self.notebook, self, INITIAL_CHAT_MODELS) # 添加 ChatFrame 实例
-
-        self.notebook.add(self.image_gen_frame, text='文生图')
-        self.notebook.add(self.tts_frame, text='文本转语音 (TTS)')
-        self.notebook.add(self.stt_frame, text='语音转文本 (ASR)')
-        self.notebook.add(self.chat_frame, text='文本聊天') # 调整顺序：添加 ChatFrame 到 Notebook
-        self.notebook.add(self.model_checker_frame, text='模型检测器') # 模型检测器放在最后
+        # 选项卡先放一个空的占位 Frame，第一次被选中时才构建真正的界面 (聊天页的参数网格尤其大)
+        # 每项: (属性名, 选项卡标题, 构建函数)；顺序即选项卡顺序，模型检测器放在最后
+        self._tab_specs = [
+            ("image_gen_frame", '文生图', lambda parent: ImageGenFrame(parent, self, INITIAL_IMAGE_MODELS)),
+            ("tts_frame", '文本转语音 (TTS)', lambda parent: TTSFrame(parent, self, INITIAL_TTS_MODELS)),
+            ("stt_frame", '语音转文本 (ASR)', lambda parent: SpeechToTextFrame(parent, self, INITIAL_ASR_MODELS)),
+            ("chat_frame", '文本聊天', lambda parent: ChatFrame(parent, self, INITIAL_CHAT_MODELS)),
+            ("model_checker_frame", '模型检测器', lambda parent: ModelCheckerFrame(parent, self)),
+        ]
+        self._tab_placeholders = {}
+        self._pending_models = {} # 类别 -> 模型列表：目录刷新时对应选项卡还没有构建，构建后再应用
+        for attr, text, _ in self._tab_specs:
+            setattr(self, attr, None)
+            placeholder = ttk.Frame(self.notebook); self.notebook.add(placeholder, text=text); self._tab_placeholders[str(placeholder)] = attr
+        self.notebook.bind("<<NotebookTabChanged>>", self._on_tab_changed)
 
         self.status_label = ttk.Label(self, text="状态：准备就绪", relief=tk.SUNKEN, anchor=tk.W)
         self.status_label.pack(fill=tk.X, side=tk.BOTTOM, ipady=2)
+        self._build_tab(self._tab_specs[0][0]) # 默认显示的第一个选项卡立即构建，其余等第一次被选中
+        self._poll_engine_queue()
+        self.after_idle(self._load_model_catalog)
+        if METRICS_TEXTFILE: self.after(METRICS_TEXTFILE_INTERVAL_MS, self._write_metrics_textfile)
+        if startup_timer:
+            startup_timer.mark("主窗口初始化完成")
+            self.bind("<Map>", self._on_first_map)
+
+    @property
+    def http_client(self):
+        client = self._http_client
+        if client is None:
+            with self._http_client_lock: # 界面线程和网络线程都可能第一个用到它
+                if self._http_client is None:
+                    self._http_client = http.SiliconFlowHTTPClient(timeouts=HTTP_TIMEOUT_OVERRIDES, governor=self.governor, policy=RequestPolicy(retries=REQUEST_RETRIES), metrics=self.metrics)
+                client = self._http_client
+        return client
+
+    def _on_tab_changed(self, event=None):
+        attr = self._tab_placeholders.get(self.notebook.select())
+        if attr and getattr(self, attr) is None: self._build_tab(attr)
+
+    def _build_tab(self, attr):
+        """在占位 Frame 中构建选项卡界面，并补上构建前收到的模型目录更新"""
+        _, text, factory = next(spec for spec in self._tab_specs if spec[0] == attr)
+        placeholder = next(self.nametowidget(name) for name, a in self._tab_placeholders.items() if a == attr)
+        started = time.perf_counter()
+        frame = factory(placeholder); frame.pack(fill=tk.BOTH, expand=True); setattr(self, attr, frame)
+        category = next((c for c, a in self._MODEL_TABS.items() if a == attr), None)
+        if category in self._pending_models: frame.update_model_list(self._pending_models.pop(category))
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        print(f"--- DEBUG: Built tab '{text}' in {elapsed_ms:.1f} ms ---")
+        if self.startup_timer and attr == self._tab_specs[0][0]: self.startup_timer.mark(f"构建 {text} 选项卡")
+        return frame
+
+    def _on_first_map(self, event):
+        if event.widget is not self: return
+        self.unbind("<Map>")
+        self.after_idle(self._report_startup_time) # 映射后的第一个空闲回调：首帧已经绘制
+
+    def _report_startup_time(self):
+        self.startup_timer.mark("首个窗口显示")
+        print(self.startup_timer.report(), flush=True)
+        self._on_close() # 测量模式：报告后直接退出，便于脚本重复测量
 
     def set_status(self, message):
         self.status_label.config(text=f"状态：{message}")
         self.update_idletasks()
 
+    def _load_model_catalog(self):
+        """启动时先应用本地缓存的模型目录，缓存缺失或过期时再在后台条件刷新"""
+        api_key = self.model_checker_frame.api_key.get() if self.model_checker_frame else DEFAULT_API_KEY
+        if not api_key: return
+        entry = self.model_catalog.load(api_key)
+        if entry:
+            changes = self.apply_model_catalog(entry["catalog"])
+            if changes: self.set_status(f"已从本地缓存加载模型列表: {'，'.join(changes)}")
+        if entry is None or self.model_catalog.is_stale(entry):
+            self.engine.submit(self.fetch_model_catalog(api_key), group="models", on_success=self._on_catalog_refreshed, on_error=lambda e: print(f"--- DEBUG: Background model catalog refresh failed: {e} ---"))
+
+    def _on_catalog_refreshed(self, result):
+        catalog, not_modified = result
+        if not_modified: return
+        changes = self.apply_model_catalog(catalog)
+        if changes: self.set_status(f"模型列表已在后台刷新: {'，'.join(changes)}")
+
+    async def _fetch_model_ids(self, api_key, params, validator):
+        """GET /v1/models (可带过滤参数和条件请求头)，返回 (模型 ID 列表，304 时为 None, 新的校验值)"""
+        headers = {"Authorization": f"Bearer {api_key}"}
+        headers.update(ModelCatalogCache.conditional_headers(validator))
+        response = await self.http_client.aget(self.engine, MODELS_LIST_API_URL, "models", headers=headers, params=params)
+        if response.status_code == 304 and validator: return None, validator
+        response.raise_for_status()
+        return model_ids_from_response(response.json()), {"etag": response.headers.get("ETag"), "last_modified": response.headers.get("Last-Modified")}
+
+    async def fetch_model_catalog(self, api_key):
+        """刷新模型目录，返回 (分类后的目录, 是否未变化)。
+
+        优先使用服务端 type/sub_type 过滤查询 (各类别并发，各自带条件请求头)；
+        服务端不支持过滤时，退回到条件请求完整列表并用本地规则表分类。
+        """
+        entry = self.model_catalog.load(api_key)
+        cached = entry["catalog"] if entry else {}
+        categories = list(SERVER_SIDE_FILTERS)
+        results = await asyncio.gather(*(self._fetch_model_ids(api_key, SERVER_SIDE_FILTERS[c], self.model_catalog.validator_for(entry, c, "server")) for c in categories), return_exceptions=True)
+        if not any(isinstance(r, BaseException) for r in results):
+            filtered = {c: (ids if ids is not None else cached.get(c, [])) for c, (ids, _) in zip(categories, results)}
+            if any(filtered.values()) and server_filters_applied(filtered):
+                catalog = {c: sorted(set(ids)) for c, ids in filtered.items()}
+                if all(ids is None for ids, _ in results):
+                    self.model_catalog.touch(api_key, entry); return catalog, True
+                self.model_catalog.save(api_key, catalog, "server", {c: validator for c, (_, validator) in zip(categories, results)})
+                return catalog, False
+        print("--- DEBUG: Server-side model filtering unavailable, classifying the full list locally ---")
+        ids, validator = await self._fetch_model_ids(api_key, None, self.model_catalog.validator_for(entry, "all", "local"))
+        if ids is None:
+            self.model_catalog.touch(api_key, entry); return entry["catalog"], True
+        print(f"--- DEBUG: Models API returned {len(ids)} models ---")
+        catalog = DEFAULT_CLASSIFIER.classify(ids)
+        self.model_catalog.save(api_key, catalog, "local", {"all": validator})
+        return catalog, False
+
+    # 模型类别 -> 选项卡属性名 (模型检测器没有模型下拉列表)
+    _MODEL_TABS = {"image": "image_gen_frame", "tts": "tts_frame", "asr": "stt_frame", "chat": "chat_frame"}
+    _MODEL_TAB_LABELS = {"image": "文生图", "tts": "TTS", "asr": "ASR", "chat": "聊天"}
+
+    def _current_models(self, category):
+        frame = getattr(self, self._MODEL_TABS[category])
+        if frame is not None: return frame.available_model_ids if category == "tts" else frame.available_models
+        if category in self._pending_models: return self._pending_models[category]
+        return {"image": INITIAL_IMAGE_MODELS, "tts": list(INITIAL_TTS_MODELS), "asr": INITIAL_ASR_MODELS, "chat": INITIAL_CHAT_MODELS}[category]
+
+    def apply_model_catalog(self, catalog):
+        """只把发生变化的类别推送到对应选项卡的下拉列表 (尚未构建的选项卡在构建时应用)，返回变化说明列表"""
+        changes = []
+        for category, attr in self._MODEL_TABS.items():
+            new_models = catalog.get(category) or []
+            if not new_models: continue # 未检测到该类模型时保留现有列表
+            added, removed = diff_model_lists(self._current_models(category), new_models)
+            if not added and not removed: continue
+            frame = getattr(self, attr)
+            if frame is not None: frame.update_model_list(new_models)
+            else: self._pending_models[category] = new_models
+            changes.append(f"{self._MODEL_TAB_LABELS[category]} +{len(added)}/-{len(removed)}")
+        return changes
+
+    def api_client(self, api_key):
+        """与界面无关的请求层 (命令行批处理使用同一套请求构造和响应解析)"""
+        return SiliconFlowClient(self.engine, self.http_client, api_key, API_BASE)
+
+    def run_in_ui(self, callback, *args, **kwargs):
+        """从任意线程安排一个回调在 Tk 主线程执行"""
+        self.engine.post_to_ui(callback, *args, **kwargs)
+
+    def _poll_engine_queue(self):
+        self.engine.drain_ui_queue()
+        self.after(UI_QUEUE_POLL_MS, self._poll_engine_queue)
+
+    def _write_metrics_textfile(self):
+        try: self.metrics.export_prometheus(METRICS_TEXTFILE)
+        except OSError as e: print(f"--- DEBUG: Failed to write metrics textfile {METRICS_TEXTFILE}: {e} ---")
+        self.after(METRICS_TEXTFILE_INTERVAL_MS, self._write_metrics_textfile)
+
+    def _on_close(self):
+        if METRICS_TEXTFILE:
+            try: self.metrics.export_prometheus(METRICS_TEXTFILE) # 退出前写一次最终值
+            except OSError: pass
+        if self.image_gen_frame: self.image_gen_frame._discard_downloads()
+        self.engine.stop()
+        if self._http_client: self._http_client.close()
+        if self.session_store: self.session_store.close()
+        self.destroy()
+
 # --- 文生图 Frame 类 ---
 class ImageGenFrame(ttk.Frame):
     def __init__(self, parent_notebook, main_app, initial_models):
         super().__init__(parent_notebook, width=800, height=700)
         self.pack_propagate(False); self.main_app = main_app; self.available_models = initial_models
         self.api_key = tk.StringVar(value=DEFAULT_API_KEY)
-        default_model = DEFAULT_IMAGE_MODEL if DEFAULT_IMAGE_MODEL in self.available_models else (self.available_models if self.available_models else "")
+        default_model = DEFAULT_IMAGE_MODEL if DEFAULT_IMAGE_MODEL in self.available_models else (self.available_models[0] if self.available_models else "")
         self.model_var = tk.StringVar(value=default_model); self.size_var = tk.StringVar(value=DEFAULT_IMAGE_SIZE)
-        self.steps_var = tk.IntVar(value=25); self.cfg_scale_var = tk.DoubleVar(value=7.0); self.seed_var = tk.StringVar(value="")
-        self.image_data_bytes = None; self.photo_image = None
+        self.steps_var = tk.IntVar(value=25); self.cfg_scale_var = tk.DoubleVar(value=7.0); self.seed_var = tk.StringVar(value=""); self.hedge_var = tk.BooleanVar(value=False)
+        self.image_files = []; self.image_token = None; self.photo_image = None; self.batch_dialog = None # image_files: 本次生成下载到磁盘的图像，第一张用于预览
+        self.thumbnail_cache = ThumbnailCache() # (图像摘要, 目标尺寸) -> 已缩小的图像，重复显示时不再解码
+        self._displayed = (None, None); self._resize_job = None; self._generation = 0 # 每次生成递增，用于丢弃过期的预览
         self._create_widgets()
     def _create_widgets(self):
         paned_window = ttk.PanedWindow(self, orient=tk.HORIZONTAL); paned_window.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
@@ -186,95 +414,91 @@ class ImageGenFrame(ttk.Frame):
         ttk.Label(params_frame, text="种子 (Seed):").grid(row=4, column=0, padx=5, pady=5, sticky=tk.W)
         seed_entry = ttk.Entry(params_frame, textvariable=self.seed_var, width=15); seed_entry.grid(row=4, column=1, columnspan=2, padx=5, pady=5, sticky=tk.W+tk.E)
         ttk.Label(params_frame, text="(留空则随机)").grid(row=5, column=1, columnspan=2, padx=5, pady=2, sticky=tk.W)
+        ttk.Checkbutton(params_frame, text="慢请求对冲 (超过 p95 延迟时再发一份，会多计费)", variable=self.hedge_var).grid(row=6, column=0, columnspan=3, padx=5, pady=2, sticky=tk.W)
         action_frame = ttk.Frame(control_frame, padding="10"); action_frame.pack(fill=tk.X, side=tk.BOTTOM, pady=10)
-        self.generate_button = ttk.Button(action_frame, text="生成图像", command=self._start_generate_thread, width=12); self.generate_button.pack(side=tk.LEFT, padx=10)
-        self.save_button = ttk.Button(action_frame, text="保存图像", command=self._save_image, state=tk.DISABLED, width=12); self.save_button.pack(side=tk.RIGHT, padx=10)
+        self.generate_button = ttk.Button(action_frame, text="生成图像", command=self._start_generate, width=10); self.generate_button.pack(side=tk.LEFT, padx=5)
+        ttk.Button(action_frame, text="批量生成...", command=self._open_batch_dialog, width=10).pack(side=tk.LEFT, padx=5)
+        self.save_button = ttk.Button(action_frame, text="保存图像", command=self._save_image, state=tk.DISABLED, width=10); self.save_button.pack(side=tk.RIGHT, padx=5)
         image_frame = ttk.Frame(paned_window); paned_window.add(image_frame, weight=2)
         self.image_label = ttk.Label(image_frame, text="生成的图像将显示在这里", anchor=tk.CENTER, relief=tk.GROOVE); self.image_label.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        self.image_label.bind("<Configure>", self._on_image_area_resize)
     def update_model_list(self, new_models):
         self.available_models = new_models; current_selection = self.model_var.get(); self.model_menu['values'] = self.available_models
-        if self.available_models: self.model_var.set(self.available_models if current_selection not in self.available_models else current_selection)
+        if self.available_models: self.model_var.set(self.available_models[0] if current_selection not in self.available_models else current_selection)
         else: self.model_var.set("")
     def _set_status(self, message): self.main_app.set_status(message)
+    def _open_batch_dialog(self):
+        if self.batch_dialog is not None and self.batch_dialog.winfo_exists(): self.batch_dialog.lift(); return
+        self.batch_dialog = ImageBatchDialog(self)
+    def get_base_payload(self):
+        """按当前参数构建批量生成共用的请求体 (不含 prompt)"""
+        width, height = map(int, self.size_var.get().split('x'))
+        payload = {"model": self.model_var.get(), "width": width, "height": height, "num_inference_steps": self.steps_var.get(), "guidance_scale": self.cfg_scale_var.get()}
+        neg_prompt = self.neg_prompt_input.get("1.0", tk.END).strip(); seed_str = self.seed_var.get()
+        if neg_prompt: payload["negative_prompt"] = neg_prompt
+        if seed_str.isdigit(): payload["seed"] = int(seed_str)
+        return payload
     def _toggle_buttons(self, enable_generate, enable_save): self.generate_button.config(state=tk.NORMAL if enable_generate else tk.DISABLED); self.save_button.config(state=tk.NORMAL if enable_save else tk.DISABLED)
-    def _start_generate_thread(self):
+    def _start_generate(self):
         api_key = self.api_key.get(); prompt = self.prompt_input.get("1.0", tk.END).strip()
         if not api_key: messagebox.showerror("错误", "请输入 API Key。", parent=self); return
         if not prompt: messagebox.showerror("错误", "请输入 Prompt。", parent=self); return
-        self._set_status("正在生成图像..."); self._toggle_buttons(False, False); self.image_data_bytes = None; self.image_label.config(image='', text="正在生成..."); self.update_idletasks()
-        thread = threading.Thread(target=self._generate_image, args=(api_key, prompt), daemon=True); thread.start()
-    def _generate_image(self, api_key, prompt):
-        neg_prompt = self.neg_prompt_input.get("1.0", tk.END).strip(); model = self.model_var.get(); size_str = self.size_var.get(); steps = self.steps_var.get(); cfg = self.cfg_scale_var.get(); seed_str = self.seed_var.get()
-        try: width, height = map(int, size_str.split('x'))
-        except ValueError: messagebox.showerror("错误", "无效的图像尺寸格式。", parent=self); self.after(0, self._set_status, "生成失败：无效尺寸"); self.after(0, self._toggle_buttons, True, False); return
-        payload = {"model": model, "prompt": prompt, "n": 1, "width": width, "height": height, "num_inference_steps": steps, "guidance_scale": cfg}
-        if neg_prompt: payload["negative_prompt"] = neg_prompt
-        if seed_str.isdigit(): payload["seed"] = int(seed_str)
-        headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
+        try: payload = dict(self.get_base_payload(), prompt=prompt, n=1)
+        except ValueError: messagebox.showerror("错误", "无效的图像尺寸格式。", parent=self); self._set_status("生成失败：无效尺寸"); return
+        self._set_status("正在生成图像..."); self._toggle_buttons(False, False); self._discard_downloads(); self._generation += 1; self.image_label.config(image='', text="正在生成..."); self.update_idletasks()
+        self.main_app.engine.submit(self._generate_image(api_key, payload, self._make_preview_feeder(), self.hedge_var.get()), group="image")
+    async def _generate_image(self, api_key, payload, preview_feeder, hedge=False):
+        ui = self.main_app.run_in_ui; engine = self.main_app.engine; http_client = self.main_app.http_client
+        image_cache = self.main_app.image_cache; cache_key = image_cache_key(payload) # 未固定 seed 时为 None，不查缓存
         try:
-            response = requests.post(IMAGE_API_URL, json=payload, headers=headers, timeout=120)
-            response.raise_for_status()
-            result = response.json()
+            cached = await engine.run_blocking(image_cache.get_path, cache_key) if cache_key else None
+            if cached:
+                cached_path, meta = cached
+                local_path = await engine.run_blocking(self._copy_into_downloads, cached_path, guess_image_extension(meta.get("url", ""), meta.get("content_type")))
+                ui(self._set_image_files, [local_path], cache_key)
+                ui(self._set_status, f"已从本地缓存加载图像 (seed {payload['seed']})，{format_cache_stats(image_cache.stats.snapshot())}")
+                ui(self._display_image); ui(self._toggle_buttons, True, True); return
+            # 按 images[] / data[] 结构提取 URL (结构不符时再遍历响应中的字符串)
+            image_urls, result = await self.main_app.api_client(api_key).generate_image(payload, hedge=hedge)
             print("--- DEBUG: Full API Response ---")
             print(result)
             print("--- END DEBUG ---")
-
-            # 整合后的 URL 提取逻辑
-            response_text = json.dumps(result)
-            image_url = None
-
-            # 尝试从 images 字段获取
-            if 'images' in result and isinstance(result['images'], list) and len(result['images']) > 0:
-                if isinstance(result['images'][0], dict) and 'url' in result['images'][0]:
-                    image_url = result['images'][0]['url']
-                    print(f"--- DEBUG: Found URL in images[0]['url']: {image_url}")
-
-            # 如果上面失败，尝试从 data 字段获取
-            if not image_url and 'data' in result and isinstance(result['data'], list) and len(result['data']) > 0:
-                 if isinstance(result['data'][0], dict) and 'url' in result['data'][0]:
-                    image_url = result['data'][0]['url']
-                    print(f"--- DEBUG: Found URL in data[0]['url']: {image_url}")
-
-            # 如果还是没找到，尝试直接从响应文本中提取URL
-            if not image_url:
-                url_matches = re.findall(r'https://[^"\']+\.(?:png|jpg|jpeg|gif)', response_text)
-                if url_matches:
-                    image_url = url_matches[0] # 取第一个匹配的 URL
-                    print(f"--- DEBUG: Extracted URL using regex: {image_url}")
+            image_url = image_urls[0] if image_urls else None
+            print(f"--- DEBUG: Extracted image URLs: {image_urls}")
 
             if image_url:
-                self._set_status(f"获取到图像 URL，正在下载...")
+                ui(self._set_status, f"获取到 {len(image_urls)} 个图像 URL，正在下载...")
                 try:
-                    print(f"--- DEBUG: Attempting to download image from URL...")
-                    print(f"--- DEBUG: URL to download: {image_url}")
-
-                    image_response = requests.get(image_url, timeout=60)
-                    image_response.raise_for_status()
-                    self.image_data_bytes = image_response.content
-                    print(f"--- DEBUG: Image downloaded successfully ({len(self.image_data_bytes)} bytes).")
-                    self._set_status("图像下载成功！")
-                    self.after(0, self._display_image)
-                    self.after(0, self._toggle_buttons, True, True)
+                    # 所有返回的图像并发地流式写入下载目录，不在内存中保留整张图
+                    downloads = await download_images(engine, http_client, image_urls, IMAGE_DOWNLOAD_DIR, on_first_chunk=preview_feeder)
+                    image_files = [await engine.run_blocking(self._finalize_download, d) for d in downloads]; ui(self._set_image_files, image_files, downloads[0]["token"])
+                    print(f"--- DEBUG: Images downloaded successfully ({', '.join(str(d['size']) for d in downloads)} bytes).")
+                    if cache_key:
+                        await engine.run_blocking(image_cache.put_file, cache_key, image_files[0], {"payload": payload, "url": image_url, "content_type": downloads[0]["content_type"], "seed": result.get("seed", payload["seed"])})
+                        ui(self._set_status, f"图像下载成功！{format_cache_stats(image_cache.stats.snapshot())}")
+                    else: ui(self._set_status, "图像下载成功！" if len(downloads) == 1 else f"图像下载成功！共 {len(downloads)} 张 (预览第一张，保存时全部保存)")
+                    ui(self._display_image)
+                    ui(self._toggle_buttons, True, True)
                 except requests.exceptions.RequestException as img_e:
                     error_msg = f"从 URL 下载图像失败: {img_e}"
                     print(f"--- DEBUG: Image download failed ---")
                     print(f"URL used for download: {image_url}")
                     print(f"Error: {img_e}")
                     print(f"--- END DEBUG ---")
-                    messagebox.showerror("下载错误", f"{error_msg}\n\n请检查网络连接或 URL 是否有效。\nURL: {image_url}", parent=self)
-                    self.after(0, self._set_status, "图像下载失败")
-                    self.after(0, self._toggle_buttons, True, False)
-                    self.after(0, self._display_error_in_area, f"下载失败: {error_msg}\nURL: {image_url}") # 在区域显示错误
+                    ui(messagebox.showerror, "下载错误", f"{error_msg}\n\n请检查网络连接或 URL 是否有效。\nURL: {image_url}", parent=self)
+                    ui(self._set_status, "图像下载失败")
+                    ui(self._toggle_buttons, True, False)
+                    ui(self._display_error_in_area, f"下载失败: {error_msg}\nURL: {image_url}") # 在区域显示错误
                 except Exception as display_e:
-                    messagebox.showerror("处理错误", f"下载或处理图像时出错: {display_e}", parent=self)
-                    self.after(0, self._set_status, "图像处理失败")
-                    self.after(0, self._toggle_buttons, True, False)
+                    ui(messagebox.showerror, "处理错误", f"下载或处理图像时出错: {display_e}", parent=self)
+                    ui(self._set_status, "图像处理失败")
+                    ui(self._toggle_buttons, True, False)
             else:
                 error_msg = "无法从 API 响应中提取图像 URL"
-                messagebox.showerror("API 错误", f"生成失败: {error_msg}\n\n请检查控制台输出获取详细的 API 响应内容。", parent=self)
-                self.after(0, self._set_status, f"生成失败: {error_msg}")
-                self.after(0, self._toggle_buttons, True, False)
-                self.after(0, self._display_error_in_area, f"生成失败: {error_msg}") # 在区域显示错误
+                ui(messagebox.showerror, "API 错误", f"生成失败: {error_msg}\n\n请检查控制台输出获取详细的 API 响应内容。", parent=self)
+                ui(self._set_status, f"生成失败: {error_msg}")
+                ui(self._toggle_buttons, True, False)
+                ui(self._display_error_in_area, f"生成失败: {error_msg}") # 在区域显示错误
 
         except requests.exceptions.RequestException as e:
             error_message = f"API 请求失败: {e}"
@@ -284,40 +508,158 @@ class ImageGenFrame(ttk.Frame):
                     error_message += f"\n错误详情: {error_detail.get('error', {}).get('message', e.response.text)}"
                 except ValueError:
                     error_message += f"\n服务器响应: {e.response.text}"
-            messagebox.showerror("API 错误", error_message, parent=self)
-            self.after(0, self._set_status, "生成失败")
-            self.after(0, self._toggle_buttons, True, False)
-            self.after(0, self._display_error_in_area, f"生成失败: {error_message}") # 在区域显示错误
+            ui(messagebox.showerror, "API 错误", error_message, parent=self)
+            ui(self._set_status, "生成失败")
+            ui(self._toggle_buttons, True, False)
+            ui(self._display_error_in_area, f"生成失败: {error_message}") # 在区域显示错误
         except Exception as e:
-            messagebox.showerror("错误", f"发生意外错误: {e}", parent=self)
-            self.after(0, self._set_status, "生成失败")
-            self.after(0, self._toggle_buttons, True, False)
-            self.after(0, self._display_error_in_area, f"生成失败: {e}") # 在区域显示错误
-
+            ui(messagebox.showerror, "错误", f"发生意外错误: {e}", parent=self)
+            ui(self._set_status, "生成失败")
+            ui(self._toggle_buttons, True, False)
+            ui(self._display_error_in_area, f"生成失败: {e}") # 在区域显示错误
+
+    @staticmethod
+    def _finalize_download(download):
+        """给下载好的临时文件加上正确的扩展名 (同目录内改名，不复制数据)"""
+        final_path = f"{download['path'][:-len('.part')]}.{download['ext']}"; os.replace(download["path"], final_path); return final_path
+    @staticmethod
+    def _copy_into_downloads(cached_path, ext):
+        """缓存条目复制到下载目录 (不硬链接)：之后保存的文件与缓存不共享数据"""
+        os.makedirs(IMAGE_DOWNLOAD_DIR, exist_ok=True)
+        fd, local_path = tempfile.mkstemp(dir=IMAGE_DOWNLOAD_DIR, prefix=".download-", suffix=f".{ext}"); os.close(fd)
+        copy_file(cached_path, local_path); return local_path
+    def _make_preview_feeder(self):
+        """在界面线程中调用 (读取预览区尺寸)，返回在下载线程中调用的回调：数据够多时生成低分辨率预览并交给界面线程显示"""
+        label_width = self.image_label.winfo_width(); label_height = self.image_label.winfo_height()
+        if label_width < 10 or label_height < 10: label_width, label_height = 400, 400
+        preview = IncrementalPreview(bucket_size(label_width - 20, label_height - 20)); generation = self._generation
+        def feed(chunk):
+            img = preview.feed(chunk)
+            if img is not None: self.main_app.run_in_ui(self._show_preview, generation, img)
+        return feed
+    def _show_preview(self, generation, img):
+        if generation != self._generation or self.image_files: return # 已有完整图像或已开始新的生成
+        self.photo_image = ImageTk.PhotoImage(img); self.image_label.config(image=self.photo_image, text=""); self._set_status("正在下载图像 (预览)...")
+    def _set_image_files(self, image_files, image_token): self.image_files = image_files; self.image_token = image_token # 界面线程：协程只通过这里交回结果
+    def _discard_downloads(self):
+        """删除上一次生成留在下载目录中的文件 (已保存的文件是硬链接或副本，不受影响)"""
+        for path in self.image_files:
+            try: os.remove(path)
+            except OSError: pass
+        self.image_files = []; self.image_token = None
     def _display_image(self):
-        if not self.image_data_bytes: return
+        """解码和缩小在网络引擎的工作线程中完成，界面线程只负责把缩好的图像交给 PhotoImage"""
+        if not self.image_files: return
+        label_width = self.image_label.winfo_width(); label_height = self.image_label.winfo_height()
+        if label_width < 10 or label_height < 10: label_width, label_height = 400, 400
+        size = bucket_size(label_width - 20, label_height - 20); path = self.image_files[0]
+        if self._displayed == (path, size): return # 同一张图、同一尺寸已经显示
+        self.main_app.engine.submit(self._prepare_thumbnail(path, self.image_token, size), group="image_view")
+    async def _prepare_thumbnail(self, path, token, size):
+        ui = self.main_app.run_in_ui
         try:
-            img = Image.open(io.BytesIO(self.image_data_bytes)); label_width = self.image_label.winfo_width(); label_height = self.image_label.winfo_height()
-            if label_width < 10 or label_height < 10: label_width, label_height = 400, 400
-            img_copy = img.copy(); img_copy.thumbnail((label_width - 20, label_height - 20), Image.Resampling.LANCZOS)
-            self.photo_image = ImageTk.PhotoImage(img_copy); self.image_label.config(image=self.photo_image, text="")
-        except Exception as e: messagebox.showerror("显示错误", f"无法显示图像: {e}", parent=self); self.image_label.config(image='', text="无法显示图像"); self._set_status("图像显示失败")
+            img = self.thumbnail_cache.get(token, size)
+            if img is None:
+                img = await self.main_app.engine.run_blocking(decode_thumbnail, path, size); self.thumbnail_cache.put(token, size, img)
+            ui(self._show_thumbnail, path, size, img)
+        except Exception as e:
+            ui(messagebox.showerror, "显示错误", f"无法显示图像: {e}", parent=self); ui(lambda: self.image_label.config(image='', text="无法显示图像")); ui(self._set_status, "图像显示失败")
+    def _show_thumbnail(self, path, size, img):
+        if not self.image_files or path != self.image_files[0]: return # 已经开始新的生成，丢弃过期结果
+        self.photo_image = ImageTk.PhotoImage(img); self.image_label.config(image=self.photo_image, text=""); self._displayed = (path, size)
+    def _on_image_area_resize(self, event):
+        if not self.image_files: return
+        if self._resize_job: self.after_cancel(self._resize_job)
+        self._resize_job = self.after(150, self._display_image) # 拖动窗口时只在停下后重新缩放一次
 
     def _display_error_in_area(self, error_message):
         self.image_label.config(image='', text=f"错误:\n{error_message}", wraplength=self.image_label.winfo_width()-20)
 
     def _save_image(self):
-        if not self.image_data_bytes: messagebox.showwarning("警告", "没有可保存的图像数据。请先生成图像。", parent=self); return
-        try: img_format = Image.open(io.BytesIO(self.image_data_bytes)).format; img_format = img_format.lower() if img_format else 'png'
-        except Exception: img_format = 'png'
+        if not self.image_files: messagebox.showwarning("警告", "没有可保存的图像数据。请先生成图像。", parent=self); return
+        img_format = os.path.splitext(self.image_files[0])[1].lstrip('.') or 'png'
         file_path = filedialog.asksaveasfilename(parent=self, defaultextension=f".{img_format}", filetypes=[(f"{img_format.upper()} 文件", f"*.{img_format}"), ("所有文件", "*.*")])
         if file_path:
             try:
-                with open(file_path, "wb") as f: f.write(self.image_data_bytes)
+                # 硬链接 (或复制) 已下载的文件，不再把图像数据重新写一遍；多张图像依次加 _2、_3 后缀
+                base, ext = os.path.splitext(file_path)
+                for index, src in enumerate(self.image_files): link_or_copy(src, file_path if index == 0 else f"{base}_{index + 1}{ext}")
                 self._set_status(f"图像已保存到: {file_path}"); messagebox.showinfo("成功", f"图像文件已成功保存到\n{file_path}", parent=self)
             except Exception as e: messagebox.showerror("保存错误", f"无法保存文件: {e}", parent=self); self._set_status("保存失败")
         else: self._set_status("保存操作已取消")
 
+# --- 批量文生图对话框 ---
+class ImageBatchDialog(tk.Toplevel):
+    def __init__(self, image_frame):
+        super().__init__(image_frame)
+        self.title("批量文生图"); self.geometry("560x520"); self.image_frame = image_frame; self.runner = None; self.loaded_prompts = None
+        self.n_per_prompt_var = tk.IntVar(value=1); self.workers_var = tk.IntVar(value=DEFAULT_IMAGE_BATCH_WORKERS)
+        self.output_dir_var = tk.StringVar(value=os.path.join(os.getcwd(), "batch_output")); self.progress_var = tk.StringVar(value="尚未开始")
+        self._create_widgets(); self.protocol("WM_DELETE_WINDOW", self._on_close)
+    def _create_widgets(self):
+        main_frame = ttk.Frame(self, padding="10"); main_frame.pack(fill=tk.BOTH, expand=True)
+        prompts_frame = ttk.LabelFrame(main_frame, text="提示词 (每行一个，或从 CSV/JSONL 文件加载)", padding="5"); prompts_frame.pack(fill=tk.BOTH, expand=True, pady=5)
+        self.prompts_input = scrolledtext.ScrolledText(prompts_frame, wrap=tk.WORD, height=10); self.prompts_input.pack(fill=tk.BOTH, expand=True)
+        ttk.Button(prompts_frame, text="从文件加载...", command=self._load_prompts).pack(anchor=tk.W, pady=(5, 0))
+        params_frame = ttk.LabelFrame(main_frame, text="批量参数 (其余参数取自文生图选项卡)", padding="5"); params_frame.pack(fill=tk.X, pady=5)
+        ttk.Label(params_frame, text="每个提示词张数:").grid(row=0, column=0, padx=5, pady=2, sticky=tk.W)
+        ttk.Spinbox(params_frame, from_=1, to=20, textvariable=self.n_per_prompt_var, width=6).grid(row=0, column=1, padx=5, pady=2, sticky=tk.W)
+        ttk.Label(params_frame, text="并发数:").grid(row=0, column=2, padx=5, pady=2, sticky=tk.W)
+        ttk.Spinbox(params_frame, from_=1, to=16, textvariable=self.workers_var, width=6).grid(row=0, column=3, padx=5, pady=2, sticky=tk.W)
+        ttk.Label(params_frame, text="输出目录:").grid(row=1, column=0, padx=5, pady=2, sticky=tk.W)
+        ttk.Entry(params_frame, textvariable=self.output_dir_var, width=40).grid(row=1, column=1, columnspan=3, padx=5, pady=2, sticky=tk.W+tk.E)
+        ttk.Button(params_frame, text="浏览...", command=self._select_output_dir).grid(row=1, column=4, padx=5, pady=2)
+        progress_frame = ttk.Frame(main_frame, padding="5"); progress_frame.pack(fill=tk.X, pady=5)
+        self.progress_bar = ttk.Progressbar(progress_frame, mode="determinate"); self.progress_bar.pack(fill=tk.X)
+        ttk.Label(progress_frame, textvariable=self.progress_var).pack(anchor=tk.W, pady=(5, 0))
+        action_frame = ttk.Frame(main_frame); action_frame.pack(fill=tk.X, pady=5)
+        self.start_button = ttk.Button(action_frame, text="开始批量生成", command=self._start_batch); self.start_button.pack(side=tk.LEFT, padx=5)
+        self.stop_button = ttk.Button(action_frame, text="停止", command=self._stop_batch, state=tk.DISABLED); self.stop_button.pack(side=tk.LEFT, padx=5)
+    def _load_prompts(self):
+        filetypes = [("提示词文件", "*.csv *.jsonl *.ndjson *.txt"), ("所有文件", "*.*")]
+        file_path = filedialog.askopenfilename(parent=self, title="选择提示词文件", filetypes=filetypes)
+        if not file_path: return
+        try: prompts = load_prompts_file(file_path)
+        except Exception as e: messagebox.showerror("加载错误", f"无法读取提示词文件: {e}", parent=self); return
+        self.loaded_prompts = prompts
+        self.prompts_input.delete("1.0", tk.END); self.prompts_input.insert(tk.END, "\n".join(p["prompt"] for p in prompts))
+        self.progress_var.set(f"已从 {os.path.basename(file_path)} 加载 {len(prompts)} 个提示词")
+    def _select_output_dir(self):
+        directory = filedialog.askdirectory(parent=self, title="选择输出目录")
+        if directory: self.output_dir_var.set(directory)
+    def _collect_prompts(self):
+        text_prompts = parse_prompt_lines(self.prompts_input.get("1.0", tk.END))
+        # 文本框内容未被修改时保留文件中的 negative_prompt / seed 等字段
+        if self.loaded_prompts and [p["prompt"] for p in self.loaded_prompts] == [p["prompt"] for p in text_prompts]: return self.loaded_prompts
+        return text_prompts
+    def _start_batch(self):
+        api_key = self.image_frame.api_key.get(); prompts = self._collect_prompts(); output_dir = self.output_dir_var.get().strip()
+        if not api_key: messagebox.showerror("错误", "请输入 API Key。", parent=self); return
+        if not prompts: messagebox.showerror("错误", "请至少输入一个提示词。", parent=self); return
+        if not output_dir: messagebox.showerror("错误", "请选择输出目录。", parent=self); return
+        try: base_payload = self.image_frame.get_base_payload(); n_per_prompt = self.n_per_prompt_var.get(); workers = self.workers_var.get()
+        except (ValueError, tk.TclError) as e: messagebox.showerror("错误", f"参数无效: {e}", parent=self); return
+        main_app = self.image_frame.main_app
+        self.runner = ImageBatchRunner(main_app.http_client, IMAGE_API_URL, api_key, base_payload, prompts, n_per_prompt, output_dir, max_workers=workers, on_progress=lambda *args: main_app.run_in_ui(self._on_progress, *args), cache=main_app.image_cache, hedge=self.image_frame.hedge_var.get())
+        self.progress_bar.config(maximum=self.runner.total, value=0); self.progress_var.set(f"0/{self.runner.total} 已完成")
+        self.start_button.config(state=tk.DISABLED); self.stop_button.config(state=tk.NORMAL)
+        self.image_frame._set_status(f"批量生成已开始: 共 {self.runner.total} 张图像")
+        runner = self.runner; finished = lambda _: self._on_batch_finished(runner)
+        main_app.engine.submit(runner.run(main_app.engine), group="image_batch", on_success=finished, on_error=finished)
+    def _on_progress(self, done, failed, total, per_minute):
+        if not self.winfo_exists(): return # 对话框已关闭
+        self.progress_bar.config(value=done + failed)
+        self.progress_var.set(f"{done}/{total} 已完成，{failed} 失败，吞吐 {per_minute:.1f} 张/分钟")
+    def _on_batch_finished(self, runner):
+        prefix = "批量生成已停止" if runner.cancelled else "批量生成完成"
+        self.image_frame._set_status(f"{prefix}: 成功 {runner.completed} 张，失败 {runner.failed} 张，输出目录 {runner.output_dir}")
+        if self.winfo_exists(): self.start_button.config(state=tk.NORMAL); self.stop_button.config(state=tk.DISABLED)
+    def _stop_batch(self):
+        if self.runner: self.runner.cancel(); self.stop_button.config(state=tk.DISABLED); self.progress_var.set("正在停止 (等待进行中的请求完成)...")
+    def _on_close(self):
+        if self.runner: self.runner.cancel(); self.image_frame.main_app.engine.cancel_group("image_batch")
+        self.destroy()
+
 # --- 文本转语音 (TTS) Frame 类 ---
 class TTSFrame(ttk.Frame):
     def __init__(self, parent_notebook, main_app, initial_models_dict):
@@ -325,11 +667,12 @@ class TTSFrame(ttk.Frame):
         self.pack_propagate(False); self.main_app = main_app
         self.available_models_dict = initial_models_dict; self.available_model_ids = list(self.available_models_dict.keys())
         self.api_key = tk.StringVar(value=DEFAULT_API_KEY)
-        default_model = DEFAULT_TTS_MODEL if DEFAULT_TTS_MODEL in self.available_model_ids else (self.available_model_ids if self.available_model_ids else "")
+        default_model = DEFAULT_TTS_MODEL if DEFAULT_TTS_MODEL in self.available_model_ids else (self.available_model_ids[0] if self.available_model_ids else "")
         self.model_var = tk.StringVar(value=default_model)
-        default_voices = self.available_models_dict.get(default_model, []); default_voice = DEFAULT_TTS_VOICE if DEFAULT_TTS_VOICE in default_voices else (default_voices if default_voices else "")
+        default_voices = self.available_models_dict.get(default_model, []); default_voice = DEFAULT_TTS_VOICE if DEFAULT_TTS_VOICE in default_voices else (default_voices[0] if default_voices else "")
         self.voice_var = tk.StringVar(value=default_voice); self.speed_var = tk.DoubleVar(value=1.0); self.gain_var = tk.DoubleVar(value=0.0); self.format_var = tk.StringVar(value=DEFAULT_TTS_FORMAT)
-        self.audio_data = None; self._create_widgets(); self._update_voice_options()
+        self.stream_var = tk.BooleanVar(value=True) # 流式合成：边接收边写盘/播放
+        self.audio_data = None; self.audio_file_path = None; self.long_text_job = None; self._create_widgets(); self._update_voice_options()
     def _create_widgets(self):
         main_frame = ttk.Frame(self, padding="10"); main_frame.pack(fill=tk.BOTH, expand=True)
         api_frame = ttk.LabelFrame(main_frame, text="API Key", padding="5"); api_frame.pack(fill=tk.X, pady=5)
@@ -349,52 +692,142 @@ class TTSFrame(ttk.Frame):
         gain_value_label = ttk.Label(params_frame, textvariable=self.gain_var); gain_value_label.grid(row=2, column=2, padx=5, pady=5, sticky=tk.W)
         format_label = ttk.Label(params_frame, text="格式:"); format_label.grid(row=3, column=0, padx=5, pady=5, sticky=tk.W)
         format_menu = ttk.Combobox(params_frame, textvariable=self.format_var, values=TTS_OUTPUT_FORMATS, state="readonly", width=10); format_menu.grid(row=3, column=1, padx=5, pady=5, sticky=tk.W)
+        stream_check = ttk.Checkbutton(params_frame, text="流式合成 (边接收边播放)", variable=self.stream_var); stream_check.grid(row=3, column=2, columnspan=2, padx=5, pady=5, sticky=tk.W)
         action_frame = ttk.Frame(main_frame, padding="5"); action_frame.pack(fill=tk.X, pady=10)
-        self.generate_button = ttk.Button(action_frame, text="生成语音", command=self._start_generate_thread, width=15); self.generate_button.pack(side=tk.LEFT, padx=10)
+        self.generate_button = ttk.Button(action_frame, text="生成语音", command=self._start_generate, width=15); self.generate_button.pack(side=tk.LEFT, padx=10)
         self.play_button = ttk.Button(action_frame, text="播放", command=self._play_audio, state=tk.DISABLED, width=15); self.play_button.pack(side=tk.LEFT, padx=10)
         self.save_button = ttk.Button(action_frame, text="保存", command=self._save_audio, state=tk.DISABLED, width=15); self.save_button.pack(side=tk.LEFT, padx=10)
+        self.stop_button = ttk.Button(action_frame, text="停止", command=self._stop_generate, state=tk.DISABLED, width=15); self.stop_button.pack(side=tk.LEFT, padx=10)
     def update_model_list(self, new_model_ids):
         self.available_model_ids = new_model_ids; current_selection = self.model_var.get(); self.model_menu['values'] = self.available_model_ids
         if self.available_model_ids:
-            if current_selection not in self.available_model_ids: self.model_var.set(self.available_model_ids); self._update_voice_options()
+            if current_selection not in self.available_model_ids: self.model_var.set(self.available_model_ids[0]); self._update_voice_options()
             else: self._update_voice_options()
         else: self.model_var.set(""); self.voice_var.set(""); self.voice_menu['values'] = []
     def _set_status(self, message): self.main_app.set_status(message)
     def _update_voice_options(self, event=None):
         selected_model = self.model_var.get(); voices = INITIAL_TTS_MODELS.get(selected_model, []); self.voice_menu['values'] = voices
-        if voices: current_voice = self.voice_var.get(); self.voice_var.set(voices if current_voice not in voices else current_voice)
+        if voices: current_voice = self.voice_var.get(); self.voice_var.set(voices[0] if current_voice not in voices else current_voice)
         else: self.voice_var.set("")
     def _toggle_buttons(self, enable):
         state = tk.NORMAL if enable else tk.DISABLED; self.generate_button.config(state=state)
         play_save_state = tk.NORMAL if enable and self.audio_data else tk.DISABLED; self.play_button.config(state=play_save_state); self.save_button.config(state=play_save_state)
-    def _start_generate_thread(self):
+        self.stop_button.config(state=tk.DISABLED if enable else tk.NORMAL)
+    def _start_generate(self):
         api_key = self.api_key.get(); text = self.text_input.get("1.0", tk.END).strip(); voice = self.voice_var.get()
         if not api_key: messagebox.showerror("错误", "请输入 API Key。", parent=self); return
         if not text: messagebox.showerror("错误", "请输入要转换的文本。", parent=self); return
         if not voice: messagebox.showerror("错误", "请选择一个音色。", parent=self); return
-        self._set_status("正在生成语音..."); self._toggle_buttons(False); self.audio_data = None
-        thread = threading.Thread(target=self._generate_speech, args=(api_key, text), daemon=True); thread.start()
-    def _generate_speech(self, api_key, text):
-        model = self.model_var.get(); voice_name = self.voice_var.get(); full_voice_id = f"{model}:{voice_name}"
-        speed = self.speed_var.get(); gain = self.gain_var.get(); response_format = self.format_var.get()
-        payload = {"model": model, "input": text, "voice": full_voice_id, "response_format": response_format, "speed": speed, "gain": gain, "stream": False}
+        model = self.model_var.get(); full_voice_id = f"{model}:{voice}"
+        payload = {"model": model, "input": text, "voice": full_voice_id, "response_format": self.format_var.get(), "speed": self.speed_var.get(), "gain": self.gain_var.get(), "stream": self.stream_var.get()}
+        self._set_status("正在生成语音..."); self._toggle_buttons(False); self.audio_data = None; self.audio_file_path = None
+        if len(text) > TTS_LONG_TEXT_THRESHOLD:
+            note = ""
+            if payload["response_format"] not in STITCHABLE_FORMATS: # opus 分段无法拼接成一个文件，播放和保存都按新格式
+                note = f"{payload['response_format']} 无法分段拼接，已改用 {LONG_TEXT_FALLBACK_FORMAT}；"
+                self.format_var.set(LONG_TEXT_FALLBACK_FORMAT); payload["response_format"] = LONG_TEXT_FALLBACK_FORMAT
+            self._start_long_text(api_key, payload, text, note); return
+        self.main_app.engine.submit(self._synthesize(api_key, payload), group="tts")
+    def _stop_generate(self): self.main_app.engine.cancel_group("tts"); self._set_status("正在停止语音生成...")
+    def _start_long_text(self, api_key, payload, text, note=""):
+        """长文本：分段并发合成。参数和文本未变且上次有失败段时，只重试失败段"""
+        base_payload = {k: v for k, v in payload.items() if k != "input"}
+        job = self.long_text_job
+        if not (job and job.matches(api_key, base_payload, text) and job.failed_indexes):
+            job = self.long_text_job = LongTextSynthesizer(self.main_app.http_client, TTS_API_URL, api_key, base_payload, text, max_chars=TTS_CHUNK_MAX_CHARS,
+                                                           max_workers=TTS_PARALLEL_CHUNKS, cache=self.main_app.tts_cache, on_progress=lambda done, total, failed: self.main_app.run_in_ui(self._on_long_text_progress, done, total, failed))
+        self._set_status(f"{note}长文本分段合成中: 共 {len(job.chunks)} 段，待合成 {len(job.failed_indexes)} 段...")
+        self.main_app.engine.submit(self._generate_long_text(job), group="tts")
+    def _on_long_text_progress(self, done, total, failed): self._set_status(f"长文本分段合成中: {done}/{total} 段完成" + (f"，{failed} 段失败" if failed else ""))
+    async def _generate_long_text(self, job):
+        ui = self.main_app.run_in_ui; engine = self.main_app.engine; started = time.monotonic()
+        try:
+            failed = await job.run(engine)
+            if failed:
+                first_error = job.errors.get(failed[0], "未知错误")
+                ui(messagebox.showerror, "部分失败", f"{len(failed)}/{len(job.chunks)} 段合成失败 (第 {', '.join(str(i + 1) for i in failed[:10])} 段)。\n首个错误: {first_error}\n\n再次点击“生成语音”将只重试失败的段。", parent=self)
+                ui(self._set_status, f"长文本合成未完成: {len(failed)} 段失败，可再次点击“生成语音”重试"); return
+            audio_data = await engine.run_blocking(job.stitched_audio); ui(self._set_audio, audio_data, finished_job=job)
+            ui(self._set_status, f"长文本语音生成成功！{len(job.chunks)} 段，{len(audio_data)} bytes，用时 {time.monotonic() - started:.1f}s")
+        except asyncio.CancelledError: ui(self._set_status, f"语音生成已停止 (已完成 {job.done_count}/{len(job.chunks)} 段，再次点击“生成语音”可继续)")
+        except Exception as e: ui(messagebox.showerror, "错误", f"拼接音频失败: {e}", parent=self); ui(self._set_status, "生成失败")
+        finally: ui(self._toggle_buttons, True)
+    async def _synthesize(self, api_key, payload):
+        """相同参数合成过的语音直接从缓存 (内存层 / 磁盘层) 取回，否则请求 API"""
+        ui = self.main_app.run_in_ui; engine = self.main_app.engine; cache = self.main_app.tts_cache
+        cached = await engine.run_blocking(cache.get, tts_cache_key(payload))
+        if not cached:
+            await (self._stream_speech(api_key, payload) if payload["stream"] else self._generate_speech(api_key, payload)); return
+        audio_data = cached[0]; ui(self._set_audio, audio_data); ui(self._toggle_buttons, True)
+        ui(self._set_status, f"已从缓存取回语音 ({len(audio_data)} bytes)，{format_cache_stats(cache.stats.snapshot())}")
+        player_command = find_stream_player(payload["response_format"]) if payload["stream"] else None
+        if player_command: await engine.run_blocking(self._pipe_to_player, player_command, audio_data) # 流式模式下保持“生成即播放”
+    def _set_audio(self, audio_data, file_path=None, finished_job=None):
+        """界面线程：协程只通过这里交回合成结果；finished_job 为已全部合成成功的长文本任务"""
+        self.audio_data = audio_data; self.audio_file_path = file_path
+        if finished_job is not None and self.long_text_job is finished_job: self.long_text_job = None
+    @staticmethod
+    def _pipe_to_player(player_command, audio_data): player = PipePlaybackSink(player_command); player.write(audio_data); player.close()
+    def _cache_audio(self, payload, audio_data): self.main_app.tts_cache.put(tts_cache_key(payload), audio_data, {"model": payload["model"], "voice": payload["voice"]})
+    async def _generate_speech(self, api_key, payload):
+        ui = self.main_app.run_in_ui; engine = self.main_app.engine
+        try:
+            audio_data = await self.main_app.api_client(api_key).synthesize_speech(payload); ui(self._set_audio, audio_data)
+            await engine.run_blocking(self._cache_audio, payload, audio_data)
+            ui(self._set_status, f"语音生成成功！({len(audio_data)} bytes)")
+        except requests.exceptions.RequestException as e:
+            error_message = f"API 请求失败: {e}"
+            if hasattr(e, 'response') and e.response is not None:
+                try: error_detail = e.response.json(); error_message += f"\n错误详情: {error_detail}"
+                except ValueError: error_message += f"\n服务器响应: {e.response.text}"
+            ui(messagebox.showerror, "API 错误", error_message, parent=self); ui(self._set_status, "生成失败")
+        except Exception as e: ui(messagebox.showerror, "错误", f"发生意外错误: {e}", parent=self); ui(self._set_status, "生成失败")
+        finally: ui(self._toggle_buttons, True)
+    async def _stream_speech(self, api_key, payload):
+        """流式合成：iter_content 逐块写入临时文件，并在找到 ffplay/mpv 时同时送入播放器边收边播"""
+        ui = self.main_app.run_in_ui; engine = self.main_app.engine
         headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
+        player_command = find_stream_player(payload["response_format"]); recorder = None; response = None; pumping = None
         try:
-            response = requests.post(TTS_API_URL, json=payload, headers=headers, timeout=60); response.raise_for_status()
-            self.audio_data = response.content; self._set_status(f"语音生成成功！({len(self.audio_data)} bytes)")
+            fd, file_path = tempfile.mkstemp(prefix="siliconflow_tts_", suffix=f".{payload['response_format']}"); os.close(fd)
+            player = await engine.run_blocking(PipePlaybackSink, player_command) if player_command else None
+            recorder = SpeechStreamRecorder(file_path, player)
+            response = await self.main_app.http_client.apost(engine, TTS_API_URL, "tts", json=payload, headers=headers, stream=True); response.raise_for_status()
+            chunks = response.iter_content(chunk_size=TTS_STREAM_CHUNK_SIZE); first_reported = False
+            while True:
+                # shield: 停止时正在进行的这一块不会被丢下不管，取消处理会等它写完再关闭文件和播放器
+                pumping = asyncio.ensure_future(engine.run_blocking(recorder.pump, chunks))
+                if not await asyncio.shield(pumping): break
+                if not first_reported and recorder.time_to_first_byte is not None:
+                    first_reported = True; ui(self._set_status, f"正在接收语音流... ({format_stream_stats(recorder.stats())})")
+            recorder.close(); audio_data = await engine.run_blocking(recorder.read_audio); ui(self._set_audio, audio_data, file_path)
+            await engine.run_blocking(self._cache_audio, payload, audio_data)
+            note = "" if player else " (未找到 ffplay/mpv，无法边收边播，可点击“播放”)"
+            ui(self._set_status, f"语音生成成功！{format_stream_stats(recorder.stats())}{note}")
+        except asyncio.CancelledError:
+            if recorder:
+                recorder.stopped.set()
+                if pumping is not None: await asyncio.wait({pumping}) # 最多再等一块数据 (或读取超时)
+                recorder.close(stop_player=True)
+            ui(self._set_status, "语音生成已停止")
         except requests.exceptions.RequestException as e:
             error_message = f"API 请求失败: {e}"
             if hasattr(e, 'response') and e.response is not None:
                 try: error_detail = e.response.json(); error_message += f"\n错误详情: {error_detail}"
                 except ValueError: error_message += f"\n服务器响应: {e.response.text}"
-            messagebox.showerror("API 错误", error_message, parent=self); self._set_status("生成失败")
-        except Exception as e: messagebox.showerror("错误", f"发生意外错误: {e}", parent=self); self._set_status("生成失败")
-        finally: self.after(0, self._toggle_buttons, True)
+            ui(messagebox.showerror, "API 错误", error_message, parent=self); ui(self._set_status, "生成失败")
+        except Exception as e: ui(messagebox.showerror, "错误", f"发生意外错误: {e}", parent=self); ui(self._set_status, "生成失败")
+        finally:
+            if recorder: recorder.close(stop_player=recorder.bytes_received == 0)
+            if response is not None: response.close()
+            ui(self._toggle_buttons, True)
     def _play_audio(self):
         if not self.audio_data: messagebox.showwarning("警告", "没有可播放的音频数据。", parent=self); return
         try:
             file_extension = self.format_var.get()
-            with tempfile.NamedTemporaryFile(delete=False, suffix=f".{file_extension}") as temp_audio_file: temp_audio_file.write(self.audio_data); temp_file_path = temp_audio_file.name
+            if self.audio_file_path and os.path.exists(self.audio_file_path): temp_file_path = self.audio_file_path # 流式合成时已经写好的文件
+            else:
+                with tempfile.NamedTemporaryFile(delete=False, suffix=f".{file_extension}") as temp_audio_file: temp_audio_file.write(self.audio_data); temp_file_path = temp_audio_file.name
             self._set_status(f"正在尝试播放: {temp_file_path}")
             if os.name == 'nt': os.startfile(temp_file_path)
             elif hasattr(os, 'uname') and os.uname().sysname == 'Darwin': subprocess.call(['open', temp_file_path])
@@ -417,10 +850,11 @@ class SpeechToTextFrame(ttk.Frame):
         super().__init__(parent_notebook, width=800, height=700)
         self.pack_propagate(False); self.main_app = main_app; self.available_models = initial_models
         self.api_key = tk.StringVar(value=DEFAULT_API_KEY)
-        default_model = DEFAULT_ASR_MODEL if DEFAULT_ASR_MODEL in self.available_models else (self.available_models if self.available_models else "")
+        default_model = DEFAULT_ASR_MODEL if DEFAULT_ASR_MODEL in self.available_models else (self.available_models[0] if self.available_models else "")
         self.model_var = tk.StringVar(value=default_model); self.language_var = tk.StringVar(value=DEFAULT_ASR_LANGUAGE)
         self.file_path_var = tk.StringVar(value="尚未选择文件"); self.transcription_result = tk.StringVar(value="")
-        self._create_widgets()
+        self.long_audio_var = tk.BooleanVar(value=False) # 长音频模式：在静音处分段并发转录
+        self.batch_dialog = None; self._create_widgets()
     def _create_widgets(self):
         main_frame = ttk.Frame(self, padding="10"); main_frame.pack(fill=tk.BOTH, expand=True)
         api_frame = ttk.LabelFrame(main_frame, text="API Key", padding="5"); api_frame.pack(fill=tk.X, pady=5)
@@ -434,7 +868,10 @@ class SpeechToTextFrame(ttk.Frame):
         lang_menu = ttk.Combobox(params_frame, textvariable=self.language_var, values=ASR_LANGUAGES, state="readonly", width=5); lang_menu.grid(row=0, column=1, padx=5, pady=2, sticky=tk.W)
         model_label = ttk.Label(params_frame, text="模型:"); model_label.grid(row=1, column=0, padx=5, pady=2, sticky=tk.W)
         self.model_menu = ttk.Combobox(params_frame, textvariable=self.model_var, values=self.available_models, state="readonly", width=25); self.model_menu.grid(row=1, column=1, padx=5, pady=2, sticky=tk.W)
-        self.transcribe_button = ttk.Button(main_frame, text="开始转录", command=self._start_transcribe_thread); self.transcribe_button.pack(pady=10)
+        long_audio_check = ttk.Checkbutton(params_frame, text="长音频分段模式", variable=self.long_audio_var); long_audio_check.grid(row=2, column=0, columnspan=2, padx=5, pady=2, sticky=tk.W)
+        action_frame = ttk.Frame(main_frame); action_frame.pack(pady=10)
+        self.transcribe_button = ttk.Button(action_frame, text="开始转录", command=self._start_transcribe); self.transcribe_button.pack(side=tk.LEFT, padx=5)
+        ttk.Button(action_frame, text="批量转录文件夹...", command=self._open_batch_dialog).pack(side=tk.LEFT, padx=5)
         result_frame = ttk.LabelFrame(main_frame, text="转录结果", padding="5"); result_frame.pack(fill=tk.BOTH, expand=True, pady=5)
         self.result_text = scrolledtext.ScrolledText(result_frame, wrap=tk.WORD, height=15, state=tk.DISABLED); self.result_text.pack(fill=tk.BOTH, expand=True)
     def _select_file(self):
@@ -443,7 +880,10 @@ class SpeechToTextFrame(ttk.Frame):
         if filepath: self.file_path_var.set(filepath); self._set_status(f"已选择文件: {os.path.basename(filepath)}")
         else: self._set_status("文件选择已取消")
     def _set_status(self, message): self.main_app.set_status(message)
-    def _start_transcribe_thread(self):
+    def _open_batch_dialog(self):
+        if self.batch_dialog is not None and self.batch_dialog.winfo_exists(): self.batch_dialog.lift(); return
+        self.batch_dialog = TranscriptionBatchDialog(self)
+    def _start_transcribe(self):
         api_key = self.api_key.get(); file_path = self.file_path_var.get(); language = self.language_var.get(); model = self.model_var.get()
         if not api_key: messagebox.showerror("错误", "请输入 API Key。", parent=self); return
         if not file_path or file_path == "尚未选择文件": messagebox.showerror("错误", "请选择要转录的音频文件。", parent=self); return
@@ -452,47 +892,125 @@ class SpeechToTextFrame(ttk.Frame):
         if not model: messagebox.showerror("错误", "请选择模型。", parent=self); return
         self._set_status("正在上传并转录音频..."); self.transcribe_button.config(state=tk.DISABLED)
         self.result_text.config(state=tk.NORMAL); self.result_text.delete('1.0', tk.END); self.result_text.config(state=tk.DISABLED)
-        thread = threading.Thread(target=self._transcribe_audio, args=(api_key, file_path, language, model), daemon=True); thread.start()
-    def _transcribe_audio(self, api_key, file_path, language, model):
-        headers = {"Authorization": f"Bearer {api_key}"}
-        audio_file = None
+        if self.long_audio_var.get(): self._start_long_transcribe(api_key, file_path, language, model); return
+        self.main_app.engine.submit(self._transcribe_audio(api_key, file_path, language, model), group="asr")
+    def _start_long_transcribe(self, api_key, file_path, language, model):
+        ui = self.main_app.run_in_ui
+        job = asr.LongAudioTranscriber(self.main_app.http_client, ASR_API_URL, api_key, model, language, file_path, segment_seconds=ASR_SEGMENT_SECONDS, max_workers=ASR_PARALLEL_SEGMENTS,
+                                   on_progress=lambda done, total, failed: ui(self._on_segment_progress, done, total, failed),
+                                   on_retry=lambda index, attempt: ui(self._on_segment_progress, *job.progress(), retry=(index, attempt)))
+        self._set_status("正在解码音频并查找静音切点...")
+        self.main_app.engine.submit(self._transcribe_long_audio(job), group="asr")
+    def _on_segment_progress(self, done, total, failed, retry=None):
+        text = f"长音频转录中: {done}/{total} 段完成" + (f"，{failed} 段失败" if failed else "")
+        if retry: text += f"，第 {retry[0] + 1} 段第 {retry[1]} 次重试..."
+        self._set_status(text)
+    async def _transcribe_long_audio(self, job):
+        ui = self.main_app.run_in_ui; started = time.monotonic()
+        try:
+            failed = await job.run(self.main_app.engine)
+            ui(self._display_transcription, job.merged_text())
+            duration = job.segments[-1][1] if job.segments else 0
+            if failed: ui(self._set_status, f"长音频转录完成，但有 {len(failed)}/{len(job.segments)} 段失败 (已在结果中标出)")
+            else: ui(self._set_status, f"长音频转录成功！{len(job.segments)} 段，音频 {duration:.0f}s，用时 {time.monotonic() - started:.1f}s")
+        except asyncio.CancelledError: ui(self._set_status, "转录已取消")
+        except Exception as e: ui(messagebox.showerror, "错误", f"长音频转录失败: {e}", parent=self); ui(self._set_status, "转录失败")
+        finally: ui(lambda: self.transcribe_button.config(state=tk.NORMAL))
+    async def _transcribe_audio(self, api_key, file_path, language, model):
+        ui = self.main_app.run_in_ui
         try:
-            audio_file = open(file_path, 'rb')
-            files = {'file': audio_file}
-            data = {'model': model, 'language': language}
-            response = requests.post(ASR_API_URL, headers=headers, files=files, data=data, timeout=180)
-            response.raise_for_status()
-            result = response.json()
+            result = await self.main_app.api_client(api_key).transcribe(file_path, model, language) # 文件在请求结束后即关闭
             print("--- DEBUG: Full ASR API Response ---"); print(result); print("--- END DEBUG ---")
             transcribed_text = result.get('text', '未能获取转录文本')
-            self.after(0, self._display_transcription, transcribed_text)
-            self._set_status("语音转录成功！")
+            ui(self._display_transcription, transcribed_text)
+            ui(self._set_status, "语音转录成功！")
         except requests.exceptions.RequestException as e:
             error_message = f"API 请求失败: {e}"
             if hasattr(e, 'response') and e.response is not None:
                 try: error_detail = e.response.json(); error_message += f"\n错误详情: {error_detail}"
                 except ValueError: error_message += f"\n服务器响应: {e.response.text}"
-            messagebox.showerror("API 错误", error_message, parent=self); self._set_status("转录失败")
+            ui(messagebox.showerror, "API 错误", error_message, parent=self); ui(self._set_status, "转录失败")
         except Exception as e:
-            messagebox.showerror("错误", f"发生意外错误: {e}", parent=self); self._set_status("转录失败")
+            ui(messagebox.showerror, "错误", f"发生意外错误: {e}", parent=self); ui(self._set_status, "转录失败")
         finally:
-            if audio_file and not audio_file.closed:
-                audio_file.close()
-                print(f"--- DEBUG: Audio file closed in finally block. ---")
-            self.after(0, lambda: self.transcribe_button.config(state=tk.NORMAL))
+            ui(lambda: self.transcribe_button.config(state=tk.NORMAL))
     def _display_transcription(self, text):
         self.result_text.config(state=tk.NORMAL); self.result_text.delete('1.0', tk.END)
         self.result_text.insert(tk.END, text); self.result_text.config(state=tk.DISABLED)
     def update_model_list(self, new_models):
         self.available_models = new_models; current_selection = self.model_var.get(); self.model_menu['values'] = self.available_models
-        if self.available_models: self.model_var.set(self.available_models if current_selection not in self.available_models else current_selection)
+        if self.available_models: self.model_var.set(self.available_models[0] if current_selection not in self.available_models else current_selection)
         else: self.model_var.set("")
 
+class TranscriptionBatchDialog(tk.Toplevel):
+    def __init__(self, stt_frame):
+        super().__init__(stt_frame)
+        self.title("批量转录文件夹"); self.geometry("560x300"); self.stt_frame = stt_frame; self.runner = None
+        self.input_dir_var = tk.StringVar(value=""); self.output_path_var = tk.StringVar(value=""); self.workers_var = tk.IntVar(value=DEFAULT_ASR_BATCH_WORKERS)
+        self.recursive_var = tk.BooleanVar(value=True); self.progress_var = tk.StringVar(value="尚未开始")
+        self._create_widgets(); self.protocol("WM_DELETE_WINDOW", self._on_close)
+    def _create_widgets(self):
+        main_frame = ttk.Frame(self, padding="10"); main_frame.pack(fill=tk.BOTH, expand=True)
+        params_frame = ttk.LabelFrame(main_frame, text="批量参数 (模型和语言取自语音转文本选项卡)", padding="5"); params_frame.pack(fill=tk.X, pady=5)
+        ttk.Label(params_frame, text="音频目录:").grid(row=0, column=0, padx=5, pady=2, sticky=tk.W)
+        ttk.Entry(params_frame, textvariable=self.input_dir_var, width=40).grid(row=0, column=1, columnspan=3, padx=5, pady=2, sticky=tk.W+tk.E)
+        ttk.Button(params_frame, text="浏览...", command=self._select_input_dir).grid(row=0, column=4, padx=5, pady=2)
+        ttk.Label(params_frame, text="结果文件:").grid(row=1, column=0, padx=5, pady=2, sticky=tk.W)
+        ttk.Entry(params_frame, textvariable=self.output_path_var, width=40).grid(row=1, column=1, columnspan=3, padx=5, pady=2, sticky=tk.W+tk.E)
+        ttk.Button(params_frame, text="浏览...", command=self._select_output_path).grid(row=1, column=4, padx=5, pady=2)
+        ttk.Label(params_frame, text="并发数:").grid(row=2, column=0, padx=5, pady=2, sticky=tk.W)
+        ttk.Spinbox(params_frame, from_=1, to=16, textvariable=self.workers_var, width=6).grid(row=2, column=1, padx=5, pady=2, sticky=tk.W)
+        ttk.Checkbutton(params_frame, text="包含子目录", variable=self.recursive_var).grid(row=2, column=2, columnspan=2, padx=5, pady=2, sticky=tk.W)
+        progress_frame = ttk.Frame(main_frame, padding="5"); progress_frame.pack(fill=tk.X, pady=5)
+        self.progress_bar = ttk.Progressbar(progress_frame, mode="determinate"); self.progress_bar.pack(fill=tk.X)
+        ttk.Label(progress_frame, textvariable=self.progress_var, wraplength=500).pack(anchor=tk.W, pady=(5, 0))
+        action_frame = ttk.Frame(main_frame); action_frame.pack(fill=tk.X, pady=5)
+        self.start_button = ttk.Button(action_frame, text="开始批量转录", command=self._start_batch); self.start_button.pack(side=tk.LEFT, padx=5)
+        self.stop_button = ttk.Button(action_frame, text="停止", command=self._stop_batch, state=tk.DISABLED); self.stop_button.pack(side=tk.LEFT, padx=5)
+    def _select_input_dir(self):
+        directory = filedialog.askdirectory(parent=self, title="选择音频目录")
+        if not directory: return
+        self.input_dir_var.set(directory)
+        if not self.output_path_var.get(): self.output_path_var.set(os.path.join(directory, ASR_BATCH_OUTPUT_NAME))
+    def _select_output_path(self):
+        file_path = filedialog.asksaveasfilename(parent=self, title="选择结果文件", defaultextension=".jsonl", confirmoverwrite=False, filetypes=[("JSONL 文件", "*.jsonl"), ("CSV 文件", "*.csv")])
+        if file_path: self.output_path_var.set(file_path)
+    def _start_batch(self):
+        frame = self.stt_frame; api_key = frame.api_key.get(); model = frame.model_var.get(); language = frame.language_var.get()
+        directory = self.input_dir_var.get().strip(); output_path = self.output_path_var.get().strip() or os.path.join(directory, ASR_BATCH_OUTPUT_NAME)
+        if not api_key: messagebox.showerror("错误", "请输入 API Key。", parent=self); return
+        if not model or not language: messagebox.showerror("错误", "请在语音转文本选项卡中选择模型和语言。", parent=self); return
+        if not directory or not os.path.isdir(directory): messagebox.showerror("错误", "请选择存在的音频目录。", parent=self); return
+        try: workers = self.workers_var.get()
+        except tk.TclError as e: messagebox.showerror("错误", f"参数无效: {e}", parent=self); return
+        main_app = frame.main_app; self.output_path_var.set(output_path)
+        self.runner = FolderTranscriptionRunner(main_app.http_client, ASR_API_URL, api_key, model, language, directory, output_path, max_workers=workers, recursive=self.recursive_var.get(),
+                                                on_progress=lambda *args: main_app.run_in_ui(self._on_progress, *args))
+        self.progress_bar.config(value=0); self.progress_var.set("正在扫描目录并读取已完成的记录...")
+        self.start_button.config(state=tk.DISABLED); self.stop_button.config(state=tk.NORMAL)
+        frame._set_status(f"批量转录已开始: {directory}")
+        runner = self.runner; finished = lambda _: self._on_batch_finished(runner)
+        main_app.engine.submit(runner.run(main_app.engine), group="asr_batch", on_success=finished, on_error=finished)
+    def _on_progress(self, done, skipped, failed, total, per_minute):
+        if not self.winfo_exists(): return # 对话框已关闭
+        self.progress_bar.config(maximum=max(total, 1), value=done + skipped + failed)
+        self.progress_var.set(f"{done + skipped + failed}/{total} 个文件: 转录 {done}，跳过 (已完成) {skipped}，失败 {failed}，吞吐 {per_minute:.1f} 个/分钟")
+    def _on_batch_finished(self, runner):
+        prefix = "批量转录已停止" if runner.cancelled else "批量转录完成"
+        self.stt_frame._set_status(f"{prefix}: 转录 {runner.completed} 个，跳过 {runner.skipped} 个，失败 {runner.failed} 个，结果写入 {runner.output_path}")
+        if self.winfo_exists(): self.start_button.config(state=tk.NORMAL); self.stop_button.config(state=tk.DISABLED)
+    def _stop_batch(self):
+        if self.runner: self.runner.cancel(); self.stop_button.config(state=tk.DISABLED); self.progress_var.set("正在停止 (等待进行中的请求完成)...")
+    def _on_close(self):
+        if self.runner: self.runner.cancel(); self.stt_frame.main_app.engine.cancel_group("asr_batch")
+        self.destroy()
+
 # --- 模型检测器 Frame 类 ---
 class ModelCheckerFrame(ttk.Frame):
     def __init__(self, parent_notebook, main_app):
         super().__init__(parent_notebook, width=800, height=700); self.pack_propagate(False); self.main_app = main_app
         self.api_key = tk.StringVar(value=DEFAULT_API_KEY); self.detected_image_models = []; self.detected_tts_models = []; self.detected_asr_models = []; self.detected_chat_models = [] # 添加聊天模型列表
+        self.metrics_dialog = None
         self._create_widgets()
     def _create_widgets(self):
         main_frame = ttk.Frame(self, padding="10"); main_frame.pack(fill=tk.BOTH, expand=True)
@@ -500,8 +1018,10 @@ class ModelCheckerFrame(ttk.Frame):
         api_frame = ttk.LabelFrame(top_frame, text="API Key", padding="5"); api_frame.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(0, 10))
         ttk.Entry(api_frame, textvariable=self.api_key, width=45, show="*").pack(fill=tk.X)
         button_frame = ttk.Frame(top_frame); button_frame.pack(side=tk.LEFT)
-        check_button = ttk.Button(button_frame, text="检测可用模型", command=self._start_check_thread); check_button.pack(side=tk.TOP, pady=(0, 5))
+        check_button = ttk.Button(button_frame, text="检测可用模型", command=self._start_check); check_button.pack(side=tk.TOP, pady=(0, 5))
         self.update_button = ttk.Button(button_frame, text="更新其他选项卡列表", command=self._update_other_tabs_models, state=tk.DISABLED); self.update_button.pack(side=tk.TOP)
+        ttk.Button(button_frame, text="连接复用统计", command=self._show_connection_stats).pack(side=tk.TOP, pady=(5, 0))
+        ttk.Button(button_frame, text="请求指标...", command=self._open_metrics_dialog).pack(side=tk.TOP, pady=(5, 0))
         paned_window = ttk.PanedWindow(main_frame, orient=tk.VERTICAL); paned_window.pack(fill=tk.BOTH, expand=True, pady=5)
         image_result_frame = ttk.LabelFrame(paned_window, text="可用文生图模型列表", padding="5", height=150); image_result_frame.pack_propagate(False); paned_window.add(image_result_frame, weight=1) # 调整高度
         self.image_result_text = scrolledtext.ScrolledText(image_result_frame, wrap=tk.WORD, state=tk.DISABLED); self.image_result_text.pack(fill=tk.BOTH, expand=True)
@@ -513,7 +1033,13 @@ class ModelCheckerFrame(ttk.Frame):
         self.chat_result_text = scrolledtext.ScrolledText(chat_result_frame, wrap=tk.WORD, state=tk.DISABLED); self.chat_result_text.pack(fill=tk.BOTH, expand=True)
 
     def _set_status(self, message): self.main_app.set_status(message)
-    def _start_check_thread(self):
+    def _show_connection_stats(self):
+        stats = self.main_app.http_client.connection_stats()
+        self._set_status(f"HTTP 请求 {stats['requests']} 次，复用连接 {stats['reused_connections']} 次，新建连接 {stats['new_connections']} 次 (复用率 {stats['reuse_ratio']:.0%})；{format_governor_stats(self.main_app.governor.snapshot())}；{format_policy_stats(self.main_app.http_client.policy.snapshot())}")
+    def _open_metrics_dialog(self):
+        if self.metrics_dialog and self.metrics_dialog.winfo_exists(): self.metrics_dialog.lift(); return
+        self.metrics_dialog = MetricsDialog(self, self.main_app.metrics)
+    def _start_check(self):
         api_key = self.api_key.get();
         if not api_key: messagebox.showerror("错误", "请输入 API Key。", parent=self); return
         self._set_status("正在检测模型..."); self.update_button.config(state=tk.DISABLED)
@@ -522,72 +1048,33 @@ class ModelCheckerFrame(ttk.Frame):
             text_widget.config(state=tk.NORMAL); text_widget.delete('1.0', tk.END); text_widget.config(state=tk.DISABLED)
         # 重置所有检测到的模型列表
         self.detected_image_models = []; self.detected_tts_models = []; self.detected_asr_models = []; self.detected_chat_models = []
-        thread = threading.Thread(target=self._check_models, args=(api_key,), daemon=True); thread.start()
-    def _check_models(self, api_key):
-        headers = {"Authorization": f"Bearer {api_key}"}
+        self.main_app.engine.submit(self._check_models(api_key), group="models")
+    async def _check_models(self, api_key):
+        ui = self.main_app.run_in_ui
         try:
-            response = requests.get(MODELS_LIST_API_URL, headers=headers, timeout=30); response.raise_for_status()
-            models_data = response.json(); print("--- DEBUG: Full Models API Response ---"); print(models_data); print("--- END DEBUG ---")
-            self.detected_image_models = []; self.detected_tts_models = []; self.detected_asr_models = []; self.detected_chat_models = [] # 重置列表
-            # 更新关键词列表以包含新模型类型 (保持之前的更新, 确保 vision/reasoning 关键词在 chat_keywords 中)
-            chat_keywords = ["chat", "instruct", "llama", "qwen", "deepseek", "mistral", "mixtral", "gemma", "glm", "yi", "chatglm", "internlm", "coder", "vl", "preview", "distill", "rumination", "glm-z1", "qwen3", "v2.5", "v3", "qwq", "qvq", "-r1", "-z1", "-a3b", "-a22b", "vision", "reasoning", "internvl"] # 添加 vision/reasoning/internvl
-            image_keywords = ['stable-diffusion', 'sdxl', 'flux', 'kolors', 'image', 'sd3']
-            tts_keywords = ['audio', 'speech', 'tts', 'cosyvoice', 'fish', 'sovits']
-            asr_keywords = ['sensevoice', 'asr', 'transcription']
-            # 明确排除 embedding/reranker 模型
-            exclude_keywords = ['embed', 'bge-', 'bce-', 'reranker']
-
-            if 'data' in models_data and isinstance(models_data['data'], list):
-                for model_info in models_data['data']:
-                    model_id = model_info.get('id', '').lower(); model_id_original = model_info.get('id', '未知ID')
-                    # 改进分类逻辑：先排除，再按优先级分类
-                    if any(keyword in model_id for keyword in exclude_keywords):
-                        continue # 跳过 embedding/reranker 模型
-
-                    is_classified = False
-                    # 1. 图像模型
-                    if any(keyword in model_id for keyword in image_keywords):
-                        self.detected_image_models.append(model_id_original); is_classified = True
-                    # 2. TTS 模型 (排除包含聊天/视觉关键词的模型)
-                    if not is_classified and any(keyword in model_id for keyword in tts_keywords) and not any(chat_kw in model_id for chat_kw in ["vl", "chat", "instruct"]):
-                        self.detected_tts_models.append(model_id_original); is_classified = True
-                    # 3. ASR 模型
-                    if not is_classified and any(keyword in model_id for keyword in asr_keywords):
-                        self.detected_asr_models.append(model_id_original); is_classified = True
-                    # 4. 聊天模型 (包含所有剩余的含聊天/视觉/推理关键词的模型)
-                    if not is_classified and any(keyword in model_id for keyword in chat_keywords):
-                        self.detected_chat_models.append(model_id_original); is_classified = True
-                    # 5. 捕获其他未分类的模型
-                    elif not is_classified:
-                       print(f"--- DEBUG: Unclassified model: {model_id_original}")
-
-
-            # 去重并排序
-            self.detected_image_models = sorted(list(set(self.detected_image_models)))
-            self.detected_tts_models = sorted(list(set(self.detected_tts_models)))
-            self.detected_asr_models = sorted(list(set(self.detected_asr_models)))
-            self.detected_chat_models = sorted(list(set(self.detected_chat_models)))
+            catalog, not_modified = await self.main_app.fetch_model_catalog(api_key)
 
             status_msg = []
-            if self.detected_image_models: status_msg.append(f"检测到 {len(self.detected_image_models)} 个文生图")
-            if self.detected_tts_models: status_msg.append(f"检测到 {len(self.detected_tts_models)} 个 TTS")
-            if self.detected_asr_models: status_msg.append(f"检测到 {len(self.detected_asr_models)} 个 ASR")
-            if self.detected_chat_models: status_msg.append(f"检测到 {len(self.detected_chat_models)} 个聊天") # 添加聊天模型计数
+            if catalog["image"]: status_msg.append(f"检测到 {len(catalog['image'])} 个文生图")
+            if catalog["tts"]: status_msg.append(f"检测到 {len(catalog['tts'])} 个 TTS")
+            if catalog["asr"]: status_msg.append(f"检测到 {len(catalog['asr'])} 个 ASR")
+            if catalog["chat"]: status_msg.append(f"检测到 {len(catalog['chat'])} 个聊天") # 添加聊天模型计数
             final_status = "，".join(status_msg) + " 模型。" if status_msg else "未检测到相关模型或 API 返回格式不符。"
-            if not status_msg: messagebox.showwarning("未找到模型", "未能识别出文生图、TTS、ASR 或聊天模型。\n请检查 API Key 或控制台输出。", parent=self)
-            self._set_status(final_status)
-            # 只要检测到任何一种模型，就启用更新按钮
-            if self.detected_image_models or self.detected_tts_models or self.detected_asr_models or self.detected_chat_models:
-                self.after(0, lambda: self.update_button.config(state=tk.NORMAL))
-            self.after(0, self._display_models)
+            if not_modified: final_status += " (模型目录未变化，使用本地缓存)"
+            if not status_msg: ui(messagebox.showwarning, "未找到模型", "未能识别出文生图、TTS、ASR 或聊天模型。\n请检查 API Key 或控制台输出。", parent=self)
+            ui(self._set_status, final_status)
+            ui(self._display_models, catalog) # 检测结果在界面线程中保存和显示
         except requests.exceptions.RequestException as e:
             error_message = f"API 请求失败: {e}"
             if hasattr(e, 'response') and e.response is not None:
                 try: error_detail = e.response.json(); error_message += f"\n错误详情: {error_detail}"
                 except ValueError: error_message += f"\n服务器响应: {e.response.text}"
-            messagebox.showerror("API 错误", error_message, parent=self); self._set_status("检测失败")
-        except Exception as e: messagebox.showerror("错误", f"发生意外错误: {e}", parent=self); self._set_status("检测失败")
-    def _display_models(self):
+            ui(messagebox.showerror, "API 错误", error_message, parent=self); ui(self._set_status, "检测失败")
+        except Exception as e: ui(messagebox.showerror, "错误", f"发生意外错误: {e}", parent=self); ui(self._set_status, "检测失败")
+    def _display_models(self, catalog):
+        self.detected_image_models = catalog["image"]; self.detected_tts_models = catalog["tts"]; self.detected_asr_models = catalog["asr"]; self.detected_chat_models = catalog["chat"]
+        # 只要检测到任何一种模型，就启用更新按钮
+        if any(catalog.values()): self.update_button.config(state=tk.NORMAL)
         self.image_result_text.config(state=tk.NORMAL); self.image_result_text.delete('1.0', tk.END); self.image_result_text.insert(tk.END, "\n".join(self.detected_image_models) if self.detected_image_models else "未找到可用的文生图模型。"); self.image_result_text.config(state=tk.DISABLED)
         self.tts_result_text.config(state=tk.NORMAL); self.tts_result_text.delete('1.0', tk.END); self.tts_result_text.insert(tk.END, "\n".join(self.detected_tts_models) if self.detected_tts_models else "未找到可用的文本转语音模型。"); self.tts_result_text.config(state=tk.DISABLED)
         self.asr_result_text.config(state=tk.NORMAL); self.asr_result_text.delete('1.0', tk.END); self.asr_result_text.insert(tk.END, "\n".join(self.detected_asr_models) if self.detected_asr_models else "未找到可用的语音转文本模型。"); self.asr_result_text.config(state=tk.DISABLED)
@@ -595,31 +1082,316 @@ class ModelCheckerFrame(ttk.Frame):
         self.chat_result_text.config(state=tk.NORMAL); self.chat_result_text.delete('1.0', tk.END); self.chat_result_text.insert(tk.END, "\n".join(self.detected_chat_models) if self.detected_chat_models else "未找到可用的聊天模型。"); self.chat_result_text.config(state=tk.DISABLED)
 
     def _update_other_tabs_models(self):
+        catalog = {"image": self.detected_image_models, "tts": self.detected_tts_models, "asr": self.detected_asr_models, "chat": self.detected_chat_models}
         # 检查是否有任何模型被检测到
-        if not any([self.detected_image_models, self.detected_tts_models, self.detected_asr_models, self.detected_chat_models]):
+        if not any(catalog.values()):
             messagebox.showinfo("无模型", "没有检测到可更新的模型列表。", parent=self); return
-
-        updated_tabs = [] # 用于记录哪些选项卡被更新了
-        # 更新文生图
-        if self.detected_image_models:
-            try: self.main_app.image_gen_frame.update_model_list(self.detected_image_models); updated_tabs.append("文生图")
-            except Exception as e: messagebox.showerror("更新错误", f"更新文生图模型列表时出错: {e}", parent=self)
-        # 更新 TTS
-        if self.detected_tts_models:
-             try: self.main_app.tts_frame.update_model_list(self.detected_tts_models); updated_tabs.append("TTS")
-             except Exception as e: messagebox.showerror("更新错误", f"更新 TTS 模型列表时出错: {e}", parent=self)
-        # 更新 ASR
-        if self.detected_asr_models:
-             try: self.main_app.stt_frame.update_model_list(self.detected_asr_models); updated_tabs.append("ASR")
-             except Exception as e: messagebox.showerror("更新错误", f"更新 ASR 模型列表时出错: {e}", parent=self)
-        # 更新聊天
-        if self.detected_chat_models:
-             try: self.main_app.chat_frame.update_model_list(self.detected_chat_models); updated_tabs.append("聊天")
-             except Exception as e: messagebox.showerror("更新错误", f"更新聊天模型列表时出错: {e}", parent=self)
-
-        if updated_tabs:
-            messagebox.showinfo("更新成功", f"{'、'.join(updated_tabs)} 模型列表已更新！\n请切换到对应选项卡查看。", parent=self); self._set_status("模型列表已更新到其他选项卡。")
-        else: self._set_status("模型列表更新失败。")
+        try: changes = self.main_app.apply_model_catalog(catalog) # 只更新发生变化的选项卡
+        except Exception as e: messagebox.showerror("更新错误", f"更新模型列表时出错: {e}", parent=self); self._set_status("模型列表更新失败。"); return
+        if changes:
+            messagebox.showinfo("更新成功", f"{'、'.join(changes)} 模型列表已更新！\n请切换到对应选项卡查看。", parent=self); self._set_status("模型列表已更新到其他选项卡。")
+        else: self._set_status("其他选项卡的模型列表已是最新。")
+
+class MetricsDialog(tk.Toplevel):
+    """按端点 / 模型汇总的请求耗时 (中位数 p50、p95) 与流量，定时刷新"""
+    COLUMNS = (("endpoint", "端点", 80), ("model", "模型", 200), ("requests", "请求", 50), ("errors", "失败", 45), ("connect", "建连 p50", 70), ("ttfb", "首字节 p50", 75),
+               ("total", "总耗时 p50", 75), ("total_p95", "总耗时 p95", 75), ("bytes", "发送 / 接收", 120), ("ttft", "首 token p50", 80), ("rate", "token/s p50", 75))
+    def __init__(self, parent, metrics):
+        super().__init__(parent)
+        self.title("请求指标"); self.geometry("1000x360"); self.metrics = metrics; self.info_var = tk.StringVar(value=""); self._refresh_job = None
+        self._create_widgets(); self._refresh(); self.protocol("WM_DELETE_WINDOW", self._on_close)
+    def _create_widgets(self):
+        main_frame = ttk.Frame(self, padding="10"); main_frame.pack(fill=tk.BOTH, expand=True)
+        tree_frame = ttk.Frame(main_frame); tree_frame.pack(fill=tk.BOTH, expand=True)
+        self.tree = ttk.Treeview(tree_frame, columns=[c[0] for c in self.COLUMNS], show="headings", selectmode="browse")
+        for column, heading, width in self.COLUMNS: self.tree.heading(column, text=heading); self.tree.column(column, width=width, anchor=tk.W if column in ("endpoint", "model") else tk.E)
+        scrollbar = ttk.Scrollbar(tree_frame, orient=tk.VERTICAL, command=self.tree.yview); self.tree.configure(yscrollcommand=scrollbar.set)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True); scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        ttk.Label(main_frame, textvariable=self.info_var).pack(anchor=tk.W, pady=(5, 0))
+        action_frame = ttk.Frame(main_frame); action_frame.pack(fill=tk.X, pady=(5, 0))
+        ttk.Button(action_frame, text="清空", command=self._reset).pack(side=tk.LEFT, padx=5)
+        ttk.Button(action_frame, text="导出 Prometheus...", command=self._export_prometheus).pack(side=tk.RIGHT, padx=5)
+        ttk.Button(action_frame, text="导出 CSV...", command=self._export_csv).pack(side=tk.RIGHT, padx=5)
+    def _refresh(self):
+        rows = self.metrics.summary()
+        self.tree.delete(*self.tree.get_children())
+        for row in rows:
+            rate = f"{row['tokens_per_s_p50']:.1f}" if row["tokens_per_s_p50"] is not None else "-"
+            self.tree.insert("", tk.END, values=(row["endpoint"], row["model"] or "-", row["requests"], row["errors"], format_seconds(row["connect_p50"]), format_seconds(row["ttfb_p50"]),
+                                                  format_seconds(row["total_p50"]), format_seconds(row["total_p95"]), f"{format_bytes(row['bytes_out'])} / {format_bytes(row['bytes_in'])}", format_seconds(row["ttft_p50"]), rate))
+        since = time.strftime("%H:%M:%S", time.localtime(self.metrics.started_at))
+        self.info_var.set(f"自 {since} 起共 {sum(row['requests'] for row in rows)} 次请求 (分位数按直方图桶估算；聊天的 token 按流式增量块计数)")
+        self._refresh_job = self.after(METRICS_REFRESH_MS, self._refresh)
+    def _reset(self):
+        if not messagebox.askyesno("清空指标", "确定要清空已记录的请求指标吗？", parent=self): return
+        self.metrics.reset(); self.after_cancel(self._refresh_job); self._refresh()
+    def _export_csv(self):
+        file_path = filedialog.asksaveasfilename(parent=self, title="导出请求记录", defaultextension=".csv", filetypes=[("CSV 文件", "*.csv")])
+        if not file_path: return
+        try: count = self.metrics.export_csv(file_path)
+        except OSError as e: messagebox.showerror("导出失败", f"写入文件时出错: {e}", parent=self); return
+        self.info_var.set(f"已导出最近 {count} 条记录到 {file_path}")
+    def _export_prometheus(self):
+        file_path = filedialog.asksaveasfilename(parent=self, title="导出 Prometheus 文本文件", defaultextension=".prom", filetypes=[("Prometheus 文本文件", "*.prom"), ("所有文件", "*.*")])
+        if not file_path: return
+        try: self.metrics.export_prometheus(file_path)
+        except OSError as e: messagebox.showerror("导出失败", f"写入文件时出错: {e}", parent=self); return
+        self.info_var.set(f"已导出到 {file_path}")
+    def _on_close(self):
+        if self._refresh_job: self.after_cancel(self._refresh_job)
+        self.destroy()
+
+# --- 流式输出渲染器 ---
+class TranscriptView:
+   """Chat transcript backed by a list of message blocks, of which only the newest few are materialized in the Text widget.
+
+   Each materialized block carries a "b<id>" tag so it can be dropped or re-rendered in place.
+   Scrolling to the top pages older blocks back in, first from the in-memory list and then from
+   load_older (e.g. a saved session); reasoning blocks render as a one-line header until clicked,
+   so long chains of thought never reach the widget unless asked for. The backing store itself is
+   capped at max_retained blocks: older ones are released and a notice takes their place at the top.
+   """
+   PREFIXES = {"user": "You: ", "assistant": "AI: ", "system": "System: ", "reasoning": "System: ", "error": "Error: "}
+
+   def __init__(self, widget, max_blocks=CHAT_TRANSCRIPT_MAX_BLOCKS, page_blocks=CHAT_TRANSCRIPT_PAGE_BLOCKS, max_retained=CHAT_TRANSCRIPT_RETAINED_BLOCKS):
+       self.widget = widget
+       self.max_blocks = max_blocks
+       self.page_blocks = page_blocks
+       self.max_retained = max(max_retained, max_blocks)
+       self.released = 0 # Blocks dropped from the backing store by _trim
+       self._notice_shown = False
+       self.blocks = [] # Backing store: {"id", "role", "text", "tag", "expanded", "open"}
+       self.first = 0 # Index of the oldest materialized block
+       self.load_older = None # Optional callable(count) -> [(role, text)] for blocks older than self.blocks[0]
+       self._next_id = 0
+       self._page_job = None
+       self._scroll_set = widget.vbar.set # ScrolledText's scrollbar; wrapped to notice reaching the top
+       widget.configure(yscrollcommand=self._on_yscroll)
+       widget.tag_configure("reasoning_toggle", foreground="gray", underline=True)
+       widget.tag_bind("reasoning_toggle", "<Button-1>", self._on_toggle_click)
+       widget.tag_bind("reasoning_toggle", "<Enter>", lambda e: widget.config(cursor="hand2"))
+       widget.tag_bind("reasoning_toggle", "<Leave>", lambda e: widget.config(cursor=""))
+
+   def append(self, role, text, tag=None):
+       """Adds a complete message block at the end."""
+       self.end_stream()
+       self.blocks.append(self._new_block(role, text, tag, is_open=False))
+       self._edit(lambda: self.widget.insert(tk.END, *self._render(self.blocks[-1])))
+       self._trim()
+
+   def append_stream(self, segments):
+       """Appends streamed [(role, text)] segments, extending the open block of the same role (UI thread only)."""
+       def apply():
+           for role, text in segments:
+               last = self.blocks[-1] if self.blocks else None
+               if last is not None and last["open"] and last["role"] == role:
+                   last["text"] += text
+                   if role == "reasoning" and not last["expanded"]:
+                       self._rerender(last) # Only the header's character count changes
+                   else:
+                       self.widget.insert(tk.END, text, (last["tag"], f"b{last['id']}"))
+               else:
+                   self._close_open_block()
+                   self.blocks.append(self._new_block(role, text, None, is_open=True))
+                   self.widget.insert(tk.END, *self._render(self.blocks[-1]))
+       self._edit(apply)
+       self._trim()
+
+   def end_stream(self):
+       """Closes the block that is still receiving streamed text, if any."""
+       if self.blocks and self.blocks[-1]["open"]:
+           self._edit(self._close_open_block)
+
+   def clear(self, load_older=None):
+       """Empties the view; load_older (if given) supplies the history behind the next appended blocks."""
+       def wipe():
+           self.widget.delete("1.0", tk.END)
+           for block in self.blocks[self.first:]:
+               self.widget.tag_delete(f"b{block['id']}")
+       self._edit(wipe)
+       self.blocks = []
+       self.first = 0
+       self.load_older = load_older
+       self.released = 0
+       self._notice_shown = False
+
+   def _new_block(self, role, text, tag, is_open):
+       # Reasoning uses the "system" style; tag overrides the role's style for plain blocks
+       self._next_id += 1
+       return {"id": self._next_id, "role": role, "text": text, "tag": tag or ("system" if role == "reasoning" else role), "expanded": False, "open": is_open}
+
+   def _close_open_block(self):
+       if not self.blocks or not self.blocks[-1]["open"]:
+           return
+       block = self.blocks[-1]
+       block["open"] = False
+       if block["role"] == "reasoning" and not block["expanded"]:
+           self._rerender(block) # Drop the "receiving" note from the header
+       else:
+           self.widget.insert(tk.END, "\n\n", (block["tag"], f"b{block['id']}"))
+
+   def _render(self, block):
+       """Returns Text.insert() arguments (text, tags, text, tags, ...) for one block."""
+       block_tag = f"b{block['id']}"
+       end = "" if block["open"] else "\n\n"
+       if block["role"] != "reasoning":
+           return (f"{self.PREFIXES.get(block['role'], '')}{block['text']}{end}", (block["tag"], block_tag))
+       header = f"{'▼' if block['expanded'] else '▶'} 推理过程 ({len(block['text'])} 字{'，正在接收' if block['open'] else ''}，点击{'折叠' if block['expanded'] else '展开'})"
+       if not block["expanded"]:
+           return (header + ("\n" if block["open"] else "\n\n"), ("reasoning_toggle", block_tag))
+       return (header + "\n", ("reasoning_toggle", block_tag), f"{self.PREFIXES['reasoning']}{block['text']}{end}", (block["tag"], block_tag))
+
+   def _rerender(self, block):
+       """Replaces a materialized block's text in place (caller holds the widget in NORMAL state)."""
+       ranges = self.widget.tag_ranges(f"b{block['id']}")
+       if not ranges:
+           return
+       start = self.widget.index(ranges[0])
+       self.widget.delete(start, ranges[-1])
+       self.widget.insert(start, *self._render(block))
+
+   def _on_toggle_click(self, event):
+       for name in self.widget.tag_names(f"@{event.x},{event.y}"):
+           if name.startswith("b") and name[1:].isdigit():
+               block = next((b for b in self.blocks[self.first:] if b["id"] == int(name[1:])), None)
+               if block is None:
+                   return "break"
+               block["expanded"] = not block["expanded"]
+               self._edit(lambda: self._rerender(block))
+               return "break"
+
+   def _trim(self):
+       """Drops the oldest materialized blocks beyond max_blocks, then releases the backing store beyond max_retained."""
+       excess = len(self.blocks) - self.first - self.max_blocks
+       if excess > 0:
+           dropped = self.blocks[self.first:self.first + excess]
+           ranges = self.widget.tag_ranges(f"b{dropped[-1]['id']}")
+           def drop():
+               if ranges:
+                   self.widget.delete("1.0", ranges[-1]) # Also removes the release notice, if shown
+               for block in dropped:
+                   self.widget.tag_delete(f"b{block['id']}")
+           self._edit(drop)
+           self.first += excess
+           self._notice_shown = False
+       release = min(self.first, len(self.blocks) - self.max_retained) # Only blocks no longer in the widget
+       if release > 0:
+           del self.blocks[:release]
+           self.first -= release
+           self.released += release
+           self.load_older = None # Its cursor sits behind the released blocks; paging it in would leave a gap
+
+   def _on_yscroll(self, first, last):
+       self._scroll_set(first, last)
+       if float(first) <= 0.0 and (self.first > 0 or self.load_older or (self.released and not self._notice_shown)) and self._page_job is None:
+           self._page_job = self.widget.after_idle(self._page_in) # Not from inside the scroll callback
+
+   def _page_in(self):
+       """Materializes the previous page of blocks above the current top, keeping the view anchored."""
+       self._page_job = None
+       if self.first == 0 and self.load_older:
+           older = self.load_older(self.page_blocks)
+           if not older:
+               self.load_older = None # Reached the beginning of the history
+           self.blocks[:0] = [self._new_block(role, text, None, is_open=False) for role, text in older]
+           self.first = len(older)
+       if self.first == 0:
+           if self.released and not self._notice_shown:
+               self._notice_shown = True
+               self._edit(lambda: self.widget.insert("1.0", f"(更早的 {self.released} 条消息已从内存中释放；已保存的会话可在“会话”列表中重新打开查看)\n\n", ("system",)))
+           return
+       anchor = f"b{self.blocks[self.first]['id']}.first" if self.first < len(self.blocks) else tk.END
+       start = max(0, self.first - self.page_blocks)
+       insert_args = []
+       for block in self.blocks[start:self.first]:
+           insert_args.extend(self._render(block))
+       self._edit(lambda: self.widget.insert("1.0", *insert_args))
+       self.first = start
+       self.widget.yview(anchor)
+
+   def _edit(self, action):
+       self.widget.config(state=tk.NORMAL)
+       try:
+           action()
+       finally:
+           self.widget.config(state=tk.DISABLED)
+
+
+class StreamRenderer:
+   """Buffers streamed deltas (from any thread) and flushes them into a TranscriptView at a bounded frame rate.
+
+   Each flush toggles the widget state once, appends all pending text in one pass
+   (one segment per consecutive role) and scrolls once, instead of doing so per SSE delta.
+   """
+   def __init__(self, view, interval_ms=STREAM_FLUSH_INTERVAL_MS, on_stats=None):
+       self.view = view
+       self.widget = view.widget
+       self.interval_ms = interval_ms
+       self.on_stats = on_stats
+       self._lock = threading.Lock()
+       self._pending = [] # [[role, text], ...] with consecutive same-role deltas merged
+       self._after_id = None
+       self.tokens = 0
+       self.frames = 0
+       self.dropped_frames = 0
+       self._first_token_at = None
+       self._last_token_at = None
+       self._last_tick_at = None
+       self._last_stats_at = None
+
+   def start(self):
+       self._last_tick_at = self._last_stats_at = time.monotonic()
+       self._after_id = self.widget.after(self.interval_ms, self._tick)
+
+   def feed(self, role, text):
+       """Queues a delta; safe to call from the network thread."""
+       now = time.monotonic()
+       with self._lock:
+           if self._pending and self._pending[-1][0] == role:
+               self._pending[-1][1] += text
+           else:
+               self._pending.append([role, text])
+           self.tokens += 1 # One SSE delta is (roughly) one token
+           if self._first_token_at is None:
+               self._first_token_at = now
+           self._last_token_at = now
+
+   def flush(self):
+       """Writes all pending text to the widget (UI thread only)."""
+       with self._lock:
+           pending, self._pending = self._pending, []
+       if not pending:
+           return
+       self.view.append_stream(pending)
+       self.widget.see(tk.END)
+       self.frames += 1
+
+   def _tick(self):
+       now = time.monotonic()
+       # A tick that arrives more than one interval late means the Tk loop skipped frames
+       late_frames = int((now - self._last_tick_at) * 1000 / self.interval_ms) - 1
+       if late_frames > 0:
+           self.dropped_frames += late_frames
+       self._last_tick_at = now
+       self.flush()
+       if self.on_stats and (now - self._last_stats_at) * 1000 >= STREAM_STATS_INTERVAL_MS:
+           self._last_stats_at = now
+           self.on_stats(self.stats())
+       self._after_id = self.widget.after(self.interval_ms, self._tick)
+
+   def finish(self):
+       """Flushes the remaining text, stops the timer and returns the final stats."""
+       if self._after_id is not None:
+           self.widget.after_cancel(self._after_id)
+           self._after_id = None
+       self.flush()
+       return self.stats()
+
+   def stats(self):
+       with self._lock:
+           elapsed = (self._last_token_at - self._first_token_at) if self._first_token_at is not None else 0.0
+           tokens = self.tokens
+       return {"tokens": tokens, "tokens_per_sec": tokens / elapsed if elapsed > 0 else 0.0, "frames": self.frames, "dropped_frames": self.dropped_frames}
 
 # --- 文本聊天 Frame 类 ---
 class ChatFrame(ttk.Frame):
@@ -634,6 +1406,8 @@ class ChatFrame(ttk.Frame):
        self.conversation_history = [] # 存储对话历史 (不含 System Prompt)
        self.current_response_content = "" # 用于流式输出累积
        self.current_response_role = "assistant" # 用于流式输出角色
+       self.stream_renderer = None # Active StreamRenderer while a reply is streaming
+       self.session_id = None # Row id in the session store; created when the first turn is saved
 
        # --- Add variables for new parameters ---
        self.temperature_var = tk.DoubleVar(value=0.7)
@@ -643,7 +1417,8 @@ class ChatFrame(ttk.Frame):
        self.frequency_penalty_var = tk.DoubleVar(value=0.0)
        self.stop_var = tk.StringVar(value="")
        self.image_url_var = tk.StringVar(value="") # For vision models URL input
-       self.image_path_var = tk.StringVar(value="") # For local image path
+       self.image_paths = [] # Local images attached to the next message
+       self.vision_encoder = VisionImageEncoder() # Caches encoded images by (path, mtime, size, detail)
        self.image_detail_var = tk.StringVar(value="high") # Add variable for image detail
 
        self._create_widgets()
@@ -680,6 +1455,7 @@ class ChatFrame(ttk.Frame):
        image_input_frame = ttk.LabelFrame(top_control_frame, text="图像输入 (可选, Vision 模型)", padding="5")
        image_input_frame.pack(fill=tk.X, pady=5)
        ttk.Button(image_input_frame, text="浏览本地图片...", command=self._select_image_file).pack(side=tk.LEFT, padx=(0, 5))
+       ttk.Button(image_input_frame, text="清除", command=self._clear_images, width=5).pack(side=tk.LEFT)
        self.image_path_label = ttk.Label(image_input_frame, text="未选择本地图片", anchor=tk.W, relief=tk.GROOVE, width=40) # Use Label to display path
        self.image_path_label.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
        ttk.Label(image_input_frame, text="或输入 URL:").pack(side=tk.LEFT, padx=(10, 5))
@@ -743,6 +1519,7 @@ class ChatFrame(ttk.Frame):
        self.chat_display.tag_configure("assistant", foreground="green")
        self.chat_display.tag_configure("system", foreground="gray", font=("TkDefaultFont", 9, "italic"))
        self.chat_display.tag_configure("error", foreground="red")
+       self.transcript = TranscriptView(self.chat_display) # Keeps only the newest blocks in the widget
 
        # --- Input Area ---
        input_frame = ttk.Frame(paned_window, padding="5")
@@ -750,14 +1527,20 @@ class ChatFrame(ttk.Frame):
 
        self.input_entry = ttk.Entry(input_frame, width=70)
        self.input_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(0, 5))
-       self.input_entry.bind("<Return>", self._start_send_thread) # Bind Enter key
+       self.input_entry.bind("<Return>", self._start_send) # Bind Enter key
 
-       self.send_button = ttk.Button(input_frame, text="发送", command=self._start_send_thread)
+       self.send_button = ttk.Button(input_frame, text="发送", command=self._start_send)
        self.send_button.pack(side=tk.LEFT)
 
+       self.stop_button = ttk.Button(input_frame, text="停止", command=self._stop_stream, state=tk.DISABLED)
+       self.stop_button.pack(side=tk.LEFT, padx=(5, 0))
+
        self.clear_button = ttk.Button(input_frame, text="清空记录", command=self._clear_history)
        self.clear_button.pack(side=tk.LEFT, padx=(5, 0))
 
+       self.sessions_button = ttk.Button(input_frame, text="会话...", command=self._open_session_browser)
+       self.sessions_button.pack(side=tk.LEFT, padx=(5, 0))
+
    def update_model_list(self, new_models):
        self.available_models = new_models
        current_selection = self.model_var.get()
@@ -779,109 +1562,162 @@ class ChatFrame(ttk.Frame):
        self.send_button.config(state=state)
        self.input_entry.config(state=state)
        self.clear_button.config(state=state)
+       self.sessions_button.config(state=state)
+       self.stop_button.config(state=tk.DISABLED if enable else tk.NORMAL)
        # Also disable/enable parameter controls? Maybe not, allow changing params even while waiting
        # self.model_menu.config(state=tk.NORMAL if enable else tk.DISABLED)
        # self.system_prompt_input.config(state=state) # Keep system prompt editable
 
    def _display_message(self, role, content, tag=None):
        """Displays a complete message in the chat window."""
-       self.chat_display.config(state=tk.NORMAL)
-       if tag is None:
-           tag = role # Default tag is the role itself
-       prefix = ""
-       if role == "user":
-           prefix = "You: "
-       elif role == "assistant":
-           prefix = "AI: "
-       elif role == "system":
-           prefix = "System: "
-       elif role == "error":
-           prefix = "Error: "
-
-       self.chat_display.insert(tk.END, f"{prefix}{content}\n\n", tag)
-       self.chat_display.config(state=tk.DISABLED)
+       if self.stream_renderer:
+           self.stream_renderer.flush() # Keep ordering with text still buffered by the stream
+       self.transcript.append(role, content, tag) # Prefix ("You: ", "AI: ", ...) is added by the view
        self.chat_display.see(tk.END) # Scroll to the bottom
 
-   def _display_stream_start(self, role="assistant"):
-        """Displays the prefix for a streaming message."""
-        self.chat_display.config(state=tk.NORMAL)
-        prefix = "AI: " if role == "assistant" else "System: " # Assuming reasoning is system
-        self.chat_display.insert(tk.END, prefix, role) # Use role as tag
-        self.chat_display.config(state=tk.DISABLED)
-        self.chat_display.see(tk.END)
-
-   def _append_message_chunk(self, chunk_text, role="assistant"):
-        """Appends a chunk of text to the chat display during streaming."""
-        self.chat_display.config(state=tk.NORMAL)
-        self.chat_display.insert(tk.END, chunk_text, role) # Use role as tag
-        self.chat_display.config(state=tk.DISABLED)
-        self.chat_display.see(tk.END)
+   def _start_stream_render(self):
+        """Creates the renderer that coalesces streamed deltas into frame-rate-limited inserts."""
+        self.stream_renderer = StreamRenderer(self.transcript, # Reasoning streams into a collapsed block
+                                              on_stats=lambda stats: self._set_status(f"正在接收... {stats['tokens_per_sec']:.1f} tokens/s"))
+        self.stream_renderer.start()
+
+   def _end_stream_render(self, status_message=None):
+        """Flushes and stops the stream renderer, reporting its throughput stats."""
+        renderer, self.stream_renderer = self.stream_renderer, None
+        if renderer is None:
+            return
+        stats = renderer.finish()
+        print(f"--- DEBUG: Stream render stats: {stats} ---")
+        if status_message:
+            self._set_status(f"{status_message} ({stats['tokens']} tokens, {stats['tokens_per_sec']:.1f} tokens/s, 刷新 {stats['frames']} 次, 掉帧 {stats['dropped_frames']})")
 
    def _display_stream_end(self):
-        """Adds the final newline after a stream is complete."""
-        self.chat_display.config(state=tk.NORMAL)
-        self.chat_display.insert(tk.END, "\n\n")
-        self.chat_display.config(state=tk.DISABLED)
+        """Closes the streamed block after a stream is complete."""
+        if self.stream_renderer:
+            self.stream_renderer.flush()
+        self.transcript.end_stream()
         self.chat_display.see(tk.END)
 
 
    def _clear_history(self):
-       if messagebox.askyesno("确认", "确定要清空聊天记录和设定吗？", parent=self):
+       if messagebox.askyesno("确认", "确定要清空聊天记录和设定吗？\n(已保存的会话仍可通过“会话...”重新打开)", parent=self):
            self.conversation_history = []
-           self.chat_display.config(state=tk.NORMAL)
-           self.chat_display.delete('1.0', tk.END)
-           self.chat_display.config(state=tk.DISABLED)
+           self.session_id = None # The next message starts a new saved session
+           self.transcript.clear()
            self.system_prompt_input.delete('1.0', tk.END) # Clear system prompt
-           self.image_path_var.set("") # Clear image path
-           self.image_path_label.config(text="未选择本地图片")
+           self._clear_images() # Clear attached images
            self.image_url_var.set("") # Clear image url
            self._set_status("聊天记录和设定已清空")
 
+   def _open_session_browser(self):
+       if self.main_app.session_store is None:
+           messagebox.showerror("错误", "会话库不可用 (无法打开 SQLite 数据库)。", parent=self)
+           return
+       SessionBrowserDialog(self)
+
+   def open_session(self, session_id):
+       """Reopens a saved session: the newest blocks are shown, older ones load as the transcript scrolls up."""
+       store = self.main_app.session_store
+       session = store.get_session(session_id)
+       if session is None:
+           return
+       self.session_id = session_id
+       if session["model"] in self.available_models:
+           self.model_var.set(session["model"])
+       self.system_prompt_input.delete("1.0", tk.END)
+       self.system_prompt_input.insert("1.0", session["system_prompt"])
+       self.conversation_history = self._load_session_history(store, session_id)
+       recent = store.load_messages(session_id, limit=CHAT_TRANSCRIPT_MAX_BLOCKS)
+       oldest_id = [recent[0]["id"]] if recent else [None]
+       def load_older(count):
+           rows = store.load_messages(session_id, before_id=oldest_id[0], limit=count)
+           if rows:
+               oldest_id[0] = rows[0]["id"]
+           return [(row["role"], row["content"]) for row in rows]
+       self.transcript.clear(load_older if recent else None)
+       for row in recent:
+           self.transcript.append(row["role"], row["content"])
+       self.chat_display.see(tk.END)
+       self._set_status(f"已打开会话: {session['title'] or session_id} ({session['message_count']} 条消息)")
+
+   def _load_session_history(self, store, session_id):
+       """Loads user/assistant turns newest-first, stopping once they would fill the model's context window."""
+       window = context_window_for(self.model_var.get())
+       history, tokens, before_id = [], 0, None
+       while tokens < window:
+           rows = store.load_messages(session_id, before_id=before_id, limit=CHAT_TRANSCRIPT_PAGE_BLOCKS, roles=("user", "assistant"))
+           if not rows:
+               break
+           before_id = rows[0]["id"]
+           history[:0] = [{"role": row["role"], "content": row["content"]} for row in rows]
+           tokens += sum(estimate_tokens(row["content"]) for row in rows)
+       return history
+
+   def _save_turn(self, model, system_prompt, user_text, reasoning, assistant_text):
+       """Appends a finished turn to the session store (runs on the I/O pool)."""
+       store = self.main_app.session_store
+       if store is None:
+           return
+       try:
+           if self.session_id is None:
+               self.session_id = store.create_session(model, system_prompt)
+           store.append_messages(self.session_id, [("user", user_text), ("reasoning", reasoning), ("assistant", assistant_text)], model=model)
+       except sqlite3.Error as e:
+           print(f"--- DEBUG: Failed to save chat turn: {e} ---")
+
    def _select_image_file(self):
-        """Opens a file dialog to select a local image."""
+        """Opens a file dialog to attach one or more local images (added to any already attached)."""
         filetypes = [("Image files", "*.png *.jpg *.jpeg *.webp *.gif"), ("All files", "*.*")]
-        filepath = filedialog.askopenfilename(parent=self, title="选择本地图片文件", filetypes=filetypes)
-        if filepath:
-            self.image_path_var.set(filepath)
-            self.image_path_label.config(text=os.path.basename(filepath)) # Show filename in label
+        filepaths = filedialog.askopenfilenames(parent=self, title="选择本地图片文件", filetypes=filetypes)
+        if filepaths:
+            self.image_paths.extend(path for path in filepaths if path not in self.image_paths)
+            self._update_image_label()
             self.image_url_var.set("") # Clear URL if local file is chosen
-            self._set_status(f"已选择本地图片: {os.path.basename(filepath)}")
+            self._set_status(f"已选择 {len(self.image_paths)} 张本地图片")
         else:
-            # Keep existing path if dialog is cancelled
-            # self.image_path_var.set("")
-            # self.image_path_label.config(text="未选择本地图片")
+            # Keep already attached images if dialog is cancelled
             self._set_status("图片选择已取消")
 
-   def _image_to_base64(self, image_path):
-        """Converts an image file to a Base64 encoded WEBP string."""
+   def _clear_images(self):
+        self.image_paths = []
+        self._update_image_label()
+
+   def _update_image_label(self):
+        names = ", ".join(os.path.basename(path) for path in self.image_paths)
+        if not self.image_paths:
+            text = "未选择本地图片"
+        elif len(self.image_paths) == 1:
+            text = names
+        else:
+            text = f"{len(self.image_paths)} 张: {names}"
+        self.image_path_label.config(text=text)
+
+   def _stop_stream(self):
+        """Cancels the in-flight chat request; the partial reply is kept."""
+        self.main_app.engine.cancel_group("chat")
+        self._set_status("正在停止...")
+
+   def _image_to_base64(self, image_path, image_detail):
+        """Returns a WEBP data URI downscaled to the resolution the detail level uses (runs on the I/O pool, cached)."""
+        ui = self.main_app.run_in_ui
         try:
-            with Image.open(image_path) as img:
-                # Ensure image is in RGB mode for WEBP saving
-                if img.mode != 'RGB':
-                    img = img.convert('RGB')
-                byte_arr = io.BytesIO()
-                # Save as WEBP for potentially smaller size, adjust quality if needed
-                img.save(byte_arr, format='WEBP', quality=85)
-                byte_arr = byte_arr.getvalue()
-                base64_str = base64.b64encode(byte_arr).decode('utf-8')
-                # Return the data URI scheme
-                return f"data:image/webp;base64,{base64_str}"
+            return self.vision_encoder.encode(image_path, image_detail)
         except FileNotFoundError:
-            messagebox.showerror("错误", f"图片文件未找到: {image_path}", parent=self)
+            ui(messagebox.showerror, "错误", f"图片文件未找到: {image_path}", parent=self)
             return None
-        except UnidentifiedImageError:
-             messagebox.showerror("错误", f"无法识别的图片格式: {image_path}", parent=self)
+        except Image.UnidentifiedImageError:
+             ui(messagebox.showerror, "错误", f"无法识别的图片格式: {image_path}", parent=self)
              return None
         except Exception as e:
-            messagebox.showerror("图片转换错误", f"转换图片时出错: {e}", parent=self)
+            ui(messagebox.showerror, "图片转换错误", f"转换图片时出错: {e}", parent=self)
             return None
 
-   def _start_send_thread(self, event=None): # Accept event argument for Enter key binding
+   def _start_send(self, event=None): # Accept event argument for Enter key binding
        api_key = self.api_key.get()
        model = self.model_var.get()
        user_input = self.input_entry.get().strip()
        system_prompt = self.system_prompt_input.get("1.0", tk.END).strip() # Get system prompt
-       image_path = self.image_path_var.get() # Get local image path
+       image_paths = list(self.image_paths) # Snapshot of attached local images
 
        if not api_key:
            messagebox.showerror("错误", "请输入 API Key。", parent=self)
@@ -895,6 +1731,8 @@ class ChatFrame(ttk.Frame):
            messagebox.showwarning("警告", "请输入消息内容。", parent=self)
            return
 
+       payload, image_url_from_input, image_detail = self._build_base_payload(model)
+
        self._set_status("正在发送消息...")
        self._toggle_controls(False)
 
@@ -906,11 +1744,13 @@ class ChatFrame(ttk.Frame):
 
        self.input_entry.delete(0, tk.END) # Clear input field
 
-       # Pass system_prompt and image_path to the thread
-       thread = threading.Thread(target=self._send_chat_request, args=(api_key, model, system_prompt, image_path), daemon=True)
-       thread.start()
+       self._start_stream_render()
+       # Tk variables and the history are read here on the UI thread; the request itself runs on the network engine
+       history = list(self.conversation_history) # Snapshot: the coroutine never touches self.conversation_history directly
+       self.main_app.engine.submit(self._send_chat_request(api_key, model, system_prompt, image_paths, payload, image_url_from_input, image_detail, self.stream_renderer, history), group="chat")
 
-   def _send_chat_request(self, api_key, model, system_prompt, image_path):
+   def _build_base_payload(self, model):
+       """Reads the parameter widgets and returns (payload without messages, image URL, image detail)."""
        # --- Retrieve parameters ---
        temperature = self.temperature_var.get()
        top_p = self.top_p_var.get()
@@ -936,42 +1776,51 @@ class ChatFrame(ttk.Frame):
        if presence_penalty != 0.0: payload["presence_penalty"] = presence_penalty
        if frequency_penalty != 0.0: payload["frequency_penalty"] = frequency_penalty
        if stop_sequences: payload["stop"] = stop_sequences
+       return payload, image_url_from_input, image_detail
+
+   def _append_history(self, message):
+       self.conversation_history.append(message)
+
+   def _drop_unanswered_message(self):
+       """Removes the user message whose request failed (UI thread)."""
+       if self.conversation_history and self.conversation_history[-1]["role"] == "user":
+           self.conversation_history.pop()
+
+   async def _send_chat_request(self, api_key, model, system_prompt, image_paths, payload, image_url_from_input, image_detail, renderer, history):
+       ui = self.main_app.run_in_ui
+       engine = self.main_app.engine
 
        # --- Prepare Messages ---
-       final_messages_for_request = []
+       system_messages = []
        is_reasoning_model = any(r_kw in model.lower() for r_kw in ["r1", "z1", "qwq", "qwen3"])
 
        # 1. Add System Prompt (if provided and not a reasoning model)
        if system_prompt and not is_reasoning_model:
-           final_messages_for_request.append({"role": "system", "content": system_prompt})
+           system_messages.append({"role": "system", "content": system_prompt})
        elif is_reasoning_model and system_prompt: # Added condition to print only if system prompt was provided but skipped
             print("--- DEBUG: Reasoning model detected, skipping system message for request. ---")
 
-       # 2. Add conversation history (user/assistant turns)
-       # Make a deep copy to avoid modifying the original history when adding image data
-       history_copy = json.loads(json.dumps(self.conversation_history))
-       final_messages_for_request.extend(history_copy)
-
-
-       # 3. Modify the *last* user message to include image data if applicable
-       image_data_uri = None
-       if image_path: # Prioritize local file
-           image_data_uri = self._image_to_base64(image_path)
-           if image_data_uri is None: # Handle conversion error
-               self.after(0, self._set_status, "图片处理失败")
-               self.after(0, self._toggle_controls, True)
+       # 2. Build the *last* user message for the request (with image data if applicable)
+       last_user_message = None
+       user_text = history[-1]["content"] if history else "" # Saved with the reply
+       image_data_uris = []
+       if image_paths: # Prioritize local files; encode them in parallel on the I/O pool
+           image_data_uris = await asyncio.gather(*(engine.run_blocking(self._image_to_base64, path, image_detail) for path in image_paths))
+           if None in image_data_uris: # Handle conversion error
+               ui(self._set_status, "图片处理失败")
+               ui(self._end_stream_render)
+               ui(self._toggle_controls, True)
                # Clear the failed path? Maybe not, let user retry or clear manually.
-               # self.after(0, lambda: self.image_path_var.set(""))
-               # self.after(0, lambda: self.image_path_label.config(text="未选择本地图片"))
+               # ui(self._clear_images)
                # Remove the last user message from history as the request failed
-               if self.conversation_history and self.conversation_history[-1]["role"] == "user":
-                   self.conversation_history.pop()
+               ui(self._drop_unanswered_message)
                return # Stop request if image conversion failed
        elif image_url_from_input: # Use URL if no local file
-           image_data_uri = image_url_from_input
+           image_data_uris = [image_url_from_input]
 
-       if final_messages_for_request and final_messages_for_request[-1]["role"] == "user":
-           last_user_message = final_messages_for_request[-1]
+       if history and history[-1]["role"] == "user":
+           # A new dict, so the stored history keeps its plain-text content
+           last_user_message = dict(history[-1])
            # Ensure content is treated as text initially
            last_user_content_text = last_user_message["content"]
            if isinstance(last_user_content_text, list): # If somehow it's already complex, extract text
@@ -985,103 +1834,99 @@ class ChatFrame(ttk.Frame):
 
            is_vision_model = any(vl_kw in model.lower() for vl_kw in ["vl", "vision", "internvl"])
 
-           if image_data_uri and is_vision_model:
-               # Construct the complex content for the *request*
-               image_content_part = {"type": "image_url", "image_url": {"url": image_data_uri}}
-               if image_detail != "auto":
-                   image_content_part["image_url"]["detail"] = image_detail
+           if image_data_uris and is_vision_model:
+               # Construct the complex content for the *request*, one part per image
+               image_content_parts = []
+               for image_data_uri in image_data_uris:
+                   image_content_part = {"type": "image_url", "image_url": {"url": image_data_uri}}
+                   if image_detail != "auto":
+                       image_content_part["image_url"]["detail"] = image_detail
+                   image_content_parts.append(image_content_part)
 
-               new_content = [{"type": "text", "text": last_user_content_text}, image_content_part]
+               new_content = [{"type": "text", "text": last_user_content_text}, *image_content_parts]
 
                # Handle InternVL specific order recommendation
                if "internvl" in model.lower():
-                   new_content.reverse() # Put image first for InternVL
+                   new_content = [*image_content_parts, new_content[0]] # Put images first for InternVL
 
                last_user_message["content"] = new_content # Modify the message in the *request list*
            else:
                 # Ensure content is just the text if no image or not vision model
                 last_user_message["content"] = last_user_content_text
 
+       # 3. Add as many earlier turns as fit the model's context budget (referenced, not copied)
+       messages, prompt_stats = fit_messages(model, system_messages, history, last_user_message, payload.get("max_tokens"))
+       payload["messages"] = messages
+       if prompt_stats["max_tokens"]:
+           payload["max_tokens"] = prompt_stats["max_tokens"] # Shrunk when the prompt leaves less room than requested
+       ui(self._set_status, f"正在发送消息... ({format_prompt_stats(prompt_stats)})")
+       if prompt_stats["overflow"]:
+           ui(self._display_message, "error", "最新消息估算已超出该模型的上下文窗口，服务器可能会拒绝请求。")
 
-       payload["messages"] = final_messages_for_request
-
-       headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
        print("--- DEBUG: Sending Payload ---") # Debug print
-       print(json.dumps(payload, indent=2, ensure_ascii=False))
+       # Messages are summarized instead of dumped: long chats (and base64 images) made this print the slowest part of a send
+       print(json.dumps({k: v for k, v in payload.items() if k != "messages"}, indent=2, ensure_ascii=False))
+       print(f"--- DEBUG: {len(messages)} messages, {prompt_stats} ---")
        print("--- END DEBUG ---")
 
        # --- Stream Handling ---
+       # Request building, SSE parsing and the stream metrics are shared with the headless runner (SiliconFlowClient.chat);
+       # this frame only renders the deltas and keeps its own copy so a stopped stream can still be saved
        full_assistant_response = ""
        accumulated_reasoning = ""
        is_first_content_chunk = True
        is_first_reasoning_chunk = True
+       def on_delta(delta_content, delta_reasoning):
+           nonlocal full_assistant_response, accumulated_reasoning, is_first_content_chunk, is_first_reasoning_chunk
+           if delta_content:
+               is_first_content_chunk = False
+               # Buffered; the renderer adds the "AI: " prefix and flushes at frame rate
+               renderer.feed("assistant", delta_content)
+               full_assistant_response += delta_content # Accumulate full response
+           if delta_reasoning:
+               is_first_reasoning_chunk = False
+               # Buffered; shown as a collapsed reasoning block until the user expands it
+               renderer.feed("reasoning", delta_reasoning)
+               accumulated_reasoning += delta_reasoning # Accumulate reasoning
+       def on_invalid(line):
+           print(f"--- DEBUG: Failed to decode JSON chunk: {line!r} ---")
+           ui(self._display_message, "error", f"接收到无效的数据块: {line.decode('utf-8', 'replace') if isinstance(line, bytes) else line}")
        try:
-           response = requests.post(CHAT_API_URL, json=payload, headers=headers, timeout=120, stream=True)
-           response.raise_for_status() # Check for HTTP errors immediately
-
-           for chunk_bytes in response.iter_lines(): # Use iter_lines for SSE
-               if chunk_bytes:
-                   chunk_str = chunk_bytes.decode('utf-8')
-                   if chunk_str.startswith("data: "):
-                       chunk_data_str = chunk_str[len("data: "):]
-                       if chunk_data_str.strip() == "[DONE]":
-                           print("--- DEBUG: Stream finished [DONE] ---")
-                           break # End of stream
-                       try:
-                           chunk_json = json.loads(chunk_data_str)
-                           # print(f"--- DEBUG: Received Chunk --- \n{chunk_json}\n --- END CHUNK ---") # Less verbose debug
-
-                           delta = chunk_json.get('choices', [{}])[0].get('delta', {})
-                           delta_content = delta.get('content')
-                           delta_reasoning = delta.get('reasoning_content') # Check for reasoning content
-
-                           if delta_content:
-                               if is_first_content_chunk:
-                                   # Display "AI: " prefix
-                                   self.after(0, self._display_stream_start, "assistant")
-                                   is_first_content_chunk = False
-                               # Append content chunk
-                               self.after(0, self._append_message_chunk, delta_content, "assistant")
-                               full_assistant_response += delta_content # Accumulate full response
-
-                           if delta_reasoning:
-                               if is_first_reasoning_chunk:
-                                   # Display "System: " prefix for reasoning
-                                   self.after(0, self._display_stream_start, "system")
-                                   is_first_reasoning_chunk = False
-                               # Append reasoning chunk
-                               self.after(0, self._append_message_chunk, delta_reasoning, "system")
-                               accumulated_reasoning += delta_reasoning # Accumulate reasoning
-
-                       except json.JSONDecodeError:
-                           print(f"--- DEBUG: Failed to decode JSON chunk: {chunk_data_str} ---")
-                           self.after(0, self._display_message, "error", f"接收到无效的数据块: {chunk_data_str}")
-                       except Exception as chunk_e:
-                            print(f"--- DEBUG: Error processing chunk: {chunk_e} ---")
-                            # Check if the error is the specific after() error and handle it gracefully
-                            if "got an unexpected keyword argument 'is_start_of_stream'" in str(chunk_e):
-                                print("--- DEBUG: Ignoring known after() keyword argument error during stream processing. ---")
-                            else:
-                                self.after(0, self._display_message, "error", f"处理数据块时出错: {chunk_e}")
-
+           await self.main_app.api_client(api_key).chat(payload, on_delta=on_delta, on_invalid=on_invalid)
+           print("--- DEBUG: Stream finished ---")
 
            # After stream finishes
            if not is_first_content_chunk: # If we displayed assistant content
-               self.after(0, self._display_stream_end) # Add final newline for assistant response
+               ui(self._display_stream_end) # Add final newline for assistant response
                # Add the complete response to history
                if full_assistant_response:
                    # Store assistant message (simple text, reasoning is not part of history)
-                   self.conversation_history.append({"role": "assistant", "content": full_assistant_response})
-               self.after(0, self._set_status, "消息接收成功")
+                   ui(self._append_history, {"role": "assistant", "content": full_assistant_response})
+               ui(self._end_stream_render, "消息接收成功")
            elif not is_first_reasoning_chunk: # If we only displayed reasoning content
-               self.after(0, self._display_stream_end) # Add final newline for reasoning response
-               self.after(0, self._set_status, "推理内容接收成功")
+               ui(self._display_stream_end) # Add final newline for reasoning response
+               ui(self._end_stream_render, "推理内容接收成功")
            elif not full_assistant_response and not accumulated_reasoning: # No content and no reasoning received
-                self.after(0, self._display_message, "error", "API 未返回任何内容。")
-                self.after(0, self._set_status, "接收失败：空响应")
-
-           # Note: Reasoning content is displayed during the stream, not added to history
-
+                ui(self._display_message, "error", "API 未返回任何内容。")
+                ui(self._set_status, "接收失败：空响应")
+
+           # Note: Reasoning content is displayed during the stream, not added to history (but it is saved with the session)
+           if full_assistant_response or accumulated_reasoning:
+               await engine.run_blocking(self._save_turn, model, system_prompt, user_text, accumulated_reasoning, full_assistant_response)
+
+
+       except asyncio.CancelledError:
+           # Stopped by the user (or app shutdown): keep whatever was streamed so far
+           if not is_first_content_chunk or not is_first_reasoning_chunk:
+               ui(self._display_stream_end)
+           if full_assistant_response:
+               ui(self._append_history, {"role": "assistant", "content": full_assistant_response})
+               # Shielded so the write still finishes on the I/O pool; the loop stays free and the cancellation is re-raised below
+               await asyncio.shield(engine.run_blocking(self._save_turn, model, system_prompt, user_text, accumulated_reasoning, full_assistant_response))
+           else:
+               ui(self._drop_unanswered_message)
+           ui(self._set_status, "已停止接收")
+           raise
 
        except requests.exceptions.RequestException as e:
            error_message = f"API 请求失败: {e}"
@@ -1093,31 +1938,101 @@ class ChatFrame(ttk.Frame):
                except Exception:
                     error_message += f"\n无法读取服务器响应。"
            # Display error in chat window and status bar
-           self.after(0, self._display_message, "error", f"API 错误: {error_message}")
-           self.after(0, self._set_status, "发送/接收失败")
+           ui(self._display_message, "error", f"API 错误: {error_message}")
+           ui(self._set_status, "发送/接收失败")
            # Remove the last user message from history as the request failed
-           if self.conversation_history and self.conversation_history[-1]["role"] == "user":
-               self.conversation_history.pop()
+           ui(self._drop_unanswered_message)
 
        except Exception as e:
            error_msg = f"处理流式响应时发生意外错误: {e}"
            print(f"--- DEBUG: Stream processing error: {e} ---")
-           self.after(0, self._display_message, "error", error_msg)
-           self.after(0, self._set_status, "发送/接收失败")
+           ui(self._display_message, "error", error_msg)
+           ui(self._set_status, "发送/接收失败")
            # Remove the last user message from history as the request failed
-           if self.conversation_history and self.conversation_history[-1]["role"] == "user":
-               self.conversation_history.pop()
+           ui(self._drop_unanswered_message)
 
        finally:
-           self.after(0, self._toggle_controls, True)
-           # Clear image path *after* the request attempt
-           self.after(0, lambda: self.image_path_var.set(""))
-           self.after(0, lambda: self.image_path_label.config(text="未选择本地图片"))
+           ui(self._end_stream_render)
+           ui(self._toggle_controls, True)
+           # Clear attached images *after* the request attempt
+           ui(self._clear_images)
            # Keep URL for potential resend/modification
-           # self.after(0, lambda: self.image_url_var.set(""))
+           # ui(lambda: self.image_url_var.set(""))
+
 
+class SessionBrowserDialog(tk.Toplevel):
+    def __init__(self, chat_frame):
+        super().__init__(chat_frame)
+        self.title("聊天会话"); self.geometry("720x420"); self.chat_frame = chat_frame; self.store = chat_frame.main_app.session_store
+        self.query_var = tk.StringVar(value=""); self.info_var = tk.StringVar(value=""); self._row_sessions = {} # 行 iid -> 会话 id
+        self._create_widgets(); self._show_sessions()
+    def _create_widgets(self):
+        main_frame = ttk.Frame(self, padding="10"); main_frame.pack(fill=tk.BOTH, expand=True)
+        search_frame = ttk.Frame(main_frame); search_frame.pack(fill=tk.X, pady=(0, 5))
+        ttk.Label(search_frame, text="搜索消息:").pack(side=tk.LEFT)
+        search_entry = ttk.Entry(search_frame, textvariable=self.query_var); search_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5); search_entry.bind("<Return>", lambda e: self._search())
+        ttk.Button(search_frame, text="搜索", command=self._search).pack(side=tk.LEFT)
+        ttk.Button(search_frame, text="全部会话", command=self._show_sessions).pack(side=tk.LEFT, padx=(5, 0))
+        tree_frame = ttk.Frame(main_frame); tree_frame.pack(fill=tk.BOTH, expand=True)
+        self.tree = ttk.Treeview(tree_frame, columns=("title", "detail", "updated"), show="headings", selectmode="extended")
+        for column, heading, width in (("title", "标题", 220), ("detail", "模型 / 匹配内容", 330), ("updated", "更新时间", 130)):
+            self.tree.heading(column, text=heading); self.tree.column(column, width=width, anchor=tk.W)
+        scrollbar = ttk.Scrollbar(tree_frame, orient=tk.VERTICAL, command=self.tree.yview); self.tree.configure(yscrollcommand=scrollbar.set)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True); scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree.bind("<Double-1>", lambda e: self._open_selected())
+        ttk.Label(main_frame, textvariable=self.info_var).pack(anchor=tk.W, pady=(5, 0))
+        action_frame = ttk.Frame(main_frame); action_frame.pack(fill=tk.X, pady=(5, 0))
+        ttk.Button(action_frame, text="打开", command=self._open_selected).pack(side=tk.LEFT, padx=5)
+        ttk.Button(action_frame, text="删除", command=self._delete_selected).pack(side=tk.LEFT, padx=5)
+        ttk.Button(action_frame, text="导入 JSONL...", command=self._import_jsonl).pack(side=tk.RIGHT, padx=5)
+        ttk.Button(action_frame, text="导出 JSONL...", command=self._export_jsonl).pack(side=tk.RIGHT, padx=5)
+    def _fill(self, rows):
+        self.tree.delete(*self.tree.get_children()); self._row_sessions = {}
+        for iid, session_id, values in rows: self._row_sessions[iid] = session_id; self.tree.insert("", tk.END, iid=iid, values=values)
+    def _show_sessions(self):
+        sessions = self.store.list_sessions()
+        self._fill((str(s["id"]), s["id"], (s["title"] or "(无标题)", f"{s['model']} · {s['message_count']} 条消息", time.strftime("%Y-%m-%d %H:%M", time.localtime(s["updated_at"])))) for s in sessions)
+        self.info_var.set(f"最近的 {len(sessions)} 个会话 (双击打开)")
+    def _search(self):
+        query = self.query_var.get().strip()
+        if not query: self._show_sessions(); return
+        started = time.perf_counter(); hits = self.store.search(query); elapsed_ms = (time.perf_counter() - started) * 1000
+        self._fill((f"{h['session_id']}:{h['message_id']}", h["session_id"], (h["title"] or "(无标题)", f"[{h['role']}] {' '.join(h['snippet'].split())}", "")) for h in hits)
+        self.info_var.set(f"“{query}”: {len(hits)} 条匹配，用时 {elapsed_ms:.1f} ms{'' if self.store.has_fts else ' (SQLite 不支持 FTS5，已使用逐行匹配)'}")
+    def _selected_sessions(self):
+        return list(dict.fromkeys(self._row_sessions[iid] for iid in self.tree.selection())) # 去重并保持顺序
+    def _open_selected(self):
+        sessions = self._selected_sessions()
+        if not sessions: return
+        self.chat_frame.open_session(sessions[0]); self.destroy()
+    def _delete_selected(self):
+        sessions = self._selected_sessions()
+        if not sessions or not messagebox.askyesno("确认", f"确定要删除选中的 {len(sessions)} 个会话吗？此操作无法撤销。", parent=self): return
+        for session_id in sessions:
+            self.store.delete_session(session_id)
+            if self.chat_frame.session_id == session_id: self.chat_frame.session_id = None # 当前对话继续时另存为新会话
+        self._search() if self.query_var.get().strip() else self._show_sessions()
+    def _import_jsonl(self):
+        file_path = filedialog.askopenfilename(parent=self, title="导入 OpenAI 格式 JSONL", filetypes=[("JSONL 文件", "*.jsonl"), ("所有文件", "*.*")])
+        if not file_path: return
+        try: count = self.store.import_jsonl(file_path)
+        except (OSError, UnicodeDecodeError, sqlite3.Error) as e: messagebox.showerror("导入失败", f"读取文件时出错: {e}", parent=self); return
+        self._show_sessions(); self.info_var.set(f"已从 {os.path.basename(file_path)} 导入 {count} 个会话")
+    def _export_jsonl(self):
+        sessions = self._selected_sessions() or None
+        file_path = filedialog.asksaveasfilename(parent=self, title=f"导出{'选中的' if sessions else '全部'}会话", defaultextension=".jsonl", filetypes=[("JSONL 文件", "*.jsonl")])
+        if not file_path: return
+        try: count = self.store.export_jsonl(file_path, sessions)
+        except (OSError, sqlite3.Error) as e: messagebox.showerror("导出失败", f"写入文件时出错: {e}", parent=self); return
+        self.info_var.set(f"已导出 {count} 个会话到 {file_path}")
 
 # --- 启动应用 ---
 if __name__ == "__main__":
-    app = SiliconFlowSuiteApp()
+    if "--batch" in sys.argv[1:]: # 无界面批处理: python siliconflow_suite_gui.py --batch jobs.jsonl [-o 输出目录] [-c 并发数]
+        from siliconflow_batch import main as batch_main
+        sys.exit(batch_main([arg for arg in sys.argv[1:] if arg != "--batch"]))
+    startup_timer = None
+    if "--startup-time" in sys.argv[1:]: # 启动耗时测量: 打印到首个窗口显示的耗时后退出
+        startup_timer = StartupTimer(); startup_timer.mark("导入模块")
+    app = SiliconFlowSuiteApp(startup_timer=startup_timer)
     app.mainloop()
\ No newline at end of file
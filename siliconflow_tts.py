@@ -0,0 +1,364 @@
+import asyncio
+import os
+import re
+import shutil
+import struct
+import subprocess
+import threading
+import time
+
+from siliconflow_cache import payload_digest
+
+DEFAULT_STREAM_CHUNK_SIZE = 4096 # 每次从流式响应读取的字节数 (越小首音频越早，系统调用越多)
+PCM_SAMPLE_RATE = 44100 # pcm 格式的默认采样率 (与 /audio/speech 的默认值一致)
+DEFAULT_CHUNK_MAX_CHARS = 200 # 长文本分段时每段的最大字符数
+STITCHABLE_FORMATS = ("mp3", "wav", "pcm") # 分段合成后能拼接成单个文件的格式
+LONG_TEXT_FALLBACK_FORMAT = "wav" # 选择了不能拼接的格式 (opus) 时，长文本改用该格式合成
+
+# 决定合成结果的参数 (缓存键)
+TTS_CACHE_FIELDS = ("model", "input", "voice", "speed", "gain", "response_format", "sample_rate")
+
+# 能从标准输入边收边播的播放器，按优先级排列
+STREAM_PLAYER_COMMANDS = [
+    ("ffplay", ["-nodisp", "-autoexit", "-loglevel", "quiet"]),
+    ("mpv", ["--no-video", "--really-quiet"]),
+]
+
+
+def tts_cache_key(payload):
+    """按完整的合成参数计算缓存键 (与是否流式无关)"""
+    return payload_digest(payload, TTS_CACHE_FIELDS)
+
+
+def find_stream_player(audio_format):
+    """返回可以从 stdin 播放该格式音频的命令行，找不到时返回 None"""
+    for name, args in STREAM_PLAYER_COMMANDS:
+        path = shutil.which(name)
+        if not path:
+            continue
+        if audio_format == "pcm": # 裸 PCM 没有文件头，需要显式告诉播放器采样格式
+            if name == "ffplay":
+                return [path, *args, "-f", "s16le", "-ar", str(PCM_SAMPLE_RATE), "-ac", "1", "-i", "-"]
+            return [path, *args, "--demuxer=rawaudio", f"--demuxer-rawaudio-rate={PCM_SAMPLE_RATE}", "--demuxer-rawaudio-channels=1", "-"]
+        return [path, *args, "-i", "-"] if name == "ffplay" else [path, *args, "-"]
+    return None
+
+
+class PipePlaybackSink:
+    """把音频字节写入外部播放器的标准输入，实现边下载边播放"""
+    def __init__(self, command):
+        creationflags = subprocess.CREATE_NO_WINDOW if os.name == "nt" else 0
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, creationflags=creationflags)
+        self.alive = True
+
+    def write(self, chunk):
+        """返回是否成功交给了播放器 (用户关掉播放器后不再写入，但下载继续)"""
+        if not self.alive:
+            return False
+        try:
+            self.process.stdin.write(chunk)
+            self.process.stdin.flush()
+            return True
+        except (BrokenPipeError, OSError, ValueError):
+            self.alive = False
+            return False
+
+    def close(self):
+        """数据写完：关闭 stdin 让播放器播完剩余缓冲后自行退出"""
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+
+    def stop(self):
+        self.close()
+        if self.process.poll() is None:
+            self.process.terminate()
+
+
+class SpeechStreamRecorder:
+    """逐块消费 /audio/speech 的流式响应：写入磁盘文件和可选的播放器，并记录首字节 / 首音频时间"""
+    def __init__(self, file_path, player=None):
+        self.file_path = file_path
+        self.player = player
+        self.started_at = time.monotonic()
+        self.time_to_first_byte = None
+        self.time_to_first_audio = None
+        self.finished_at = None
+        self.bytes_received = 0
+        self._file = open(file_path, "wb")
+        self._lock = threading.Lock()
+        self.stopped = threading.Event() # 用户停止时设置：pump 不再读取和写出，之后才能安全地 close()
+
+    def pump(self, chunks):
+        """读取并写出下一块数据 (阻塞，在 I/O 线程池中调用)；流结束或已停止时返回 False"""
+        if self.stopped.is_set():
+            return False
+        chunk = next(chunks, None)
+        if chunk is None:
+            return False
+        if not chunk:
+            return True # keep-alive 空块
+        now = time.monotonic()
+        with self._lock:
+            if self.stopped.is_set():
+                return False # 读取期间被停止：丢弃这一块
+            if self.time_to_first_byte is None:
+                self.time_to_first_byte = now - self.started_at
+            self._file.write(chunk)
+            self._file.flush()
+            self.bytes_received += len(chunk)
+        if self.player and self.player.write(chunk) and self.time_to_first_audio is None:
+            self.time_to_first_audio = time.monotonic() - self.started_at
+        return True
+
+    def close(self, stop_player=False):
+        with self._lock:
+            if self.finished_at is None:
+                self.finished_at = time.monotonic()
+            if not self._file.closed:
+                self._file.close()
+        if self.player:
+            self.player.stop() if stop_player else self.player.close()
+
+    def read_audio(self):
+        with open(self.file_path, "rb") as f:
+            return f.read()
+
+    def stats(self):
+        end = self.finished_at or time.monotonic()
+        return {"bytes": self.bytes_received, "elapsed": end - self.started_at,
+                "time_to_first_byte": self.time_to_first_byte, "time_to_first_audio": self.time_to_first_audio}
+
+
+def format_stream_stats(stats):
+    """生成状态栏使用的简短计时说明"""
+    parts = []
+    if stats["time_to_first_byte"] is not None:
+        parts.append(f"首字节 {stats['time_to_first_byte']:.2f}s")
+    if stats["time_to_first_audio"] is not None:
+        parts.append(f"首音频 {stats['time_to_first_audio']:.2f}s")
+    parts.append(f"总耗时 {stats['elapsed']:.2f}s")
+    parts.append(f"{stats['bytes']} bytes")
+    return "，".join(parts)
+
+
+# --- 长文本分段合成 ---
+_PARAGRAPH_SPLIT = re.compile(r"\n\s*\n+")
+# 中日韩句末标点直接断句；英文句点等需后接空白才断，避免拆开 "3.14"
+_SENTENCE_END = re.compile(r"(?<=[。！？；…!?;])|(?<=[.!?])(?=\s)")
+_CLAUSE_END = re.compile(r"(?<=[，、：,:])|(?<=\s)")
+# 句点后接空白但不是句末的常见英文缩写 (小写比较)；单个字母加句点 (姓名首字母) 同样不断句
+_ABBREVIATIONS = frozenset(("e.g.", "i.e.", "etc.", "vs.", "cf.", "approx.", "no.", "fig.", "mr.", "mrs.", "ms.", "dr.", "prof.", "st.", "jr.", "sr."))
+
+
+def _ends_with_abbreviation(sentence):
+    words = sentence.rsplit(None, 1)
+    if not words:
+        return False
+    word = words[-1].lower()
+    return word in _ABBREVIATIONS or (len(word) == 2 and word[0].isalpha() and word[1] == ".")
+
+
+def _split_sentences(paragraph):
+    """按句末标点断句，断在英文缩写 ("e.g."、"Dr.") 之后的再接回去"""
+    sentences = []
+    for piece in _SENTENCE_END.split(paragraph):
+        if sentences and _ends_with_abbreviation(sentences[-1]):
+            sentences[-1] += piece
+        else:
+            sentences.append(piece)
+    return [s for s in sentences if s.strip()]
+
+
+def _split_oversized(sentence, max_chars):
+    """单句超长时先按逗号 / 空白切分，仍然超长再按固定宽度硬切"""
+    pieces, current = [], ""
+    for clause in (c for c in _CLAUSE_END.split(sentence) if c):
+        if len(current) + len(clause) > max_chars and current:
+            pieces.append(current); current = ""
+        while len(clause) > max_chars:
+            pieces.append(clause[:max_chars]); clause = clause[max_chars:]
+        current += clause
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_text_for_tts(text, max_chars=DEFAULT_CHUNK_MAX_CHARS):
+    """按段落和句子边界 (兼顾中英文标点) 把长文本切成不超过 max_chars 的段，尽量让每段接近上限"""
+    chunks = []
+    for paragraph in _PARAGRAPH_SPLIT.split(text.strip()):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        current = ""
+        for sentence in _split_sentences(paragraph):
+            for piece in ([sentence] if len(sentence) <= max_chars else _split_oversized(sentence, max_chars)):
+                if current and len(current) + len(piece) > max_chars:
+                    chunks.append(current.strip()); current = ""
+                current += piece
+        if current.strip():
+            chunks.append(current.strip()) # 段落之间总是断开，保留自然停顿
+    return chunks
+
+
+def _wav_parts(data):
+    """返回 (fmt 块内容, 采样数据)；不是 RIFF/WAVE 时抛出 ValueError"""
+    if len(data) < 12 or data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        raise ValueError("不是有效的 WAV 数据")
+    pos, fmt = 12, None
+    while pos + 8 <= len(data):
+        chunk_id, size = data[pos:pos + 4], struct.unpack("<I", data[pos + 4:pos + 8])[0]
+        body_start = pos + 8
+        if chunk_id == b"fmt ":
+            fmt = data[body_start:body_start + size]
+        elif chunk_id == b"data":
+            # 流式生成的 WAV 常把长度写成 0 或 0xFFFFFFFF，此时取到文件末尾
+            end = len(data) if size in (0, 0xFFFFFFFF) else min(len(data), body_start + size)
+            if fmt is None:
+                raise ValueError("WAV 数据缺少 fmt 块")
+            return fmt, data[body_start:end]
+        pos = body_start + size + (size & 1)
+    raise ValueError("WAV 数据缺少 data 块")
+
+
+def _concat_wav(parts):
+    """无损拼接：取出每段的采样数据，重新写一个 RIFF 头"""
+    fmt, samples = None, []
+    for data in parts:
+        part_fmt, part_samples = _wav_parts(data)
+        if fmt is not None and part_fmt[:16] != fmt[:16]:
+            raise ValueError("各段 WAV 的采样格式不一致，无法拼接")
+        fmt = fmt or part_fmt
+        samples.append(part_samples)
+    body = b"".join(samples)
+    fmt_chunk = b"fmt " + struct.pack("<I", len(fmt)) + fmt + (b"\0" if len(fmt) & 1 else b"")
+    data_chunk = b"data" + struct.pack("<I", len(body)) + body
+    return b"RIFF" + struct.pack("<I", 4 + len(fmt_chunk) + len(data_chunk)) + b"WAVE" + fmt_chunk + data_chunk
+
+
+_MP3_BITRATES = {
+    (1, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (2, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+_MP3_SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+
+def _mp3_frame_length(header):
+    """解析 4 字节 MPEG Layer III 帧头，返回帧长度；不是合法帧头时返回 None"""
+    if len(header) < 4 or header[0] != 0xFF or (header[1] & 0xE0) != 0xE0 or ((header[1] >> 1) & 0x3) != 1:
+        return None
+    version_bits = (header[1] >> 3) & 0x3
+    bitrate_index, rate_index, padding = header[2] >> 4, (header[2] >> 2) & 0x3, (header[2] >> 1) & 0x1
+    if version_bits == 1 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    mpeg1 = version_bits == 3
+    bitrate = _MP3_BITRATES[(1 if mpeg1 else 2, 3)][bitrate_index] * 1000
+    sample_rate = _MP3_SAMPLE_RATES[version_bits][rate_index]
+    return (144 if mpeg1 else 72) * bitrate // sample_rate + padding
+
+
+def _mp3_frames(data):
+    """去掉 ID3v2 / ID3v1 标签，并跳过首个 Xing/Info/VBRI 信息帧 (它记录的是单段时长)，返回纯音频帧"""
+    start, end = 0, len(data)
+    if data[:3] == b"ID3" and len(data) >= 10:
+        size = (data[6] & 0x7F) << 21 | (data[7] & 0x7F) << 14 | (data[8] & 0x7F) << 7 | (data[9] & 0x7F)
+        start = 10 + size + (10 if data[5] & 0x10 else 0)
+    if end - start >= 128 and data[end - 128:end - 125] == b"TAG":
+        end -= 128
+    while start < end and _mp3_frame_length(data[start:start + 4]) is None:
+        start += 1 # 同步到第一帧
+    frame_length = _mp3_frame_length(data[start:start + 4])
+    if frame_length and any(tag in data[start:start + min(frame_length, 64)] for tag in (b"Xing", b"Info", b"VBRI")):
+        start += frame_length
+    return data[start:end]
+
+
+def stitch_audio(parts, audio_format):
+    """按顺序把各段音频合并为一个文件：wav / pcm 无损拼接采样，mp3 按帧拼接。
+
+    opus 每段都是独立的 Ogg 流 (各自的序列号、预跳过和时间戳)，直接相接得到的文件多数播放器只播第一段，
+    重新封装需要 Ogg 复用器，因此不支持拼接，长文本应改用 STITCHABLE_FORMATS 中的格式合成。
+    """
+    if audio_format not in STITCHABLE_FORMATS:
+        raise ValueError(f"{audio_format} 格式的分段音频无法拼接，请改用 {' / '.join(STITCHABLE_FORMATS)}")
+    if not parts:
+        return b""
+    if audio_format == "wav":
+        return _concat_wav(parts)
+    if audio_format == "mp3":
+        return b"".join(_mp3_frames(p) for p in parts)
+    return b"".join(parts) # pcm 没有文件头
+
+
+class LongTextSynthesizer:
+    """把长文本分段后在网络引擎上有界并发合成，按原顺序拼接；失败的段可在之后单独重试。
+    瞬时故障由 HTTP 客户端的重试策略处理，这里不再逐段重试 (否则两层重试相乘)"""
+    def __init__(self, http_client, api_url, api_key, base_payload, text, max_chars=DEFAULT_CHUNK_MAX_CHARS,
+                 max_workers=4, on_progress=None, cache=None):
+        self.http_client = http_client
+        self.api_url = api_url
+        self.api_key = api_key
+        self.base_payload = dict(base_payload, stream=False)
+        self.text = text
+        self.chunks = split_text_for_tts(text, max_chars)
+        self.max_workers = max(1, int(max_workers))
+        self.on_progress = on_progress
+        self.cache = cache # 可选的 TieredBlobCache，按段缓存 (改动长文本中的一句只需重新合成这一段)
+        self.results = [None] * len(self.chunks) # 每段合成好的音频字节，None 表示尚未成功
+        self.errors = {}
+
+    def matches(self, api_key, base_payload, text):
+        """参数和文本都没变时，可以复用已经合成好的段继续 (只重试失败段)"""
+        return api_key == self.api_key and dict(base_payload, stream=False) == self.base_payload and text == self.text
+
+    @property
+    def failed_indexes(self):
+        return [i for i, audio in enumerate(self.results) if audio is None]
+
+    @property
+    def done_count(self):
+        return len(self.chunks) - len(self.failed_indexes)
+
+    async def run(self, engine):
+        """合成所有尚未成功的段，返回失败段的序号列表"""
+        pending = self.failed_indexes
+        self.errors = {}
+        semaphore = asyncio.Semaphore(self.max_workers)
+        async def bounded(index):
+            async with semaphore:
+                await self._synthesize(engine, index)
+        await asyncio.gather(*(bounded(index) for index in pending))
+        return self.failed_indexes
+
+    async def _synthesize(self, engine, index):
+        payload = dict(self.base_payload, input=self.chunks[index])
+        cache_key = tts_cache_key(payload) if self.cache else None
+        cached = await engine.run_blocking(self.cache.get, cache_key) if cache_key else None
+        if cached:
+            self.results[index] = cached[0]
+            if self.on_progress:
+                self.on_progress(self.done_count, len(self.chunks), len(self.errors))
+            return
+        headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+        try:
+            response = await self.http_client.apost(engine, self.api_url, "tts", json=payload, headers=headers)
+            response.raise_for_status()
+            if not response.content:
+                raise ValueError("API 返回了空的音频数据")
+            self.results[index] = response.content
+            self.errors.pop(index, None)
+            if cache_key:
+                await engine.run_blocking(self.cache.put, cache_key, response.content, {"model": payload.get("model"), "voice": payload.get("voice")})
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.errors[index] = str(e)
+        if self.on_progress:
+            self.on_progress(self.done_count, len(self.chunks), len(self.errors))
+
+    def stitched_audio(self):
+        if self.failed_indexes:
+            raise ValueError(f"还有 {len(self.failed_indexes)} 段未合成成功")
+        return stitch_audio(self.results, self.base_payload.get("response_format", "mp3"))
@@ -0,0 +1,31 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+from siliconflow_asr import LongAudioTranscriber
+from siliconflow_engine import NetworkEngine
+from siliconflow_http import SiliconFlowHTTPClient
+from siliconflow_mock_server import MockSettings, MockSiliconFlowServer, wav_bytes
+
+
+@pytest.fixture
+def mock_api():
+    server = MockSiliconFlowServer(port=0, settings=MockSettings(latency=0.0)).start()
+    engine, http_client = NetworkEngine(), SiliconFlowHTTPClient()
+    yield server, engine, http_client
+    engine.stop()
+    http_client.close()
+    server.stop()
+
+
+def test_long_audio_reports_client_retries_per_segment(mock_api, tmp_path):
+    server, engine, http_client = mock_api
+    path = tmp_path / "long.wav"
+    path.write_bytes(wav_bytes(3))
+    server.settings.inject(500, 200)
+    retries, progress = [], []
+    job = LongAudioTranscriber(http_client, f"{server.api_base}/audio/transcriptions", "key", "m", "zh", str(path),
+                               on_progress=lambda *args: progress.append(args), on_retry=lambda index, attempt: retries.append((index, attempt)))
+    assert engine.run(job.run(engine), timeout=30) == []
+    assert retries == [(0, 1)] # 500 由 HTTP 客户端重发，按段上报
+    assert progress[-1] == (1, 1, 0) and job.texts[0]
@@ -0,0 +1,37 @@
+import hashlib
+import json
+
+from siliconflow_asr_batch import find_audio_files, hash_file, load_completed_hashes
+
+
+def test_hash_file_matches_sha256(tmp_path):
+    data = bytes(range(256)) * 5000
+    path = tmp_path / "a.wav"
+    path.write_bytes(data)
+    assert hash_file(str(path), chunk_size=4096) == hashlib.sha256(data).hexdigest()
+    empty = tmp_path / "empty.wav"
+    empty.write_bytes(b"")
+    assert hash_file(str(empty)) == hashlib.sha256(b"").hexdigest()
+
+
+def test_find_audio_files_sorted_and_filtered(tmp_path):
+    (tmp_path / "sub").mkdir()
+    for name in ("b.MP3", "a.wav", "notes.txt", "sub/c.flac"):
+        (tmp_path / name).write_bytes(b"x")
+    names = [p[len(str(tmp_path)) + 1:].replace("\\", "/") for p in find_audio_files(str(tmp_path))]
+    assert names == ["a.wav", "b.MP3", "sub/c.flac"]
+    assert len(find_audio_files(str(tmp_path), recursive=False)) == 2
+
+
+def test_load_completed_hashes_from_jsonl(tmp_path):
+    output = tmp_path / "transcripts.jsonl"
+    rows = [{"sha256": "aa", "status": "ok"}, {"sha256": "bb", "status": "error"}]
+    output.write_text("\n".join(json.dumps(r) for r in rows) + '\n{"sha256": "cc", "sta', encoding="utf-8") # 末尾是中断留下的半行
+    assert load_completed_hashes(str(output)) == {"aa"}
+    assert load_completed_hashes(str(tmp_path / "missing.jsonl")) == set()
+
+
+def test_load_completed_hashes_from_csv(tmp_path):
+    output = tmp_path / "transcripts.csv"
+    output.write_text("file,sha256,status\na.wav,aa,ok\nb.wav,bb,error\n", encoding="utf-8-sig") # Excel 打开时需要 BOM
+    assert load_completed_hashes(str(output)) == {"aa"}
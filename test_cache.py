@@ -0,0 +1,82 @@
+import os
+
+from siliconflow_cache import DiskBlobCache, MemoryLRUCache, TieredBlobCache, copy_file, payload_digest
+
+
+def test_payload_digest_normalizes_values():
+    a = payload_digest({"model": "m", "input": " hi ", "speed": 1.0, "gain": None})
+    b = payload_digest({"input": "hi", "speed": 1, "model": "m"})
+    assert a == b
+    assert payload_digest({"model": "m", "input": "hi", "voice": "v"}, fields=("model", "input")) == payload_digest({"model": "m", "input": "hi"})
+    assert payload_digest({"model": "m", "speed": 1.25}) != payload_digest({"model": "m", "speed": 1.5})
+
+
+def test_memory_cache_evicts_by_bytes():
+    cache = MemoryLRUCache(10)
+    cache.put("a", b"1234", {})
+    cache.put("b", b"1234", {})
+    cache.get("a") # a 成为最近使用
+    cache.put("c", b"1234", {})
+    assert cache.get("b") is None and cache.get("a") is not None and cache.total_bytes == 8
+    cache.put("big", b"x" * 11, {}) # 超过上限的条目不进内存层
+    assert cache.get("big") is None
+
+
+def test_disk_cache_round_trip_and_reload(tmp_path):
+    cache = DiskBlobCache(str(tmp_path), max_bytes=1 << 20)
+    assert cache.get("k1") is None
+    cache.put("k1", b"audio", {"model": "m"})
+    data, meta = cache.get("k1")
+    assert data == b"audio" and meta["model"] == "m" and meta["size"] == 5
+    path, _ = cache.get_path("k1")
+    assert open(path, "rb").read() == b"audio"
+    assert DiskBlobCache(str(tmp_path), max_bytes=1 << 20).get("k1")[0] == b"audio" # 重启后从目录重建索引
+    assert cache.stats.snapshot() == {"hits": 2, "misses": 1, "bytes_saved": 10}
+
+
+def test_disk_cache_evicts_least_recently_used(tmp_path):
+    cache = DiskBlobCache(str(tmp_path), max_bytes=600)
+    for key in ("k1", "k2", "k3"):
+        cache.put(key, b"x" * 150, {})
+    cache.get("k1")
+    cache.put("k4", b"x" * 150, {})
+    assert cache.get("k2") is None
+    assert all(cache.get(key) is not None for key in ("k1", "k3", "k4"))
+    assert cache.total_bytes <= 600
+
+
+def test_disk_cache_put_file_copies_source(tmp_path):
+    src = tmp_path / "image.png"
+    src.write_bytes(b"png-data")
+    cache = DiskBlobCache(str(tmp_path / "cache"), max_bytes=1 << 20)
+    cache.put_file("img", str(src), {"url": "u"})
+    path, meta = cache.get_path("img")
+    assert open(path, "rb").read() == b"png-data" and meta["url"] == "u"
+    src.write_bytes(b"edited") # 原地修改源文件
+    os.remove(src) # 缓存条目不依赖源文件
+    assert cache.get("img")[0] == b"png-data"
+
+
+def test_disk_cache_entries_are_immutable_after_export(tmp_path):
+    cache = DiskBlobCache(str(tmp_path / "cache"), max_bytes=1 << 20)
+    cache.put("img", b"png-data", {})
+    exported = tmp_path / "saved.png"
+    copy_file(cache.get_path("img")[0], str(exported))
+    os.utime(exported, (1, 1))
+    cache.get_path("img") # 命中时更新的是缓存自己的访问时间
+    assert os.path.getmtime(exported) == 1
+    with open(exported, "r+b") as f:
+        f.write(b"EDIT") # 用户原地编辑导出的文件
+    assert cache.get("img")[0] == b"png-data"
+    assert os.path.getsize(cache.get_path("img")[0]) == cache.get_path("img")[1]["size"]
+
+
+def test_tiered_cache_promotes_disk_hits(tmp_path):
+    cache = TieredBlobCache(str(tmp_path), memory_max_bytes=1 << 20, disk_max_bytes=1 << 20)
+    cache.put("k", b"audio", {"voice": "v"})
+    restarted = TieredBlobCache(str(tmp_path), memory_max_bytes=1 << 20, disk_max_bytes=1 << 20)
+    assert restarted.memory.get("k") is None
+    assert restarted.get("k") == (b"audio", restarted.disk.get("k")[1])
+    assert restarted.memory.get("k") is not None
+    assert restarted.get("missing") is None
+    assert restarted.stats.snapshot()["hits"] == 1 and restarted.stats.snapshot()["misses"] == 1
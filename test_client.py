@@ -0,0 +1,31 @@
+import pytest
+
+from siliconflow_client import SSE_DONE, SiliconFlowClient, parse_chat_line
+from siliconflow_engine import NetworkEngine
+from siliconflow_http import SiliconFlowHTTPClient
+from siliconflow_mock_server import MockSettings, MockSiliconFlowServer
+
+
+def test_parse_chat_line():
+    assert parse_chat_line(b'data: {"choices": [{"delta": {"content": "hi"}}]}') == ("hi", None)
+    assert parse_chat_line("data: [DONE]") is SSE_DONE
+    assert parse_chat_line(": keep-alive") is None
+
+
+def test_chat_streams_deltas_and_records_metrics():
+    server = MockSiliconFlowServer(port=0, settings=MockSettings(latency=0.0, token_rate=1000)).start()
+    engine, http_client = NetworkEngine(), SiliconFlowHTTPClient()
+    try:
+        client = SiliconFlowClient(engine, http_client, "key", server.api_base)
+        deltas = []
+        payload = {"model": "deepseek-ai/DeepSeek-R1", "messages": [{"role": "user", "content": "hi"}], "max_tokens": 8}
+        result = engine.run(client.chat(payload, on_delta=lambda content, reasoning: deltas.append((content, reasoning))), timeout=30)
+    finally:
+        engine.stop()
+        http_client.close()
+        server.stop()
+    assert result["deltas"] == len(deltas) and result["ttft_s"] is not None
+    assert result["content"] == "".join(content for content, _ in deltas if content)
+    assert result["reasoning"] == "".join(reasoning for _, reasoning in deltas if reasoning)
+    row = http_client.metrics.summary()[0]
+    assert row["endpoint"] == "chat" and row["ttft_p50"] == pytest.approx(result["ttft_s"], abs=0.01)
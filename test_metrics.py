@@ -0,0 +1,62 @@
+import csv
+
+import pytest
+
+from siliconflow_metrics import Histogram, MetricsRegistry, format_bytes, format_seconds
+
+
+def test_histogram_quantile_interpolates_within_bucket():
+    histogram = Histogram((1, 2, 5))
+    for value in (0.5, 1.5, 1.5, 4):
+        histogram.observe(value)
+    assert histogram.quantile(0.5) == pytest.approx(1.5)
+    assert histogram.quantile(1.0) == 4 # 插值得到 5，限制在观测到的最大值
+    assert histogram.cumulative() == [("1.0", 1), ("2.0", 3), ("5.0", 4), ("+Inf", 4)]
+
+
+def test_histogram_quantile_edge_cases():
+    assert Histogram((1,)).quantile(0.5) is None
+    single = Histogram((1,))
+    single.observe(0.3)
+    assert single.quantile(0.5) == 0.3 and single.quantile(0.99) == 0.3
+    overflow = Histogram((1, 2, 5))
+    overflow.observe(10)
+    assert overflow.quantile(0.5) == 10 # +Inf 桶：不低于观测值
+
+
+def test_registry_summary_and_errors():
+    metrics = MetricsRegistry()
+    for _ in range(3):
+        metrics.record_request("tts", "m", 200, 0.0, 0.1, 0.2, 100, 1000)
+    metrics.record_request("tts", "m", None, None, None, 1.0, 100, 0)
+    metrics.record_request("chat", "c", 500, 0.01, 0.05, 0.05, 10, 20)
+    metrics.record_stream("chat", "c", 0.3, 21, 2.0)
+    tts, chat = metrics.summary()
+    assert (tts["endpoint"], tts["requests"], tts["errors"], tts["bytes_in"]) == ("tts", 4, 1, 3000)
+    assert tts["ttfb_p50"] == pytest.approx(0.1)
+    assert chat["errors"] == 1 and chat["ttft_p50"] == pytest.approx(0.3) and chat["tokens_per_s_p50"] == pytest.approx(10.5)
+    metrics.reset()
+    assert metrics.summary() == []
+
+
+def test_prometheus_text_and_csv_export(tmp_path):
+    metrics = MetricsRegistry()
+    metrics.record_request("image", 'a"b', 200, 0.02, 0.5, 0.6, 50, 500)
+    text = metrics.prometheus_text()
+    assert 'siliconflow_requests_total{endpoint="image",model="a\\"b",status="200"} 1' in text
+    assert 'siliconflow_total_seconds_bucket{endpoint="image",model="a\\"b",le="+Inf"} 1' in text
+    assert "# TYPE siliconflow_ttfb_seconds histogram" in text
+    assert "ttft_seconds" not in text # 没有样本的直方图不输出
+    path = tmp_path / "metrics.csv"
+    assert metrics.export_csv(str(path)) == 1
+    with open(path, encoding="utf-8", newline="") as f:
+        row = next(csv.DictReader(f))
+    assert row["endpoint"] == "image" and row["status"] == "200" and row["bytes_in"] == "500"
+    prom = tmp_path / "metrics.prom"
+    metrics.export_prometheus(str(prom))
+    assert prom.read_text(encoding="utf-8") == text
+
+
+def test_formatters():
+    assert format_seconds(None) == "-" and format_seconds(0.0123) == "12 ms" and format_seconds(2.5) == "2.50 s"
+    assert format_bytes(512) == "512 B" and format_bytes(2048) == "2.0 KB" and format_bytes(3 * 1024 * 1024) == "3.0 MB"
@@ -0,0 +1,49 @@
+import os
+
+from siliconflow_models import (
+    ModelCatalogCache, ModelClassifier, _classify_naive, _synthetic_model_ids, classify_models, diff_model_lists, server_filters_applied,
+)
+
+
+def test_classifier_matches_naive_rules():
+    model_ids = _synthetic_model_ids(5000, seed=7)
+    assert ModelClassifier().classify(model_ids) == _classify_naive(model_ids)
+
+
+def test_classifier_known_models():
+    classifier = ModelClassifier()
+    assert classifier.classify_id("black-forest-labs/FLUX.1-schnell") == "image"
+    assert classifier.classify_id("FunAudioLLM/SenseVoiceSmall") == "asr" # 含 "audio"，但 ASR 规则在前
+    assert classifier.classify_id("FunAudioLLM/CosyVoice2-0.5B") == "tts"
+    assert classifier.classify_id("Qwen/Qwen2.5-VL-72B-Instruct") == "chat"
+    assert classifier.classify_id("BAAI/bge-m3") is None
+    assert classifier.classify_id("acme/unknown") is None
+
+
+def test_classify_models_reads_api_response():
+    response = {"data": [{"id": "Qwen/QwQ-32B"}, {"id": "Qwen/QwQ-32B"}, {"id": "Kwai-Kolors/Kolors"}, {"object": "model"}]}
+    catalog = classify_models(response)
+    assert catalog["chat"] == ["Qwen/QwQ-32B"] and catalog["image"] == ["Kwai-Kolors/Kolors"]
+    assert classify_models({"error": "bad key"}) == {"image": [], "tts": [], "asr": [], "chat": []}
+
+
+def test_server_filters_applied():
+    assert server_filters_applied({"image": ["a"], "chat": ["b"], "tts": []})
+    assert not server_filters_applied({"image": ["a", "b"], "chat": ["b", "a"]}) # 参数被忽略：各类别相同
+
+
+def test_diff_model_lists_keeps_order():
+    assert diff_model_lists(["a", "b", "c"], ["c", "d", "a", "e"]) == (["d", "e"], ["b"])
+
+
+def test_catalog_cache_round_trip(tmp_path):
+    cache = ModelCatalogCache(str(tmp_path), ttl=60)
+    assert cache.load("key") is None
+    entry = cache.save("key", {"chat": ["m"]}, "server", {"chat": {"etag": '"v1"'}})
+    loaded = cache.load("key")
+    assert loaded["catalog"] == {"image": [], "tts": [], "asr": [], "chat": ["m"]}
+    assert not cache.is_stale(loaded)
+    assert cache.validator_for(loaded, "chat", "server") == {"etag": '"v1"'}
+    assert cache.validator_for(loaded, "chat", "local") is None
+    assert cache.conditional_headers(cache.validator_for(entry, "chat", "server")) == {"If-None-Match": '"v1"'}
+    assert "key" not in os.path.basename(cache.path_for("key")) # 不在文件名中保存 Key
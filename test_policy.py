@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+import requests
+
+from siliconflow_policy import RETRYABLE_STATUS, LatencyTracker, RequestPolicy, backoff_delay, hedged_call
+from siliconflow_ratelimit import CONGESTION_STATUS
+
+
+def test_backoff_delay_is_capped():
+    for attempt in range(10):
+        assert 0 <= backoff_delay(attempt, base=0.5, cap=2.0) <= 2.0
+
+
+def test_congestion_status_is_left_to_the_governor():
+    assert not set(RETRYABLE_STATUS) & set(CONGESTION_STATUS)
+
+
+def test_idempotent_endpoints_retry_server_errors():
+    policy = RequestPolicy(retries=2)
+    assert policy.should_retry("POST", "tts", 0, status_code=502)
+    assert policy.should_retry("GET", "models", 1, error=requests.exceptions.ReadTimeout())
+    assert not policy.should_retry("POST", "tts", 2, status_code=502) # 次数用完
+    assert not policy.should_retry("POST", "tts", 0, status_code=400)
+    assert policy.snapshot()["retried"] == 2
+
+
+def test_billed_endpoints_only_retry_when_not_sent():
+    policy = RequestPolicy()
+    assert not policy.should_retry("POST", "image", 0, status_code=500)
+    assert not policy.should_retry("POST", "chat", 0, error=requests.exceptions.ReadTimeout())
+    assert policy.should_retry("POST", "chat", 0, error=requests.exceptions.ConnectTimeout())
+
+
+def test_read_timeout_follows_observed_latency():
+    policy = RequestPolicy(tracker=LatencyTracker(min_samples=5))
+    assert policy.read_timeout("image", "m", 120) == 120 # 样本不足时用配置值
+    for _ in range(5):
+        policy.latency.record("image", "m", 8.0)
+    assert policy.read_timeout("image", "m", 120) == 24.0
+    assert policy.read_timeout("image", "m", 120, attempt=1) == 120
+    assert policy.read_timeout("image", "other", 120) == 120
+
+
+def test_hedged_call_uses_the_first_result():
+    calls, hedges = [], []
+    async def make_call():
+        calls.append(len(calls))
+        await asyncio.sleep(0.2 if len(calls) == 1 else 0.01)
+        return len(calls)
+    result = asyncio.run(hedged_call(make_call, 0.02, on_hedge=hedges.append))
+    assert result == 2
+    assert hedges == [True]
+
+
+def test_hedged_call_raises_when_both_fail():
+    async def make_call():
+        raise ValueError("boom")
+    with pytest.raises(ValueError):
+        asyncio.run(hedged_call(make_call, 0.01))
@@ -0,0 +1,116 @@
+import asyncio
+
+import pytest
+
+from siliconflow_ratelimit import DEFAULT_BACKOFF, RateLimiterClosed, RequestGovernor, parse_retry_after
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after("-1") == 0.0
+    assert parse_retry_after("") is None
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after("Thu, 01 Jan 1970 00:00:10 GMT", now=4.0) == pytest.approx(6.0)
+
+
+def test_concurrency_limit_blocks_until_release():
+    clock = FakeClock()
+    governor = RequestGovernor({"image": (6000, 2)}, clock=clock)
+    first, _ = governor.acquire("image", "m"), governor.acquire("image", "m")
+    lane = governor._lanes[first]
+    assert lane.wait_time(clock()) is None # 并发已满：等其他请求完成
+    governor.release(first, 200, 0.1)
+    clock.now += 1 # 两个令牌都已用掉
+    assert lane.wait_time(clock()) == 0.0
+
+
+def test_models_have_independent_lanes():
+    governor = RequestGovernor({"image": (6000, 1)}, clock=FakeClock())
+    assert governor.acquire("image", "a") == ("image", "a")
+    assert governor.acquire("image", "b") == ("image", "b")
+
+
+def test_throttle_halves_limit_and_pauses_lane():
+    clock = FakeClock()
+    governor = RequestGovernor({"chat": (6000, 8)}, clock=clock)
+    key = governor.acquire("chat", "m")
+    governor.release(key, 429, retry_after="5")
+    lane = governor._lanes[key]
+    assert lane.limit == 4.0
+    assert lane.wait_time(clock()) == pytest.approx(5.0)
+    clock.now += 5
+    assert lane.wait_time(clock()) == 0.0
+
+
+def test_throttle_without_retry_after_backs_off_exponentially():
+    clock = FakeClock()
+    governor = RequestGovernor({"chat": (6000, 8)}, clock=clock)
+    key = governor.acquire("chat")
+    governor.release(key, 503)
+    lane = governor._lanes[key]
+    assert lane.paused_until - clock() == pytest.approx(DEFAULT_BACKOFF)
+    clock.now = lane.paused_until + 1
+    governor.release(governor.acquire("chat"), 503)
+    assert lane.paused_until - clock() == pytest.approx(2 * DEFAULT_BACKOFF)
+
+
+def test_success_grows_limit_back_to_maximum():
+    clock = FakeClock()
+    governor = RequestGovernor({"tts": (6000, 4)}, clock=clock)
+    key = governor.acquire("tts")
+    governor.release(key, 429, retry_after="0")
+    for _ in range(20):
+        clock.now += 1 # 令牌桶随时间补充
+        governor.release(governor.acquire("tts"), 200, 0.1)
+    assert governor._lanes[key].limit == 4.0
+
+
+def test_acquire_async_respects_concurrency_limit():
+    governor = RequestGovernor({"image": (6000, 2)})
+    active = peak = 0
+    async def one():
+        nonlocal active, peak
+        key = await governor.acquire_async("image", "m")
+        active += 1; peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        governor.release(key, 200, 0.01)
+    async def main():
+        await asyncio.gather(*(one() for _ in range(8)))
+    asyncio.run(main())
+    assert peak == 2
+    assert governor.snapshot()[0]["requests"] == 8
+
+
+def test_cancelled_async_waiter_does_not_take_a_slot():
+    governor = RequestGovernor({"asr": (6000, 1)})
+    async def main():
+        held = await governor.acquire_async("asr")
+        waiting = asyncio.ensure_future(governor.acquire_async("asr"))
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        governor.release(held, 200, 0.01)
+        return await asyncio.wait_for(governor.acquire_async("asr"), 1)
+    assert asyncio.run(main()) == ("asr", "")
+
+
+def test_close_wakes_async_waiters():
+    governor = RequestGovernor({"asr": (6000, 1)})
+    async def main():
+        await governor.acquire_async("asr")
+        waiting = asyncio.ensure_future(governor.acquire_async("asr"))
+        await asyncio.sleep(0.01)
+        governor.close()
+        with pytest.raises(RateLimiterClosed):
+            await asyncio.wait_for(waiting, 1)
+    asyncio.run(main())
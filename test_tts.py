@@ -0,0 +1,65 @@
+import struct
+
+import pytest
+
+from siliconflow_tts import _mp3_frames, split_text_for_tts, stitch_audio
+
+
+def make_wav(samples, sample_rate=16000):
+    fmt = struct.pack("<HHIIHH", 1, 1, sample_rate, sample_rate * 2, 2, 16)
+    body = b"fmt " + struct.pack("<I", len(fmt)) + fmt + b"data" + struct.pack("<I", len(samples)) + samples
+    return b"RIFF" + struct.pack("<I", 4 + len(body)) + b"WAVE" + body
+
+
+MP3_HEADER = bytes((0xFF, 0xFB, 0x90, 0x00)) # MPEG1 Layer III, 128 kbps, 44.1 kHz -> 417 字节一帧
+
+
+def make_mp3(frames, id3=True):
+    frame = MP3_HEADER + bytes(417 - 4)
+    data = frame * frames
+    return (b"ID3\x03\x00\x00\x00\x00\x00\x05" + b"TITLE" if id3 else b"") + data
+
+
+def test_split_respects_max_chars_and_paragraphs():
+    text = "第一句话。第二句话！第三句话？\n\n" + "很长的一句话，" * 40
+    chunks = split_text_for_tts(text, max_chars=50)
+    assert chunks[0] == "第一句话。第二句话！第三句话？"
+    assert all(len(chunk) <= 50 for chunk in chunks)
+    assert "".join(chunks) == text.replace("\n\n", "")
+
+
+def test_split_keeps_decimals_and_abbreviations():
+    text = "Pi is about 3.14 today. Use a sample, e.g. the demo file. Ask Dr. Smith or J. Doe. Done!"
+    assert split_text_for_tts(text, max_chars=40) == [
+        "Pi is about 3.14 today.", "Use a sample, e.g. the demo file.", "Ask Dr. Smith or J. Doe. Done!",
+    ]
+
+
+def test_split_hard_cuts_text_without_breaks():
+    chunks = split_text_for_tts("字" * 250, max_chars=100)
+    assert [len(chunk) for chunk in chunks] == [100, 100, 50]
+
+
+def test_stitch_wav_rewrites_header():
+    stitched = stitch_audio([make_wav(b"\x01\x00" * 10), make_wav(b"\x02\x00" * 5)], "wav")
+    assert stitched[:4] == b"RIFF" and struct.unpack("<I", stitched[4:8])[0] == len(stitched) - 8
+    data_at = stitched.index(b"data")
+    assert struct.unpack("<I", stitched[data_at + 4:data_at + 8])[0] == 30
+    assert stitched.endswith(b"\x01\x00" * 10 + b"\x02\x00" * 5)
+
+
+def test_stitch_wav_rejects_mismatched_formats():
+    with pytest.raises(ValueError):
+        stitch_audio([make_wav(b"\0\0", 16000), make_wav(b"\0\0", 22050)], "wav")
+
+
+def test_stitch_mp3_drops_tags_between_parts():
+    assert _mp3_frames(make_mp3(2)) == make_mp3(2, id3=False)
+    stitched = stitch_audio([make_mp3(2), make_mp3(3)], "mp3")
+    assert stitched == make_mp3(5, id3=False)
+
+
+def test_stitch_pcm_and_unsupported_formats():
+    assert stitch_audio([b"ab", b"cd"], "pcm") == b"abcd"
+    with pytest.raises(ValueError):
+        stitch_audio([b"OggS", b"OggS"], "opus")